@@ -0,0 +1,11 @@
+# Entry point of the packaged executable, also runnable as `python -m backend`.
+# Absolute imports: PyInstaller runs this file as a top-level script.
+from backend import startup
+
+import uvicorn
+
+from backend.main import app
+
+if __name__ == "__main__":
+    # The app object rather than "backend.main:app", so nothing is imported twice
+    uvicorn.run(app, host=startup.HOST, port=startup.PORT)
@@ -0,0 +1,195 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, insert as sql_insert
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+from .models import DailySales, HomeopathicMedicine, Transaction, OPENING_BALANCE
+from . import archive, summary
+
+# Sales analytics on top of the DailySales rollup.
+# Every committed ledger row is folded into its (day, medicine, action_type)
+# bucket, so reports read a few rows per medicine per day instead of
+# scanning the Transaction table. rebuild_rollups() regenerates the table
+# from the ledger and its archives if it is ever missing or suspect.
+
+BUCKETS = ("day", "week", "month")
+
+
+def record_transaction(session: Session, transaction: Transaction):
+    """Fold one ledger row into its daily bucket (caller commits)."""
+    statement = insert(DailySales).values(
+        day=transaction.timestamp.date(),
+        medicine_id=transaction.medicine_id,
+        action_type=transaction.action_type,
+        units=transaction.change_amount,
+        txn_count=1,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["day", "medicine_id", "action_type"],
+        set_={
+            "units": DailySales.units + statement.excluded.units,
+            "txn_count": DailySales.txn_count + 1,
+        },
+    )
+    session.execute(statement)
+
+
+def record_transactions(session: Session, rows: list):
+    """Fold many ledger rows (column dicts) into their buckets with one executemany (caller commits)."""
+    buckets = {}
+    for row in rows:
+        key = (row["timestamp"].date(), row["medicine_id"], row["action_type"])
+        units, count = buckets.get(key, (0, 0))
+        buckets[key] = (units + row["change_amount"], count + 1)
+    _add_buckets(session, [
+        {"day": day, "medicine_id": medicine_id, "action_type": action_type, "units": units, "txn_count": count}
+        for (day, medicine_id, action_type), (units, count) in buckets.items()
+    ])
+
+
+def _add_buckets(session: Session, buckets: list):
+    if not buckets:
+        return
+    table = DailySales.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["day", "medicine_id", "action_type"],
+        set_={
+            "units": table.c.units + statement.excluded.units,
+            "txn_count": table.c.txn_count + statement.excluded.txn_count,
+        },
+    )
+    session.execute(statement, buckets)
+
+
+def rebuild_rollups(session: Session, archive_dir: Optional[str] = None) -> int:
+    """Regenerate DailySales from the full ledger, archives included. Returns the number of buckets."""
+    session.execute(delete(DailySales))
+    day = func.date(Transaction.timestamp)
+    session.execute(
+        sql_insert(DailySales).from_select(
+            ["day", "medicine_id", "action_type", "units", "txn_count"],
+            select(day, Transaction.medicine_id, Transaction.action_type,
+                   func.sum(Transaction.change_amount), func.count())
+            .where(Transaction.action_type != OPENING_BALANCE)
+            .group_by(day, Transaction.medicine_id, Transaction.action_type),
+        )
+    )
+    _add_buckets(session, archive.rollup_buckets(archive_dir, session))
+    summary.bump_version(session)  # cached reports are stale
+    return session.exec(select(func.count()).select_from(DailySales)).one()
+
+
+def ensure_rollups(session: Session) -> bool:
+    """Build the rollup for databases that have a ledger but no rollup yet."""
+    has_rollup = session.exec(select(DailySales.day).limit(1)).first() is not None
+    has_ledger = session.exec(select(Transaction.id).limit(1)).first() is not None
+    if has_ledger and not has_rollup:
+        rebuild_rollups(session)
+        return True
+    return False
+
+
+def _window(days: int):
+    # Ledger timestamps are UTC
+    end = datetime.utcnow().date()
+    return end - timedelta(days=days - 1), end
+
+
+def _period(bucket: str):
+    if bucket == "week":
+        # Monday of the week
+        return func.date(DailySales.day, "-6 days", "weekday 1")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", DailySales.day)
+    return DailySales.day
+
+
+def sales_series(session: Session, bucket: str = "day", since: Optional[date] = None,
+                 until: Optional[date] = None, medicine_id: Optional[int] = None,
+                 action_type: str = "SELL") -> list:
+    """Units per medicine per day/week/month."""
+    period = _period(bucket).label("period")
+    statement = select(
+        period, DailySales.medicine_id,
+        func.abs(func.sum(DailySales.units)), func.sum(DailySales.txn_count),
+    ).where(DailySales.action_type == action_type)
+    if since:
+        statement = statement.where(DailySales.day >= since)
+    if until:
+        statement = statement.where(DailySales.day <= until)
+    if medicine_id is not None:
+        statement = statement.where(DailySales.medicine_id == medicine_id)
+    statement = statement.group_by(period, DailySales.medicine_id).order_by(period, DailySales.medicine_id)
+    return [
+        {"period": str(p), "medicine_id": m, "units": units, "transactions": count}
+        for p, m, units, count in session.exec(statement).all()
+    ]
+
+
+def _units_sold(days: int):
+    """Subquery: medicine_id -> units sold in the last ``days`` days."""
+    start, end = _window(days)
+    return (
+        select(DailySales.medicine_id, (-func.sum(DailySales.units)).label("sold"))
+        .where(DailySales.action_type == "SELL", DailySales.day >= start, DailySales.day <= end)
+        .group_by(DailySales.medicine_id)
+        .subquery()
+    )
+
+
+def _row(medicine_id, name, potency, batch, quantity, sold, days):
+    sold = sold or 0
+    per_day = sold / days
+    return {
+        "medicine_id": medicine_id,
+        "medicine_name": name,
+        "potency": potency,
+        "batch_number": batch,
+        "quantity": quantity,
+        "units_sold": sold,
+        "per_day": round(per_day, 3),
+        # Days until stockout at the current rate; None when nothing sells
+        "days_of_cover": round(quantity / per_day, 1) if per_day > 0 else None,
+    }
+
+
+def _with_medicine(sold, outer: bool = False):
+    M = HomeopathicMedicine
+    statement = select(M.id, M.medicine_name, M.potency, M.batch_number, M.quantity, sold.c.sold)
+    if outer:
+        return statement.select_from(M).join(sold, sold.c.medicine_id == M.id, isouter=True)
+    return statement.select_from(sold).join(M, M.id == sold.c.medicine_id)
+
+
+def velocity(session: Session, days: int = 30, medicine_id: Optional[int] = None) -> list:
+    sold = _units_sold(days)
+    statement = _with_medicine(sold)
+    if medicine_id is not None:
+        statement = statement.where(HomeopathicMedicine.id == medicine_id)
+    statement = statement.order_by(sold.c.sold.desc())
+    return [_row(*r, days) for r in session.exec(statement).all()]
+
+
+def movers(session: Session, days: int = 30, limit: int = 10, direction: str = "fast") -> list:
+    sold = _units_sold(days)
+    if direction == "slow":
+        # In-stock items that sold least (including not at all)
+        statement = (
+            _with_medicine(sold, outer=True)
+            .where(HomeopathicMedicine.quantity > 0)
+            .order_by(func.coalesce(sold.c.sold, 0).asc(), HomeopathicMedicine.quantity.desc())
+        )
+    else:
+        statement = _with_medicine(sold).order_by(sold.c.sold.desc())
+    return [_row(*r, days) for r in session.exec(statement.limit(limit)).all()]
+
+
+def stock_cover(session: Session, days: int = 30, limit: int = 50) -> list:
+    """Selling items ordered by how soon they run out."""
+    sold = _units_sold(days)
+    cover = HomeopathicMedicine.quantity * days * 1.0 / sold.c.sold
+    statement = _with_medicine(sold).where(sold.c.sold > 0).order_by(cover.asc()).limit(limit)
+    return [_row(*r, days) for r in session.exec(statement).all()]
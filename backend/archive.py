@@ -0,0 +1,306 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, bindparam, create_engine,
+                        delete, func, insert, select, type_coerce, update)
+from sqlmodel import Session
+
+from .models import HomeopathicMedicine, Transaction, OPENING_BALANCE, sqlite_file_name
+from .pagination import decode_cursor, after_cursor, order_by
+from . import summary
+
+# Ledger archival.
+# Transactions older than a cutoff move out of the hot database into one
+# SQLite file per year under ARCHIVE_DIR. Each medicine keeps a single
+# OPENING row carrying the sum of what was moved, so its quantity still
+# equals the sum of its ledger. Archived rows keep their ids and carry the
+# medicine's name and batch, so /api/history pages into them seamlessly.
+# The DailySales rollup is never archived: analytics already cover every
+# period, and rebuild_rollups() folds the archives back in.
+# A row can be in both places for a while, after restoring a backup taken
+# before it was archived: the hot copy wins, and the next archive run just
+# folds it again (the archive insert ignores ids it already has).
+
+ARCHIVE_DIR = os.environ.get("HOMEOVAULT_ARCHIVE_DIR", os.path.join(os.path.dirname(sqlite_file_name), "archive"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("HOMEOVAULT_ARCHIVE_AFTER_DAYS", "365")) # 0 = never archive
+ARCHIVE_BATCH_SIZE = 5000
+VACUUM_FREE_RATIO = 0.25 # reclaim space once a quarter of the file is free pages
+
+ARCHIVE_PREFIX = "ledger_"
+
+archive_metadata = MetaData()
+archived_transactions = Table(
+    "archived_transaction", archive_metadata,
+    Column("id", Integer, primary_key=True), # the id it had in the hot ledger
+    Column("medicine_id", Integer, nullable=False),
+    Column("medicine_name", String),
+    Column("potency", String),
+    Column("batch_number", String),
+    Column("change_amount", Integer, nullable=False),
+    Column("action_type", String, nullable=False),
+    Column("timestamp", DateTime, nullable=False),
+    Column("note", String),
+    Index("ix_archived_timestamp", "timestamp", "id"),
+    Index("ix_archived_medicine_timestamp", "medicine_id", "timestamp"),
+)
+A = archived_transactions
+hot_table = Table("hot_transaction_id", MetaData(), Column("id", Integer, primary_key=True), prefixes=["TEMPORARY"])
+
+# Same labels and order as serialize.HISTORY_FIELDS
+HISTORY_COLUMNS = [
+    A.c.id.label("id"),
+    A.c.medicine_id.label("medicine_id"),
+    A.c.medicine_name.label("medicine_name"),
+    A.c.batch_number.label("batch_number"),
+    A.c.change_amount.label("change"),
+    A.c.action_type.label("action_type"),
+    type_coerce(A.c.timestamp, String).label("timestamp"),
+    A.c.note.label("note"),
+]
+
+_engines = {}
+_engines_lock = threading.Lock()
+_newest = {} # path -> (mtime, newest archived timestamp)
+
+
+def _engine(path: str):
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+            archive_metadata.create_all(engine)
+            _engines[path] = engine
+        return engine
+
+
+def close_files(archive_dir: Optional[str] = None):
+    """Dispose the engines of ``archive_dir``'s files, before they are replaced."""
+    archive_dir = os.path.abspath(archive_dir or ARCHIVE_DIR)
+    with _engines_lock:
+        for path in [p for p in _engines if os.path.dirname(os.path.abspath(p)) == archive_dir]:
+            _engines.pop(path).dispose()
+            _newest.pop(path, None)
+
+
+def archive_files(archive_dir: Optional[str] = None) -> List[tuple]:
+    """(year, path) of every archive file, newest year first."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(archive_dir):
+        return []
+    files = []
+    for name in os.listdir(archive_dir):
+        year = name[len(ARCHIVE_PREFIX):-len(".db")]
+        if name.startswith(ARCHIVE_PREFIX) and name.endswith(".db") and year.isdigit():
+            files.append((int(year), os.path.join(archive_dir, name)))
+    return sorted(files, reverse=True)
+
+
+def _newest_timestamp(path: str) -> Optional[str]:
+    mtime = os.path.getmtime(path)
+    cached = _newest.get(path)
+    if cached is None or cached[0] != mtime:
+        with _engine(path).connect() as conn:
+            newest = conn.execute(select(func.max(type_coerce(A.c.timestamp, String)))).scalar()
+        cached = _newest[path] = (mtime, newest)
+    return cached[1]
+
+
+def describe(archive_dir: Optional[str] = None) -> List[dict]:
+    archives = []
+    for year, path in archive_files(archive_dir):
+        with _engine(path).connect() as conn:
+            rows, oldest, newest = conn.execute(select(func.count(), func.min(A.c.timestamp), func.max(A.c.timestamp))).one()
+        archives.append({"year": year, "file": os.path.basename(path), "size": os.path.getsize(path),
+                         "transactions": rows, "oldest": oldest, "newest": newest})
+    return archives
+
+
+def default_cutoff(days: int = ARCHIVE_AFTER_DAYS) -> datetime:
+    # Start of the UTC day, like the ledger timestamps
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return start - timedelta(days=days)
+
+
+def _write_archive(archive_dir: str, rows: list):
+    by_year = defaultdict(list)
+    for row in rows:
+        by_year[row["timestamp"].year].append(row)
+    os.makedirs(archive_dir, exist_ok=True)
+    for year, year_rows in by_year.items():
+        path = os.path.join(archive_dir, f"{ARCHIVE_PREFIX}{year}.db")
+        # OR IGNORE: a batch copied before a crash is simply copied again
+        with _engine(path).begin() as conn:
+            conn.execute(insert(A).prefix_with("OR IGNORE"), year_rows)
+
+
+def _fold_openings(session: Session, rows: list, cutoff: datetime):
+    """Add the moved rows' changes to each medicine's OPENING row."""
+    balances = defaultdict(int)
+    for row in rows:
+        balances[row["medicine_id"]] += row["change_amount"]
+    existing = dict(session.exec(
+        select(Transaction.medicine_id, Transaction.id)
+        .where(Transaction.action_type == OPENING_BALANCE, Transaction.medicine_id.in_(list(balances)))
+    ).all())
+    table = Transaction.__table__
+    updates = [{"row_id": existing[m], "delta": d} for m, d in balances.items() if m in existing]
+    inserts = [
+        {"medicine_id": m, "change_amount": d, "action_type": OPENING_BALANCE, "timestamp": cutoff,
+         "note": "Balance of archived ledger rows"}
+        for m, d in balances.items() if m not in existing
+    ]
+    if updates:
+        session.execute(
+            update(table).where(table.c.id == bindparam("row_id"))
+            .values(change_amount=table.c.change_amount + bindparam("delta"), timestamp=cutoff),
+            updates, execution_options={"synchronize_session": False},
+        )
+    if inserts:
+        session.execute(insert(table), inserts)
+
+
+def archive_ledger(writer, cutoff: datetime, archive_dir: Optional[str] = None,
+                   batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """Move ledger rows older than ``cutoff`` into the yearly archive files.
+
+    Works in batches, each one copied to the archive first and then removed
+    from the hot ledger in its own short write transaction, so sales keep
+    going while years of history are moved. Opening balances are correct
+    after every batch.
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    T, M = Transaction, HomeopathicMedicine
+    statement = (
+        select(T.id, T.medicine_id, M.medicine_name, M.potency, M.batch_number,
+               T.change_amount, T.action_type, T.timestamp, T.note)
+        .join_from(T, M, isouter=True) # deleted medicines' rows are archived too
+        .where(T.timestamp < cutoff, T.action_type != OPENING_BALANCE)
+        .order_by(T.id).limit(batch_size)
+    )
+    moved = 0
+    while True:
+        with Session(writer) as session:
+            rows = [dict(row._mapping) for row in session.exec(statement).all()]
+            if not rows:
+                break
+            _write_archive(archive_dir, rows)
+            _fold_openings(session, rows, cutoff)
+            session.execute(delete(T).where(T.id.in_([row["id"] for row in rows])))
+            summary.bump_version(session)
+            session.commit()
+        moved += len(rows)
+
+    vacuumed = moved > 0 and _vacuum_if_sparse(writer)
+    return {"archived": moved, "cutoff": cutoff, "vacuumed": vacuumed}
+
+
+def _vacuum_if_sparse(writer) -> bool:
+    with writer.connect() as conn:
+        pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    if not pages or free / pages < VACUUM_FREE_RATIO:
+        return False
+    # VACUUM can't run inside a transaction, so bypass the BEGIN IMMEDIATE hook
+    raw = writer.raw_connection()
+    try:
+        raw.driver_connection.execute("VACUUM")
+    finally:
+        raw.close()
+    return True
+
+
+def history_rows(limit: int, cursor: Optional[str] = None, medicine_id: Optional[int] = None,
+                 action_type: Optional[str] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, archive_dir: Optional[str] = None) -> list:
+    """Up to ``limit`` archived history rows in /api/history order (newest first)."""
+    after = None
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        after = (datetime.fromisoformat(value), last_id)
+    rows = []
+    for year, path in archive_files(archive_dir):
+        if len(rows) >= limit:
+            break
+        if (since and year < since.year) or (until and year > until.year):
+            continue
+        statement = select(*HISTORY_COLUMNS)
+        if medicine_id is not None:
+            statement = statement.where(A.c.medicine_id == medicine_id)
+        if action_type:
+            statement = statement.where(A.c.action_type == action_type)
+        if since:
+            statement = statement.where(A.c.timestamp >= since)
+        if until:
+            statement = statement.where(A.c.timestamp < until)
+        if after:
+            statement = statement.where(after_cursor(A.c.timestamp, A.c.id, after[0], after[1], True))
+        statement = statement.order_by(*order_by(A.c.timestamp, A.c.id, True)).limit(limit - len(rows))
+        with _engine(path).connect() as conn:
+            rows.extend(conn.execute(statement).all())
+    return rows
+
+
+def merge_history(rows: list, limit: int, cursor: Optional[str] = None, medicine_id: Optional[int] = None,
+                  action_type: Optional[str] = None, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None, archive_dir: Optional[str] = None) -> list:
+    """Hot history ``rows`` (limit + 1 at most) merged with the archived ones.
+
+    The archives are only read when the page could reach into them: the hot
+    ledger ran out, or its last row is older than the newest archived one.
+    """
+    files = archive_files(archive_dir)
+    if not files or (len(rows) > limit and rows[limit].timestamp > max(
+            (_newest_timestamp(path) or "" for _, path in files), default="")):
+        return rows
+    archived = history_rows(limit + 1, cursor, medicine_id, action_type, since, until, archive_dir)
+    hot_ids = {row.id for row in rows}
+    merged = sorted(list(rows) + [row for row in archived if row.id not in hot_ids],
+                    key=lambda row: (row.timestamp, row.id), reverse=True)
+    return merged[:limit + 1]
+
+
+def _hot_ids(session: Session, conn) -> list:
+    # Ids of this archive file that are also (still, or again) in the hot ledger
+    low, high = conn.execute(select(func.min(A.c.id), func.max(A.c.id))).one()
+    if low is None:
+        return []
+    return session.execute(
+        select(Transaction.id)
+        .where(Transaction.id.between(low, high), Transaction.action_type != OPENING_BALANCE)
+    ).scalars().all()
+
+
+def rollup_buckets(archive_dir: Optional[str] = None, session: Optional[Session] = None) -> list:
+    """DailySales buckets for the archived rows.
+
+    With the hot database's ``session``, rows still in the hot ledger are
+    left out, as the rollup already counts them from there.
+    """
+    day = func.date(A.c.timestamp)
+    buckets = []
+    for _, path in archive_files(archive_dir):
+        with _engine(path).connect() as conn:
+            statement = (
+                select(day, A.c.medicine_id, A.c.action_type, func.sum(A.c.change_amount), func.count())
+                .group_by(day, A.c.medicine_id, A.c.action_type)
+            )
+            skip = _hot_ids(session, conn) if session is not None else []
+            if skip:
+                # Through a temporary table: there can be more ids than SQL parameters
+                hot_table.create(conn, checkfirst=True)
+                conn.execute(delete(hot_table))
+                conn.execute(insert(hot_table), [{"id": row_id} for row_id in skip])
+                statement = statement.where(A.c.id.not_in(select(hot_table.c.id)))
+            try:
+                buckets.extend(
+                    {"day": datetime.strptime(d, "%Y-%m-%d").date(), "medicine_id": m, "action_type": a,
+                     "units": units, "txn_count": count}
+                    for d, m, a, units, count in conn.execute(statement)
+                )
+            finally:
+                if skip:
+                    hot_table.drop(conn)
+    return buckets
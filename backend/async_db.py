@@ -0,0 +1,48 @@
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import READ_POOL_SIZE, WRITE_TIMEOUT, apply_pragmas, use_immediate_transactions
+from .stores import Store, current_store
+
+# Async engines for HOMEOVAULT_DB_MODE=async (needs the aiosqlite package).
+# Same profile as the sync engines in models.py: pragmas on every connection,
+# a read pool, and one writer connection that starts with BEGIN IMMEDIATE.
+# A request waiting on SQLite awaits instead of holding a threadpool worker.
+# Each store opens its pair on first use (Store.async_engines() in stores.py).
+
+
+def _make_async_engine(url: str, pool_size: int, pool_timeout: float):
+    new_engine = create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=pool_timeout,
+    )
+    # Pool events live on the sync engine the async one wraps
+    event.listen(new_engine.sync_engine, "connect", apply_pragmas)
+    return new_engine
+
+
+def make_async_engines(db_path: str, read_pool_size: int = READ_POOL_SIZE):
+    """(reader pool, single writer) async engines for the database at ``db_path``."""
+    url = f"sqlite+aiosqlite:///{db_path}"
+    reader = _make_async_engine(url, read_pool_size, pool_timeout=30)
+    writer = _make_async_engine(url, 1, pool_timeout=WRITE_TIMEOUT)
+    use_immediate_transactions(writer.sync_engine)
+    return reader, writer
+
+
+# expire_on_commit=False: an expired attribute would need a lazy load, which
+# async sessions can't do implicitly
+async def get_async_session(store: Store = Depends(current_store)):
+    reader, _ = store.async_engines()
+    async with AsyncSession(reader, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_write_session(store: Store = Depends(current_store)):
+    _, writer = store.async_engines()
+    async with AsyncSession(writer, expire_on_commit=False) as session:
+        yield session
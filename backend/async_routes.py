@@ -0,0 +1,186 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .async_db import get_async_session, get_async_write_session
+from .inventory import add_medicine, remove_medicine, apply_stock_change, apply_batch, sell_fefo
+from .models import HomeopathicMedicine, Transaction, TransactionBatch, SkuSale
+from .stores import Store, current_store, registry
+from . import archive, cache, csv_io, http_cache, queries, sale_queue, serialize
+
+# Async versions of the medicine, transaction, history and export routes,
+# served instead of the ones in main.py when HOMEOVAULT_DB_MODE=async.
+# Reads run their statements on the AsyncSession directly. Writes reuse the
+# sync helpers in inventory.py through run_sync, which drives them on the
+# aiosqlite connection without a threadpool worker, so both modes share one
+# implementation of the stock rules.
+
+router = APIRouter()
+
+
+def install(app):
+    """Replace the matching sync routes of ``app`` with the ones below."""
+    replaced = {(route.path, method) for route in router.routes for method in route.methods}
+    app.router.routes[:] = [
+        route for route in app.router.routes
+        if not (isinstance(route, APIRoute) and any((route.path, m) in replaced for m in route.methods))
+    ]
+    app.include_router(router)
+    # Branch stores open theirs on first use
+    registry.main.async_engines()
+
+
+async def _check_inventory(request: Request, response: Response, session: AsyncSession):
+    return await session.run_sync(lambda s: http_cache.check_inventory(request, response, s))
+
+
+async def _queued(store: Store, work):
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(store.sales().submit(work)), sale_queue.RESULT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Sale was not confirmed in time, please check the stock and retry.")
+
+
+@router.get("/api/medicines", responses=serialize.list_responses(serialize.MEDICINE_NAMES, HomeopathicMedicine))
+async def read_medicines(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    sort: str = "name",
+    name: Optional[str] = Query(None, description="Case-insensitive name prefix"),
+    potency: Optional[str] = None,
+    form: Optional[str] = None,
+    manufacturer: Optional[str] = None,
+    expired: Optional[bool] = None,
+    low_stock: Optional[bool] = None,
+    expiring_within: Optional[int] = Query(None, ge=0, description="Expired or expiring within N days"),
+    format: serialize.Format = Query("rows", description="columns: one array per field"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    cached = await _check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    statement, sort_key = queries.medicine_list(
+        limit, cursor, sort, name, potency, form, manufacturer, expired, low_stock, expiring_within
+    )
+    rows = (await session.exec(statement)).all()
+    values, next_cursor = queries.medicine_page(rows, limit, sort_key)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return cache.responses.store(request, response, serialize.shape(serialize.MEDICINE_NAMES, values, format), encode=False)
+
+
+@router.post("/api/medicines", response_model=HomeopathicMedicine)
+async def create_medicine(medicine: HomeopathicMedicine, session: AsyncSession = Depends(get_async_write_session)):
+    await session.run_sync(add_medicine, medicine)
+    await session.commit()
+    await session.refresh(medicine)
+    return medicine
+
+
+@router.delete("/api/medicines/{medicine_id}")
+async def delete_medicine(medicine_id: int, session: AsyncSession = Depends(get_async_write_session)):
+    await session.run_sync(remove_medicine, medicine_id)
+    await session.commit()
+    return {"status": "success", "message": "Medicine deleted"}
+
+
+@router.post("/api/transaction")
+async def create_transaction(transaction: Transaction, session: AsyncSession = Depends(get_async_write_session),
+                             store: Store = Depends(current_store)):
+    if sale_queue.GROUP_COMMIT:
+        # Waits for the batch without holding a threadpool worker
+        new_quantity = await _queued(store, lambda s: apply_stock_change(s, transaction))
+    else:
+        new_quantity = await session.run_sync(apply_stock_change, transaction)
+        await session.commit()
+    return {"status": "success", "new_quantity": new_quantity}
+
+
+@router.post("/api/transactions/batch")
+async def create_transaction_batch(batch: TransactionBatch, session: AsyncSession = Depends(get_async_write_session)):
+    try:
+        results = await session.run_sync(apply_batch, batch)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return {"status": "success", "count": len(results), "results": results}
+
+
+@router.post("/api/sell")
+async def sell_by_sku(sale: SkuSale, session: AsyncSession = Depends(get_async_write_session),
+                      store: Store = Depends(current_store)):
+    if sale_queue.GROUP_COMMIT:
+        allocations = await _queued(store, lambda s: sell_fefo(s, sale))
+        return {"status": "success", "quantity": sale.quantity, "allocations": allocations}
+    try:
+        allocations = await session.run_sync(sell_fefo, sale)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return {"status": "success", "quantity": sale.quantity, "allocations": allocations}
+
+
+@router.get("/api/history", responses=serialize.list_responses(serialize.HISTORY_NAMES))
+async def read_history(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    medicine_id: Optional[int] = None,
+    action_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: serialize.Format = Query("rows", description="columns: one array per field"),
+    session: AsyncSession = Depends(get_async_session),
+    store: Store = Depends(current_store),
+):
+    cached = await _check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    statement = queries.history_list(limit, cursor, medicine_id, action_type, since, until)
+    rows = (await session.exec(statement)).all()
+    rows = await run_in_threadpool(archive.merge_history, rows, limit, cursor, medicine_id, action_type, since, until,
+                                   store.archive_dir)
+    values, next_cursor = queries.history_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return cache.responses.store(request, response, serialize.shape(serialize.HISTORY_NAMES, values, format), encode=False)
+
+
+@router.get("/api/export")
+async def export_csv(gzip: bool = False, session: AsyncSession = Depends(get_async_session)):
+    return _csv_response(csv_io.export_medicines_async(session.bind), "inventory_export", gzip)
+
+
+@router.get("/api/export/transactions")
+async def export_transactions_csv(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    session: AsyncSession = Depends(get_async_session),
+):
+    return _csv_response(csv_io.export_ledger_async(session.bind, since, until), "transactions_export", gzip)
+
+
+def _csv_response(chunks, filename: str, gzip: bool):
+    if gzip:
+        return StreamingResponse(
+            csv_io.gzip_chunks_async(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f"attachment; filename={filename}.csv.gz"}
+        )
+    return StreamingResponse(
+        chunks,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}.csv"}
+    )
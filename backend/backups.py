@@ -0,0 +1,466 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, update
+from sqlmodel import Session
+
+from .models import InventoryVersion, create_db_and_tables
+from . import archive, changes, summary
+
+# Scheduled backups.
+# Snapshots are taken with SQLite's online backup API, so they are consistent
+# even while the shop is selling. A snapshot is only written when the
+# inventory version moved since the last one: a restart or a quiet night
+# costs nothing. Each file gets a JSON manifest next to it (checksum, size,
+# inventory version), old files are thinned out hourly/daily/weekly, and a
+# restore copies a verified snapshot back through the writer connection in
+# one transaction, after first snapshotting the current state.
+# The yearly ledger archives (archive.py) are part of every backup: each
+# manifest lists the archive files with their checksums, and a file is only
+# copied (into ARCHIVE_BACKUP_DIR) when it changed since the copy an earlier
+# backup already holds. A restore brings them back together with the database.
+# With a store registry (stores.py), every branch store is backed up on the
+# same schedule into its own folder, BRANCH_BACKUP_DIR/<id>/ under the
+# backup directory.
+
+BACKUP_PAGES_PER_STEP = int(os.environ.get("HOMEOVAULT_BACKUP_PAGES_PER_STEP", "1024"))
+BACKUP_INTERVAL_MINUTES = float(os.environ.get("HOMEOVAULT_BACKUP_INTERVAL", "60")) # 0 = at startup only
+BACKUP_COMPRESS = os.environ.get("HOMEOVAULT_BACKUP_COMPRESS", "0") == "1"
+# Newest snapshot of each of the last N hours, days and ISO weeks
+BACKUP_RETENTION = tuple(int(n) for n in os.environ.get("HOMEOVAULT_BACKUP_KEEP", "24,7,4").split(","))
+
+BACKUP_PREFIX = "inventory_backup_"
+BRANCH_BACKUP_DIR = "stores"
+ARCHIVE_BACKUP_DIR = "archive"
+CHUNK_SIZE = 1024 * 1024
+
+_lock = threading.Lock() # one snapshot, prune or restore at a time
+
+
+def backup_database(db_path: str, backup_dir: str, pages_per_step: int = BACKUP_PAGES_PER_STEP,
+                    progress=None, compress: bool = False) -> str:
+    """Copy the live database with SQLite's online backup API.
+
+    The copy is taken ``pages_per_step`` pages at a time, releasing the read
+    lock in between so concurrent writers are never stalled, and the result is
+    a consistent snapshot (unlike copying the file while it is open).
+    With ``compress`` the finished copy is gzipped.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stem = os.path.join(backup_dir, BACKUP_PREFIX + datetime.now().strftime("%Y%m%d_%H%M%S"))
+    backup_file, n = stem + ".db", 1
+    while os.path.exists(backup_file) or os.path.exists(backup_file + ".gz"):
+        backup_file, n = f"{stem}_{n}.db", n + 1
+    return _copy_database(db_path, backup_file, pages_per_step, progress, compress)
+
+
+def _copy_database(db_path: str, backup_file: str, pages_per_step: int = BACKUP_PAGES_PER_STEP,
+                   progress=None, compress: bool = False) -> str:
+    # Online backup of db_path to backup_file (+ ".gz"); returns the file written
+    partial_file = backup_file + ".partial"
+
+    def on_step(status, remaining, total):
+        if progress and total:
+            progress((total - remaining) / total)
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(partial_file)
+    try:
+        source.backup(target, pages=pages_per_step, progress=on_step)
+    finally:
+        target.close()
+        source.close()
+
+    if compress:
+        packed_file = backup_file + ".gz.partial"
+        with open(partial_file, "rb") as raw, gzip.open(packed_file, "wb", compresslevel=6) as packed:
+            shutil.copyfileobj(raw, packed, CHUNK_SIZE)
+        os.remove(partial_file)
+        partial_file, backup_file = packed_file, backup_file + ".gz"
+    # Only a finished backup gets the real name
+    os.replace(partial_file, backup_file)
+    return backup_file
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_backup(name: str) -> bool:
+    return name.startswith(BACKUP_PREFIX) and name.endswith((".db", ".db.gz"))
+
+
+def list_backups(backup_dir: str) -> List[dict]:
+    """Manifest of every backup in ``backup_dir``, newest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    entries = []
+    for name in os.listdir(backup_dir):
+        if not _is_backup(name):
+            continue
+        path = os.path.join(backup_dir, name)
+        try:
+            with open(path + ".json") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            # Taken before manifests existed: nothing to verify it against
+            entry = {
+                "name": name,
+                "created_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds"),
+                "size": os.path.getsize(path),
+                "sha256": None,
+                "compressed": name.endswith(".gz"),
+                "version": None,
+                "reason": "legacy",
+            }
+        entries.append(entry)
+    entries.sort(key=lambda e: (e["created_at"], e["name"]), reverse=True)
+    return entries
+
+
+def _matches(path: str, sha256: str) -> bool:
+    return os.path.isfile(path) and file_checksum(path) == sha256
+
+
+def verify_backup(backup_dir: str, entry: dict) -> Optional[bool]:
+    """Whether the file and its archive copies still match their checksums (None when it has none)."""
+    if not entry.get("sha256"):
+        return None
+    return _matches(os.path.join(backup_dir, entry["name"]), entry["sha256"]) and all(
+        _matches(os.path.join(backup_dir, ARCHIVE_BACKUP_DIR, copy["file"]), copy["sha256"])
+        for copy in entry.get("archives", [])
+    )
+
+
+def _snapshot_archives(backup_dir: str, archive_dir: str, name: str, compress: bool) -> List[dict]:
+    """Copies of the archive files for backup ``name``, reusing unchanged earlier copies."""
+    earlier = {
+        (copy["name"], copy["size"], copy["modified"]): copy
+        for entry in list_backups(backup_dir) for copy in entry.get("archives", [])
+        if os.path.isfile(os.path.join(backup_dir, ARCHIVE_BACKUP_DIR, copy["file"]))
+    }
+    stamp = name[len(BACKUP_PREFIX):].split(".")[0]
+    copies = []
+    for _, path in archive.archive_files(archive_dir):
+        archive_name = os.path.basename(path)
+        stat = os.stat(path) # before copying: a write during the copy makes the next backup copy again
+        copy = earlier.get((archive_name, stat.st_size, stat.st_mtime_ns))
+        if copy is None:
+            target = os.path.join(backup_dir, ARCHIVE_BACKUP_DIR, f"{archive_name[:-len('.db')]}_{stamp}.db")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            written = _copy_database(path, target, compress=compress)
+            copy = {"name": archive_name, "file": os.path.basename(written), "sha256": file_checksum(written),
+                    "compressed": compress, "size": stat.st_size, "modified": stat.st_mtime_ns}
+        copies.append(copy)
+    return copies
+
+
+def _snapshot(db_path: str, backup_dir: str, engine=None, reason: str = "scheduled", force: bool = False,
+              compress: bool = BACKUP_COMPRESS, progress=None, archive_dir: Optional[str] = None) -> Optional[dict]:
+    version = None
+    if engine is not None:
+        # Read before copying: a write during the copy only makes the next run take another
+        with Session(engine) as session:
+            version, _ = summary.current_version(session)
+        latest = next(iter(list_backups(backup_dir)), None)
+        if not force and latest is not None and latest.get("version") == version:
+            return None
+
+    path = backup_database(db_path, backup_dir, progress=progress, compress=compress)
+    entry = {
+        "name": os.path.basename(path),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "size": os.path.getsize(path),
+        "sha256": file_checksum(path),
+        "compressed": compress,
+        "version": version,
+        "reason": reason,
+    }
+    if archive_dir is not None:
+        # After the database: a row archived in between is then in both copies, never in neither
+        entry["archives"] = _snapshot_archives(backup_dir, archive_dir, entry["name"], compress)
+    with open(path + ".json", "w") as f:
+        json.dump(entry, f, indent=2)
+    return entry
+
+
+def take_snapshot(db_path: str, backup_dir: str, engine=None, reason: str = "scheduled", force: bool = False,
+                  compress: bool = BACKUP_COMPRESS, progress=None, archive_dir: Optional[str] = None) -> Optional[dict]:
+    """Back up ``db_path`` (and the ledger archives in ``archive_dir``) and record its manifest entry.
+
+    With ``engine`` given, returns None without copying anything when the
+    inventory version matches the newest backup's (unless ``force``).
+    """
+    with _lock:
+        return _snapshot(db_path, backup_dir, engine, reason, force, compress, progress, archive_dir)
+
+
+def retained(entries: List[dict], keep=BACKUP_RETENTION, now: Optional[datetime] = None) -> set:
+    """Names kept by the hourly/daily/weekly policy (``entries`` newest first).
+
+    Everything from the last hour is kept, so a manual or pre-restore backup
+    survives the next scheduled one.
+    """
+    recent = ((now or datetime.now()) - timedelta(hours=1)).isoformat(timespec="seconds")
+    keep_names = {e["name"] for e in entries if e["created_at"] >= recent}
+    if entries:
+        keep_names.add(entries[0]["name"])
+    buckets = (
+        lambda t: (t.year, t.month, t.day, t.hour),
+        lambda t: (t.year, t.month, t.day),
+        lambda t: tuple(t.isocalendar()[:2]),
+    )
+    for count, bucket in zip(keep, buckets):
+        seen = set()
+        for entry in entries:
+            key = bucket(datetime.fromisoformat(entry["created_at"]))
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            keep_names.add(entry["name"])
+    return keep_names
+
+
+def prune(backup_dir: str, keep=BACKUP_RETENTION) -> List[str]:
+    """Delete backups outside the retention policy. Returns their names."""
+    with _lock:
+        entries = list_backups(backup_dir)
+        keep_names = retained(entries, keep)
+        removed = []
+        for entry in entries:
+            if entry["name"] in keep_names:
+                continue
+            path = os.path.join(backup_dir, entry["name"])
+            for stale in (path, path + ".json"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            removed.append(entry["name"])
+        # Archive copies no remaining backup refers to
+        copies_dir = os.path.join(backup_dir, ARCHIVE_BACKUP_DIR)
+        if removed and os.path.isdir(copies_dir):
+            referenced = {copy["file"] for entry in entries if entry["name"] in keep_names
+                          for copy in entry.get("archives", [])}
+            for file in os.listdir(copies_dir):
+                if file not in referenced:
+                    os.remove(os.path.join(copies_dir, file))
+        return removed
+
+
+def _unpack(source: str, target: str, compressed: bool):
+    # Copies a backup file to target (through a temporary name), unzipping it if needed
+    partial = target + ".restore.partial"
+    if compressed:
+        with gzip.open(source, "rb") as packed, open(partial, "wb") as raw:
+            shutil.copyfileobj(packed, raw, CHUNK_SIZE)
+    else:
+        shutil.copyfile(source, partial)
+    os.replace(partial, target)
+
+
+def _restore_archives(backup_dir: str, archive_dir: str, copies: List[dict]):
+    """Make ``archive_dir`` hold exactly the archive files of a backup."""
+    wanted = {copy["name"]: copy for copy in copies}
+    archive.close_files(archive_dir)
+    for _, path in archive.archive_files(archive_dir):
+        if os.path.basename(path) not in wanted:
+            os.remove(path) # archived after the backup: those rows are back in the restored ledger
+    os.makedirs(archive_dir, exist_ok=True)
+    for archive_name, copy in wanted.items():
+        target = os.path.join(archive_dir, archive_name)
+        if os.path.isfile(target):
+            stat = os.stat(target)
+            if (stat.st_size, stat.st_mtime_ns) == (copy["size"], copy["modified"]):
+                continue # untouched since the backup
+        _unpack(os.path.join(backup_dir, ARCHIVE_BACKUP_DIR, copy["file"]), target, copy["compressed"])
+
+
+def restore(name: str, backup_dir: str, db_path: str, engine, writer, archive_dir: Optional[str] = None) -> dict:
+    """Replace the live database with backup ``name``.
+
+    The file is checked against its checksum and the current state is backed
+    up first. The copy goes through the single writer connection in one step,
+    so other writes queue behind it and readers see the old or the new
+    inventory, never a mix. Afterwards the inventory version moves past every
+    ETag handed out and the change log restarts, so clients reload.
+    With ``archive_dir``, the ledger archives go back to the backup's state
+    as well (unless the backup predates archive copies).
+    """
+    with _lock:
+        entry = next((e for e in list_backups(backup_dir) if e["name"] == name), None)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Backup not found.")
+        if verify_backup(backup_dir, entry) is False:
+            raise HTTPException(status_code=409, detail="Backup is damaged (checksum mismatch).")
+        safety = _snapshot(db_path, backup_dir, engine, reason=f"before restoring {name}", force=True,
+                           archive_dir=archive_dir)
+
+        with Session(writer) as session:
+            old_version, _ = summary.current_version(session)
+            old_cursor = changes.latest_cursor(session)
+
+        path = os.path.join(backup_dir, name)
+        source_file = path
+        if entry["compressed"]:
+            source_file = path + ".restore.partial"
+            with gzip.open(path, "rb") as packed, open(source_file, "wb") as raw:
+                shutil.copyfileobj(packed, raw, CHUNK_SIZE)
+        try:
+            source = sqlite3.connect(source_file)
+            target = writer.raw_connection()
+            try:
+                source.backup(target.driver_connection)
+            finally:
+                target.close()
+                source.close()
+        finally:
+            if source_file != path:
+                os.remove(source_file)
+
+        create_db_and_tables(writer)
+        with Session(writer) as session:
+            summary.rebuild_summary(session) # also bumps the version
+            session.execute(
+                update(InventoryVersion).where(InventoryVersion.id == summary.VERSION_ID)
+                .values(version=func.max(InventoryVersion.version, old_version + 1)),
+                execution_options={"synchronize_session": False},
+            )
+            changes.restart(session, old_cursor + 1)
+            session.commit()
+        if archive_dir is not None and "archives" in entry:
+            _restore_archives(backup_dir, archive_dir, entry["archives"])
+    return {"restored": name, "safety_backup": safety["name"]}
+
+
+class BackupScheduler:
+    """Takes a snapshot every ``interval_minutes`` on a background thread.
+
+    ``store`` arguments pick a branch store of ``registry``; None (or the
+    registry's main store) is the database given here, with its ledger
+    archives in ``archive_dir``.
+    """
+
+    def __init__(self, db_path: str, backup_dir: str, engine, writer,
+                 interval_minutes: float = BACKUP_INTERVAL_MINUTES, compress: bool = BACKUP_COMPRESS,
+                 keep=BACKUP_RETENTION, registry=None, archive_dir: Optional[str] = None):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.archive_dir = archive_dir
+        self.engine = engine
+        self.writer = writer
+        self.interval_minutes = interval_minutes
+        self.compress = compress
+        self.keep = keep
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+        self._status_lock = threading.Lock()
+        self._status = {"last_run": None, "last_result": None, "next_run": None, "stores": {}}
+
+    def start(self):
+        if self.interval_minutes <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="homeovault-backups", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _branch_id(self, store) -> Optional[str]:
+        # None for the main database
+        if store is None or self.registry is None or store.id == self.registry.main.id:
+            return None
+        return store.id
+
+    def _target(self, store=None):
+        """(db_path, backup_dir, engine, writer, archive_dir) of ``store``."""
+        if self._branch_id(store) is None:
+            return self.db_path, self.backup_dir, self.engine, self.writer, self.archive_dir
+        return (store.db_path, os.path.join(self.backup_dir, BRANCH_BACKUP_DIR, store.id), store.reader,
+                store.writer, store.archive_dir)
+
+    def _update(self, branch_id: Optional[str] = None, **fields):
+        with self._status_lock:
+            if branch_id is not None:
+                self._status["stores"].setdefault(branch_id, {}).update(fields)
+            else:
+                self._status.update(fields)
+
+    def status(self) -> dict:
+        with self._status_lock:
+            status = dict(self._status, stores={k: dict(v) for k, v in self._status["stores"].items()})
+        return {"interval_minutes": self.interval_minutes, "compress": self.compress,
+                "keep": dict(zip(("hourly", "daily", "weekly"), self.keep)), **status}
+
+    def _loop(self):
+        while True:
+            self._update(next_run=datetime.now() + timedelta(minutes=self.interval_minutes))
+            if self._stop.wait(self.interval_minutes * 60):
+                return
+            self.run_all()
+
+    def run_all(self, reason: str = "scheduled") -> dict:
+        """run_once() for the main database and then every branch store.
+
+        A failing store doesn't stop the others; failures are in the status.
+        Returns {store id: entry or None}.
+        """
+        if self.registry is None:
+            return {None: self._try(reason)}
+        entries = {}
+        for store_id in self.registry.ids():
+            try:
+                with self.registry.use(store_id) as store:
+                    entries[store_id] = self._try(reason, store)
+            except Exception as e:
+                # The branch could not be opened at all
+                self._update(store_id, last_run=datetime.now(), last_result=f"failed: {e}")
+                print(f"Backup Error ({store_id}): {e}")
+        return entries
+
+    def _try(self, reason: str, store=None) -> Optional[dict]:
+        try:
+            return self.run_once(reason, store=store)
+        except Exception:
+            return None # recorded in the status, retried next interval
+
+    def run_once(self, reason: str = "scheduled", force: bool = False, store=None) -> Optional[dict]:
+        """Snapshot (skipped when nothing changed) and prune."""
+        db_path, backup_dir, engine, _, archive_dir = self._target(store)
+        branch_id = self._branch_id(store)
+        try:
+            entry = take_snapshot(db_path, backup_dir, engine, reason=reason, force=force, compress=self.compress,
+                                  archive_dir=archive_dir)
+            prune(backup_dir, self.keep)
+        except Exception as e:
+            self._update(branch_id, last_run=datetime.now(), last_result=f"failed: {e}")
+            print(f"Backup Error ({branch_id or 'main'}): {e}")
+            raise
+        self._update(branch_id, last_run=datetime.now(), last_result=entry["name"] if entry else "unchanged, skipped")
+        return entry
+
+    def list(self, verify: bool = False, store=None) -> List[dict]:
+        backup_dir = self._target(store)[1]
+        entries = list_backups(backup_dir)
+        if verify:
+            for entry in entries:
+                entry["verified"] = verify_backup(backup_dir, entry)
+        return entries
+
+    def restore(self, name: str, store=None) -> dict:
+        db_path, backup_dir, engine, writer, archive_dir = self._target(store)
+        return restore(name, backup_dir, db_path, engine, writer, archive_dir)
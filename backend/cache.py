@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlmodel import Session
+
+from . import metrics, serialize, stores
+
+# Read-through cache for the computed read responses (medicine list, history,
+# summary, search, analytics).
+# Entries are encoded JSON bodies keyed by path and query, and belong to the
+# ETag generation they were built under. http_cache.check_inventory() reads
+# the inventory version on every request anyway, so a repeat read is served
+# from memory after that one primary-key lookup, and it stays correct with
+# several workers or processes: a write anywhere bumps the version, which
+# makes the whole generation unreachable. Commits that wrote through this
+# process drop it right away. Bounded by entry count, bytes and a TTL.
+# Each branch store (stores.py) has its own generation and entries, and a
+# write to one store only drops that store's.
+
+CACHE_ENTRIES = int(os.environ.get("HOMEOVAULT_CACHE_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.environ.get("HOMEOVAULT_CACHE_MB", "64")) * 1024 * 1024
+CACHE_TTL = float(os.environ.get("HOMEOVAULT_CACHE_TTL", "300")) # seconds
+
+
+class LRUCache:
+    """Thread-safe LRU of byte strings with a TTL and a byte budget."""
+
+    def __init__(self, name: str, max_entries: int = CACHE_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL, clock=time.monotonic):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict() # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(("hits", "misses", "evictions", "expirations", "invalidations"), 0)
+
+    def _count(self, event_name: str, amount: int = 1):
+        self._counts[event_name] += amount
+        metrics.CACHE_EVENTS.inc((self.name, event_name.rstrip("s")), amount)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._drop(key)
+                self._count("expirations")
+                entry = None
+            if entry is None:
+                self._count("misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count("hits")
+            return entry[2]
+
+    def put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._clock() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._count("evictions")
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _clear(self):
+        # Caller holds self._lock
+        if self._entries:
+            self._count("invalidations", len(self._entries))
+        self._entries.clear()
+        self._bytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                **self._counts,
+                "hit_ratio": round(self._counts["hits"] / lookups, 3) if lookups else None,
+            }
+
+
+class ResponseCache(LRUCache):
+    """Response bodies of one ETag generation per store."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._generations = {} # store id -> ETag the entries were built under
+
+    def _enter(self, scope: str, generation: str):
+        # A newer (or, after a restore, different) version: everything held for the store is stale
+        with self._lock:
+            if self._generations.get(scope) != generation:
+                self._clear_scope(scope)
+                self._generations[scope] = generation
+
+    def _clear_scope(self, scope: str):
+        # Caller holds self._lock
+        stale = [key for key in self._entries if key[0] == scope]
+        for key in stale:
+            self._drop(key)
+        if stale:
+            self._count("invalidations", len(stale))
+        self._generations.pop(scope, None)
+
+    def clear(self, scope: Optional[str] = None):
+        """Drop every entry, or only those of store ``scope``."""
+        with self._lock:
+            if scope is None:
+                self._clear()
+                self._generations.clear()
+            else:
+                self._clear_scope(scope)
+
+    def lookup(self, request: Request, response: Response) -> Optional[Response]:
+        """The cached response for ``request``, or None. Call after
+        http_cache.check_inventory(), which puts the ETag on ``response``."""
+        generation = response.headers.get("etag")
+        if generation is None:
+            return None
+        key = _key(request)
+        self._enter(key[0], generation)
+        cached = self.get(key)
+        if cached is None:
+            return None
+        body, headers = cached
+        response.headers.update(headers)
+        return serialize.json_response(body, response)
+
+    def store(self, request: Request, response: Response, content, encode: bool = True) -> Response:
+        """Encode ``content``, keep it for the next identical request and return it.
+
+        ``encode=False`` for content that is already plain JSON values.
+        """
+        body = serialize.dumps(jsonable_encoder(content) if encode else content)
+        generation = response.headers.get("etag")
+        if generation is not None:
+            key = _key(request)
+            self._enter(key[0], generation)
+            headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+            self.put(key, (body, headers), len(body))
+        return serialize.json_response(body, response)
+
+
+def _key(request: Request):
+    return stores.store_id(request), request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+
+responses = ResponseCache("responses")
+
+
+# Precise invalidation: only sessions that actually wrote drop the cache.
+# Every write bumps the inventory version, so what they drop is stale anyway;
+# this just frees it without waiting for the next read to notice.
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session, flush_context):
+    session.info["cache_dirty"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _executed(state):
+    if not state.is_select:
+        state.session.info["cache_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _committed(session):
+    if session.info.pop("cache_dirty", False):
+        # Sessions on engines of no store (e.g. tests) drop everything
+        responses.clear(stores.registry.id_for_bind(session.get_bind()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("cache_dirty", None)
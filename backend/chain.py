@@ -0,0 +1,81 @@
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from .models import HomeopathicMedicine, PRODUCT_COLUMNS
+from .pagination import prefix_upper_bound
+from .stores import StoreRegistry
+from . import summary
+
+# Chain-wide views across every branch store.
+# Each store is queried on its own connection by StoreRegistry.fan_out(), in
+# parallel, and the per-store results are merged here. Stores stay separate
+# files (no ATTACH), so one busy or damaged branch never blocks the others:
+# it just shows up with an "error" entry.
+
+SUMMARY_TOTALS = ("total_skus", "total_units", "stock_value_purchase", "stock_value_mrp",
+                  "expired_count", "expiring_count", "low_stock_count")
+# Stock is compared per product (PRODUCT_COLUMNS); batches and expiry dates stay per store
+
+
+def chain_summary(registry: StoreRegistry, expiring_within: int = summary.EXPIRING_SOON_DAYS,
+                  store_ids: Optional[List[str]] = None) -> dict:
+    """Dashboard counters of every store, and their totals."""
+    def read(store):
+        with Session(store.reader) as session, Session(store.writer) as write_session:
+            return summary.get_summary(session, write_session, expiring_within)
+
+    per_store = registry.fan_out(read, store_ids)
+    totals = dict.fromkeys(SUMMARY_TOTALS, 0)
+    for result in per_store.values():
+        if "error" not in result:
+            for key in SUMMARY_TOTALS:
+                totals[key] += result[key]
+    return {"expiring_within_days": expiring_within, "totals": totals, "stores": per_store}
+
+
+def _stock_rows(session: Session, name: Optional[str], potency: Optional[str], limit: int) -> list:
+    M = HomeopathicMedicine
+    product = [getattr(M, column) for column in PRODUCT_COLUMNS]
+    statement = (
+        select(*product, func.sum(M.quantity), func.min(M.expiry_date))
+        .where(M.quantity > 0, M.expiry_date >= date.today()) # sellable stock only
+        .group_by(*product)
+        .order_by(*product)
+        .limit(limit)
+    )
+    # A blank search box filters nothing (an empty prefix has no upper bound)
+    prefix = (name or "").strip().lower()
+    if prefix:
+        name_key = func.lower(M.medicine_name)
+        statement = statement.where(name_key >= prefix, name_key < prefix_upper_bound(prefix))
+    if potency:
+        statement = statement.where(M.potency == potency)
+    return session.exec(statement).all()
+
+
+def chain_stock(registry: StoreRegistry, name: Optional[str] = None, potency: Optional[str] = None,
+                limit: int = 100, store_ids: Optional[List[str]] = None) -> dict:
+    """Sellable quantity of each product in every store (e.g. "who has Arnica 30C?")."""
+    def read(store):
+        with Session(store.reader) as session:
+            return _stock_rows(session, name, potency, limit)
+
+    per_store = registry.fan_out(read, store_ids)
+    products = {}
+    errors = {}
+    for store_id, rows in per_store.items():
+        if isinstance(rows, dict):
+            errors[store_id] = rows["error"]
+            continue
+        for *key, quantity, next_expiry in rows:
+            entry = products.get(tuple(key))
+            if entry is None:
+                entry = products[tuple(key)] = {**dict(zip(PRODUCT_COLUMNS, key)), "total": 0, "stores": {}}
+            entry["total"] += quantity
+            entry["stores"][store_id] = {"quantity": quantity, "next_expiry": next_expiry}
+    # Each store returned its first ``limit`` products, so the merged first ``limit`` are complete
+    merged = [products[key] for key in sorted(products)][:limit]
+    return {"products": merged, "errors": errors}
@@ -0,0 +1,86 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, text
+from sqlmodel import Session, select
+
+from .models import ChangeLog, HomeopathicMedicine
+
+# Delta sync for dashboards that keep a local copy of the catalogue.
+# A client remembers the cursor (ChangeLog id) it is current as of and asks
+# for everything after it. Several changes to one medicine collapse into its
+# current row (or a delete), so a busy medicine costs one entry per sync.
+# Entries older than CHANGELOG_RETENTION_DAYS are pruned at startup; a
+# client whose cursor predates the oldest kept entry is told to reload.
+
+CHANGELOG_RETENTION_DAYS = int(os.environ.get("HOMEOVAULT_CHANGELOG_DAYS", "30"))
+MAX_CHANGES = 5000
+
+
+def latest_cursor(session: Session) -> int:
+    # sqlite_sequence survives pruning, unlike max(id)
+    seq = session.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'changelog'")).scalar()
+    return seq or 0
+
+
+def _reset(cursor: int) -> dict:
+    return {"cursor": cursor, "reset": True, "more": False, "upserts": [], "deletes": []}
+
+
+def changes_since(session: Session, since: Optional[int], limit: int = 1000) -> dict:
+    """Medicines created/updated (current row) and deleted (id) after ``since``.
+
+    ``reset`` means the client must reload the catalogue and continue from
+    ``cursor``: no cursor was given, it was pruned, or it belongs to another
+    database (e.g. before a restore).
+    """
+    latest = latest_cursor(session)
+    if since is None or since > latest:
+        return _reset(latest)
+    oldest = session.exec(select(func.min(ChangeLog.id))).one()
+    if since < (oldest if oldest is not None else latest + 1) - 1:
+        return _reset(latest)
+
+    rows = session.exec(
+        select(ChangeLog.id, ChangeLog.medicine_id, ChangeLog.op)
+        .where(ChangeLog.id > since).order_by(ChangeLog.id).limit(limit + 1)
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return {"cursor": since, "reset": False, "more": False, "upserts": [], "deletes": []}
+
+    # Last operation per medicine wins
+    final_op = {}
+    for _, medicine_id, op in rows:
+        final_op[medicine_id] = op
+    upsert_ids = [m for m, op in final_op.items() if op == "upsert"]
+    upserts = session.exec(
+        select(HomeopathicMedicine).where(HomeopathicMedicine.id.in_(upsert_ids))
+    ).all() if upsert_ids else []
+    # Gone since: a later entry will say so, but report it now
+    found = {m.id for m in upserts}
+    deletes = [m for m, op in final_op.items() if op == "delete" or m not in found]
+    return {"cursor": rows[-1][0], "reset": False, "more": more, "upserts": upserts, "deletes": deletes}
+
+
+def prune(session: Session, days: int = CHANGELOG_RETENTION_DAYS) -> int:
+    """Drop log entries older than ``days`` days. Returns the number removed (caller commits)."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = session.execute(delete(ChangeLog).where(ChangeLog.changed_at < cutoff))
+    return result.rowcount
+
+
+def restart(session: Session, after: int):
+    """Empty the log and continue numbering after ``after`` (caller commits).
+
+    Used after a restore: the restored log describes another history, so every
+    cursor handed out before must get ``reset`` rather than a wrong delta.
+    """
+    session.execute(delete(ChangeLog))
+    updated = session.execute(
+        text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'changelog'"), {"seq": after}
+    ).rowcount
+    if not updated:
+        session.execute(text("INSERT INTO sqlite_sequence(name, seq) VALUES ('changelog', :seq)"), {"seq": after})
@@ -0,0 +1,302 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import HomeopathicMedicine, Transaction, SKU_COLUMNS
+from .inventory import BULK_LOOKUP_CHUNK
+from . import analytics, summary
+
+# Streaming CSV export / import.
+# Exports read the database in keyset batches on their own short-lived
+# session and yield CSV text as they go, so neither the result set nor the
+# file is ever held in memory. Imports parse the upload row by row and write
+# batches with a single executemany upsert each; the change in each batch's
+# quantity is written to the ledger (ADD, or ADJUST for a lower count), so
+# stock still equals the sum of the ledger. The *_async variants do the
+# same on an async engine (HOMEOVAULT_DB_MODE=async).
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+MEDICINE_HEADER = [
+    'ID', 'Name', 'Potency', 'Form', 'Size', 'Manufacturer',
+    'Batch', 'Expiry', 'MRP', 'Purchase Price', 'Quantity'
+]
+LEDGER_HEADER = ['ID', 'Timestamp', 'Medicine ID', 'Name', 'Batch', 'Change', 'Action', 'Note']
+
+
+def _csv_chunks(header: List[str], batches: Iterable[list]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only (empty table)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def _csv_chunks_async(header: List[str], batches: AsyncIterator[list]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    async for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def gzip_chunks_async(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _keyset_batches(bind, statement, id_column, batch_size: int):
+    """Yield lists of row tuples, ``batch_size`` at a time, ordered by id.
+
+    Each batch is its own short read, so a long download never pins an old
+    snapshot (which would stop SQLite from checkpointing the WAL).
+    """
+    last_id = 0
+    while True:
+        with Session(bind) as session:
+            rows = session.exec(
+                statement.where(id_column > last_id).order_by(id_column).limit(batch_size)
+            ).all()
+        if not rows:
+            return
+        yield [tuple(row) for row in rows]
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            return
+
+
+async def _keyset_batches_async(bind, statement, id_column, batch_size: int):
+    last_id = 0
+    while True:
+        async with AsyncSession(bind) as session:
+            rows = (await session.exec(
+                statement.where(id_column > last_id).order_by(id_column).limit(batch_size)
+            )).all()
+        if not rows:
+            return
+        yield [tuple(row) for row in rows]
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            return
+
+
+def _medicine_export():
+    M = HomeopathicMedicine
+    return select(
+        M.id, M.medicine_name, M.potency, M.form, M.bottle_size,
+        M.manufacturer, M.batch_number, M.expiry_date, M.mrp,
+        M.purchase_price, M.quantity
+    )
+
+
+def _ledger_export(since: Optional[datetime], until: Optional[datetime]):
+    T = Transaction
+    statement = select(
+        T.id, T.timestamp, T.medicine_id, HomeopathicMedicine.medicine_name,
+        HomeopathicMedicine.batch_number, T.change_amount, T.action_type, T.note
+    ).join(HomeopathicMedicine, isouter=True)
+    if since:
+        statement = statement.where(T.timestamp >= since)
+    if until:
+        statement = statement.where(T.timestamp < until)
+    return statement
+
+
+def export_medicines(bind, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    batches = _keyset_batches(bind, _medicine_export(), HomeopathicMedicine.id, batch_size)
+    return _csv_chunks(MEDICINE_HEADER, batches)
+
+
+def export_ledger(bind, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    batches = _keyset_batches(bind, _ledger_export(since, until), Transaction.id, batch_size)
+    return _csv_chunks(LEDGER_HEADER, batches)
+
+
+def export_medicines_async(bind, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    batches = _keyset_batches_async(bind, _medicine_export(), HomeopathicMedicine.id, batch_size)
+    return _csv_chunks_async(MEDICINE_HEADER, batches)
+
+
+def export_ledger_async(bind, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    batches = _keyset_batches_async(bind, _ledger_export(since, until), Transaction.id, batch_size)
+    return _csv_chunks_async(LEDGER_HEADER, batches)
+
+
+# --- Import ---
+
+def _parse_row(row: dict) -> dict:
+    def text(column, default=None):
+        value = (row.get(column) or "").strip()
+        if not value:
+            if default is None:
+                raise ValueError(f"Missing '{column}'")
+            return default
+        return value
+
+    def number(column, cast, default=None):
+        value = (row.get(column) or "").strip()
+        if not value:
+            if default is None:
+                raise ValueError(f"Missing '{column}'")
+            return default
+        try:
+            return cast(value)
+        except (ValueError, InvalidOperation):
+            raise ValueError(f"Invalid {column} '{value}'")
+
+    try:
+        expiry = datetime.strptime(text('Expiry'), "%Y-%m-%d").date()
+    except ValueError as e:
+        raise ValueError(str(e) if "Missing" in str(e) else "Expiry must be YYYY-MM-DD")
+
+    medicine = {
+        "medicine_name": text('Name'),
+        "potency": text('Potency'),
+        "form": text('Form', "Dilution"),
+        "bottle_size": text('Size', "30ml"),
+        "manufacturer": text('Manufacturer', "Dr. Reckeweg"),
+        "batch_number": text('Batch'),
+        "expiry_date": expiry,
+        "mrp": number('MRP', Decimal),
+        "purchase_price": number('Purchase Price', Decimal, Decimal(0)),
+        "quantity": number('Quantity', int, 0),
+        "low_stock_threshold": number('Low Stock Threshold', int, 5),
+    }
+    # Same rules as create_medicine
+    if medicine["mrp"] <= 0:
+        raise ValueError("MRP must be greater than 0.")
+    if medicine["purchase_price"] < 0:
+        raise ValueError("Purchase Price cannot be negative.")
+    if medicine["quantity"] < 0:
+        raise ValueError("Quantity cannot be negative.")
+    return medicine
+
+
+def _quantities(session: Session, skus) -> dict:
+    """{sku: (id, quantity)} of the SKUs that are in the catalogue."""
+    M = HomeopathicMedicine
+    batch_numbers = sorted({sku[-1] for sku in skus})
+    found = {}
+    for start in range(0, len(batch_numbers), BULK_LOOKUP_CHUNK):
+        rows = session.exec(
+            select(M.id, M.quantity, *[getattr(M, c) for c in SKU_COLUMNS])
+            .where(M.batch_number.in_(batch_numbers[start:start + BULK_LOOKUP_CHUNK]))
+        ).all()
+        for medicine_id, quantity, *sku in rows:
+            found[tuple(sku)] = (medicine_id, quantity)
+    return {sku: found[sku] for sku in skus if sku in found}
+
+
+def _upsert(session: Session, rows: List[dict], note: str = "CSV import"):
+    now = datetime.utcnow()
+    for row in rows:
+        row["created_at"] = now
+        row["last_updated"] = now
+    skus = {tuple(row[c] for c in SKU_COLUMNS) for row in rows}
+    before = _quantities(session, skus)
+    statement = insert(HomeopathicMedicine.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=SKU_COLUMNS,
+        set_={
+            "expiry_date": statement.excluded.expiry_date,
+            "mrp": statement.excluded.mrp,
+            "purchase_price": statement.excluded.purchase_price,
+            "quantity": statement.excluded.quantity,
+            "low_stock_threshold": statement.excluded.low_stock_threshold,
+            "last_updated": statement.excluded.last_updated,
+        },
+    )
+    session.execute(statement, rows)  # executemany
+
+    # The file sets each quantity; the ledger gets the difference
+    ledger_rows = []
+    for sku, (medicine_id, quantity) in _quantities(session, skus).items():
+        change = quantity - before.get(sku, (None, 0))[1]
+        if change:
+            ledger_rows.append({"medicine_id": medicine_id, "change_amount": change,
+                                "action_type": "ADD" if change > 0 else "ADJUST", "timestamp": now, "note": note})
+    if ledger_rows:
+        session.execute(insert(Transaction.__table__), ledger_rows)  # executemany
+        analytics.record_transactions(session, ledger_rows)
+
+
+def import_medicines(session: Session, lines: Iterable[str], batch_size: int = IMPORT_BATCH_SIZE,
+                     max_errors: int = 1000) -> dict:
+    """Upsert medicines from CSV (export format) keyed on the SKU constraint.
+
+    Invalid rows are skipped and reported; valid ones are written in
+    executemany batches and committed once at the end.
+    """
+    reader = csv.DictReader(lines)
+    missing = [c for c in ('Name', 'Potency', 'Batch', 'Expiry', 'MRP') if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+    count_before = session.exec(select(func.count()).select_from(HomeopathicMedicine)).one()
+    errors = []
+    error_count = 0
+    processed = 0
+    pending = []
+    for row in reader:
+        try:
+            pending.append(_parse_row(row))
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < max_errors:
+                # reader.line_num counts the header, so it matches the file's line
+                errors.append({"line": reader.line_num, "error": str(e)})
+            continue
+        if len(pending) >= batch_size:
+            _upsert(session, pending)
+            processed += len(pending)
+            pending = []
+    if pending:
+        _upsert(session, pending)
+        processed += len(pending)
+
+    count_after = session.exec(select(func.count()).select_from(HomeopathicMedicine)).one()
+    inserted = count_after - count_before
+    # Quantities and prices changed wholesale: recount the summary in one pass
+    summary.rebuild_summary(session)
+    return {
+        "processed": processed,
+        "inserted": inserted,
+        "updated": processed - inserted,
+        "error_count": error_count,
+        "errors": errors,
+    }
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+from datetime import date
+from typing import AsyncIterator, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from .models import InventorySummary
+from . import changes, summary
+from .maintenance import get_status as get_maintenance_status
+
+# Live updates over Server-Sent Events.
+# Every commit on the watched engine wakes one pump task, which reads the
+# change log once and fans the result out to all subscriber queues, so a
+# dozen open dashboards cost one query per commit, not twelve. Each event
+# carries the change-log cursor as its SSE id: a reconnecting browser sends
+# it back as Last-Event-ID and resumes where it left off. A subscriber that
+# falls too far behind is dropped and resumes the same way.
+
+HEARTBEAT_SECONDS = float(os.environ.get("HOMEOVAULT_SSE_HEARTBEAT", "15"))
+RETRY_MS = 3000 # browser reconnect delay
+QUEUE_SIZE = 1000 # events buffered per subscriber before it is dropped
+
+_hubs = weakref.WeakSet() # one per open store, see stores.py
+
+
+def format_event(name: str, data, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(jsonable_encoder(data), separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def _counters(session: Session) -> Optional[dict]:
+    row = session.get(InventorySummary, summary.SUMMARY_ID)
+    if row is None:
+        return None
+    return {
+        "total_skus": row.total_skus,
+        "total_units": row.total_units,
+        "stock_value_purchase": row.stock_value_purchase,
+        "stock_value_mrp": row.stock_value_mrp,
+        "expired_count": row.expired_count,
+        "expiring_count": row.expiring_count,
+        "low_stock_count": row.low_stock_count,
+        "as_of": row.as_of,
+        "updated_at": row.updated_at,
+    }
+
+
+def _alerts(upserts: list) -> Optional[dict]:
+    today = date.today()
+    low = [m for m in upserts if m.quantity <= m.low_stock_threshold]
+    expired = [m for m in upserts if m.expiry_date < today]
+    if not low and not expired:
+        return None
+    brief = lambda m: {"id": m.id, "medicine_name": m.medicine_name, "potency": m.potency,
+                       "batch_number": m.batch_number, "quantity": m.quantity, "expiry_date": m.expiry_date}
+    return {"low_stock": [brief(m) for m in low], "expired": [brief(m) for m in expired]}
+
+
+def _delta_events(delta: dict) -> list:
+    """SSE frames for one changes_since() result."""
+    frames = [format_event("changes", delta, delta["cursor"])]
+    alerts = _alerts(delta["upserts"])
+    if alerts:
+        frames.append(format_event("alert", alerts))
+    return frames
+
+
+class EventHub:
+    """In-process pub/sub between committing threads and SSE streams."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = set() # engines whose commits are broadcast
+        self._read_bind = None # engine the pump reads with
+        self._subscribers = set()
+        self._loop = None
+        self._wake = None
+        self._ready = None
+        self._pump = None
+        self._cursor = 0
+        self._version = None
+        _hubs.add(self)
+
+    def watch(self, source, read_bind=None):
+        """Broadcast commits made on ``source``, reading them back through
+        ``read_bind`` (the writer takes the write lock even to read)."""
+        self._sources.add(source)
+        self._read_bind = read_bind or source
+
+    def unwatch(self, source):
+        self._sources.discard(source)
+
+    def notify(self, bind):
+        # Called from whatever thread committed
+        if bind not in self._sources:
+            return
+        with self._lock:
+            loop, wake = self._loop, self._wake
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _read(self, since: Optional[int]):
+        with Session(self._read_bind) as session:
+            delta = changes.changes_since(session, since, changes.MAX_CHANGES)
+            version, _ = summary.current_version(session)
+            counters = _counters(session)
+        return delta, version, counters
+
+    def _ensure_pump(self):
+        loop = asyncio.get_running_loop()
+        if self._pump is not None and not self._pump.done() and self._loop is loop:
+            return
+        with self._lock:
+            self._loop = loop
+            self._wake = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._pump = loop.create_task(self._run_pump())
+
+    async def _run_pump(self):
+        try:
+            delta, self._version, _ = await run_in_threadpool(self._read, None)
+            self._cursor = delta["cursor"]
+        finally:
+            # On failure streams go on to fail their own catch-up and reconnect
+            self._ready.set()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if not self._subscribers:
+                continue
+            more = True
+            while more:
+                since = self._cursor
+                try:
+                    delta, version, counters = await run_in_threadpool(self._read, since)
+                except Exception as e:
+                    # Retried on the next commit
+                    print(f"Event Pump Error: {e}")
+                    break
+                more = delta["more"]
+                frames = []
+                if delta["reset"]:
+                    frames.append(format_event("reset", {"cursor": delta["cursor"]}, delta["cursor"]))
+                elif delta["cursor"] != since:
+                    frames.extend(_delta_events(delta))
+                if version != self._version and counters is not None:
+                    frames.append(format_event("summary", counters))
+                self._cursor, self._version = delta["cursor"], version
+                if frames:
+                    self._publish(since, delta["cursor"], frames)
+
+    def _publish(self, since: int, cursor: int, frames: list):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((since, cursor, frames))
+            except asyncio.QueueFull:
+                # Too slow: end its stream, it resumes from its last id
+                self._subscribers.discard(queue)
+
+    async def _catch_up(self, cursor: Optional[int]):
+        """Frames for everything after ``cursor`` read from the database, and the new cursor."""
+        frames = []
+        while True:
+            delta, _, counters = await run_in_threadpool(self._read, cursor)
+            if delta["reset"]:
+                frames.append(format_event("reset", {"cursor": delta["cursor"]}, delta["cursor"]))
+            elif delta["cursor"] != cursor:
+                frames.extend(_delta_events(delta))
+            cursor = delta["cursor"]
+            if not delta["more"]:
+                break
+        if counters is not None:
+            frames.append(format_event("summary", counters))
+        return frames, cursor
+
+    async def stream(self, since: Optional[int], heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+        """SSE frames for one client, starting after cursor ``since``."""
+        self._ensure_pump()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # Subscribe before catching up, so nothing committed in between is lost
+        self._subscribers.add(queue)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            health = get_maintenance_status()
+            yield format_event("health", {"status": "ok", "maintenance": health})
+
+            # Catch up from the database (a fresh client just gets a cursor).
+            # After the pump has its cursor, so it publishes everything after ours.
+            await self._ready.wait()
+            frames, cursor = await self._catch_up(since)
+            for frame in frames:
+                yield frame
+
+            while queue in self._subscribers or not queue.empty():
+                try:
+                    event_since, event_cursor, frames = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    status = get_maintenance_status()
+                    if status != health:
+                        health = status
+                        yield format_event("health", {"status": "ok", "maintenance": health})
+                    else:
+                        yield ": ping\n\n"
+                    continue
+                if event_since > cursor:
+                    # The pump moved on before we subscribed: fill the gap
+                    frames, cursor = await self._catch_up(cursor)
+                elif event_cursor < cursor or event_since < cursor == event_cursor:
+                    continue # already sent during catch-up
+                else:
+                    cursor = event_cursor
+                for frame in frames:
+                    yield frame
+        finally:
+            self._subscribers.discard(queue)
+
+
+hub = EventHub()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    bind = session.get_bind()
+    for each in list(_hubs):
+        each.notify(bind)
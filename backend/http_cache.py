@@ -0,0 +1,80 @@
+import hashlib
+import json
+from datetime import date, datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlmodel import Session
+
+from . import summary
+from .stores import DEFAULT_STORE, store_id
+
+# Conditional GETs for the read endpoints.
+# Every inventory write bumps InventoryVersion in its own transaction, so
+# "nothing changed since version N" is one primary-key read. The ETag is that
+# version plus today's date, because expiry flags and the analytics windows
+# move at midnight even when nothing is written. Responses carry
+# "Cache-Control: no-cache": clients may keep them but must revalidate, and
+# an unchanged resource costs a 304 with no body. Branch stores count their
+# versions separately, so their ETags also carry the store id.
+
+CACHE_CONTROL = "no-cache"
+
+
+def _days() -> str:
+    # Expiry checks use the local date, ledger analytics the UTC date
+    local = date.today()
+    utc = datetime.utcnow().date()
+    return f"{local:%Y%m%d}" if local == utc else f"{local:%Y%m%d}-{utc:%Y%m%d}"
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): compressed variants still match
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, etag: str,
+                 last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """Put the validators on ``response``; return a 304 to send instead when
+    the client's copy is still current."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _matches(if_none_match, etag)
+    elif last_modified is not None and "if-modified-since" in request.headers:
+        # Only consulted without If-None-Match, and only to the second
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+            fresh = last_modified.replace(microsecond=0) <= since
+        except (TypeError, ValueError):
+            fresh = False
+    else:
+        fresh = False
+    return Response(status_code=304, headers=headers) if fresh else None
+
+
+def check_inventory(request: Request, response: Response, session: Session) -> Optional[Response]:
+    """Validators for responses derived from inventory/ledger data."""
+    version, updated_at = summary.current_version(session)
+    midnight = datetime.combine(date.today(), time.min).astimezone(timezone.utc)
+    last_modified = midnight
+    if updated_at is not None:
+        # updated_at is naive UTC
+        last_modified = max(midnight, updated_at.replace(tzinfo=timezone.utc))
+    store = store_id(request)
+    tag = f"{version}-{_days()}" if store == DEFAULT_STORE else f"{store}-{version}-{_days()}"
+    return not_modified(request, response, f'W/"{tag}"', last_modified)
+
+
+def check_content(request: Request, response: Response, content) -> Optional[Response]:
+    """Validators from a hash of the payload itself (for small, volatile responses)."""
+    digest = hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return not_modified(request, response, f'W/"{digest}"')
@@ -0,0 +1,343 @@
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, insert, update
+from sqlmodel import Session, select
+
+from .models import HomeopathicMedicine, MedicineBulk, SkuSale, Transaction, TransactionBatch, SKU_COLUMNS
+from . import analytics, summary
+
+# Stock mutations shared by the transaction endpoints.
+# Everything here only stages work on the session; the caller owns the commit
+# so several changes can share one database transaction.
+
+BULK_LOOKUP_CHUNK = 500 # batch numbers per IN (...) when looking for existing SKUs
+
+
+def _validate(medicine: HomeopathicMedicine):
+    # 1. Validate MRP and Price
+    if medicine.mrp <= 0:
+        raise HTTPException(status_code=400, detail="MRP must be greater than 0.")
+    if medicine.purchase_price < 0:
+        raise HTTPException(status_code=400, detail="Purchase Price cannot be negative.")
+    if medicine.purchase_price > medicine.mrp:
+        # Warn? For now, we'll allow it but it's suspicious. PRD "Prevent zero or negative pricing" is met.
+        pass
+
+    # 2. Validate Expiry (Warning context essentially, handled by Frontend predominantly, but we ensure it's a date)
+    # If adding already expired medicine?
+    # Ensure conversion if it comes as string (SQLModel/Pydantic quirk sometimes)
+    exp_date = medicine.expiry_date
+    if isinstance(exp_date, str):
+        exp_date = datetime.strptime(exp_date, "%Y-%m-%d").date()
+        medicine.expiry_date = exp_date
+
+    if exp_date < date.today():
+        # strict mode: might reject. PRD says "Warn". We'll allow it (maybe logging historical stock)
+        pass
+
+
+def add_medicine(session: Session, medicine: HomeopathicMedicine) -> HomeopathicMedicine:
+    """Validate a new batch and stage it (caller commits)."""
+    _validate(medicine)
+
+    # 3. Check for duplicates based on SKU fields
+    statement = select(HomeopathicMedicine).where(
+        HomeopathicMedicine.medicine_name == medicine.medicine_name,
+        HomeopathicMedicine.potency == medicine.potency,
+        HomeopathicMedicine.form == medicine.form,
+        HomeopathicMedicine.bottle_size == medicine.bottle_size,
+        HomeopathicMedicine.manufacturer == medicine.manufacturer,
+        HomeopathicMedicine.batch_number == medicine.batch_number
+    )
+    existing = session.exec(statement).first()
+    if existing:
+        raise HTTPException(status_code=400, detail="Medicine with this Batch/SKU already exists.")
+
+    session.add(medicine)
+    summary.record_medicine(session, medicine, +1)
+    return medicine
+
+
+def _bulk_values(medicine: HomeopathicMedicine) -> dict:
+    # Items nested in a request body are not validated by SQLModel: coerce
+    # them here and reject what doesn't parse, item by item
+    def text(column):
+        value = getattr(medicine, column, None)
+        return "" if value is None else str(value).strip()
+
+    try:
+        values = {column: text(column) for column in SKU_COLUMNS}
+        values.update({
+            "expiry_date": getattr(medicine, "expiry_date", None),
+            "mrp": Decimal(str(medicine.mrp)),
+            "purchase_price": Decimal(str(medicine.purchase_price)),
+            "quantity": int(medicine.quantity),
+            "low_stock_threshold": int(medicine.low_stock_threshold),
+        })
+    except (TypeError, ValueError, InvalidOperation):
+        raise HTTPException(status_code=400, detail="Prices and quantities must be numbers.")
+    for column in SKU_COLUMNS:
+        if not values[column]:
+            raise HTTPException(status_code=400, detail=f"Missing '{column}'")
+    if values["quantity"] < 0:
+        raise HTTPException(status_code=400, detail="Quantity cannot be negative.")
+    checked = HomeopathicMedicine(**values)
+    try:
+        _validate(checked)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Expiry must be YYYY-MM-DD.")
+    values["expiry_date"] = checked.expiry_date
+    return values
+
+
+def _existing_skus(session: Session, skus) -> dict:
+    """{sku: id} for the SKUs that are already in the catalogue.
+
+    batch_number is indexed and close to unique, so one IN (...) per chunk
+    finds every candidate; the full SKU is compared here.
+    """
+    M = HomeopathicMedicine
+    batch_numbers = sorted({sku[-1] for sku in skus})
+    found = {}
+    for start in range(0, len(batch_numbers), BULK_LOOKUP_CHUNK):
+        rows = session.exec(
+            select(M.id, *[getattr(M, c) for c in SKU_COLUMNS])
+            .where(M.batch_number.in_(batch_numbers[start:start + BULK_LOOKUP_CHUNK]))
+        ).all()
+        for row in rows:
+            found[tuple(row[1:])] = row[0]
+    return {sku: found[sku] for sku in skus if sku in found}
+
+
+def bulk_add_medicines(session: Session, bulk: MedicineBulk) -> dict:
+    """Create (or with ``bulk.upsert``, restock) many batches at once.
+
+    Existing SKUs are found with a few set-based lookups, then new batches,
+    restocks and their ADD ledger rows are each written with one executemany.
+    Invalid items are reported and skipped; the rest go in together (caller
+    commits). Returns counts and one outcome per item, in request order.
+    """
+    M = HomeopathicMedicine.__table__
+    results = [None] * len(bulk.items)
+    valid = {} # sku -> (index, values)
+    for index, item in enumerate(bulk.items):
+        try:
+            values = _bulk_values(item)
+        except HTTPException as e:
+            results[index] = {"index": index, "status": "error", "detail": e.detail}
+            continue
+        sku = tuple(values[c] for c in SKU_COLUMNS)
+        if sku in valid:
+            results[index] = {"index": index, "status": "error", "detail": f"Same Batch/SKU as item {valid[sku][0]}."}
+            continue
+        valid[sku] = (index, values)
+
+    existing = _existing_skus(session, valid.keys())
+    inserts, updates = [], []
+    for sku, (index, values) in valid.items():
+        if sku not in existing:
+            inserts.append((index, values))
+        elif bulk.upsert:
+            updates.append((index, existing[sku], values))
+        else:
+            results[index] = {"index": index, "status": "duplicate", "id": existing[sku],
+                              "detail": "Medicine with this Batch/SKU already exists."}
+
+    now = datetime.utcnow()
+    connection = session.connection()
+    ledger = []
+    if inserts:
+        rows = [dict(values, created_at=now, last_updated=now) for _, values in inserts]
+        ids = connection.execute(
+            insert(M).returning(M.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for (index, values), medicine_id in zip(inserts, ids):
+            results[index] = {"index": index, "status": "created", "id": medicine_id}
+            ledger.append((medicine_id, values["quantity"]))
+    if updates:
+        # Delivered units are added to the stock; prices and expiry are replaced
+        connection.execute(
+            update(M).where(M.c.id == bindparam("b_id")).values(
+                quantity=M.c.quantity + bindparam("b_quantity"),
+                expiry_date=bindparam("b_expiry_date"),
+                mrp=bindparam("b_mrp"),
+                purchase_price=bindparam("b_purchase_price"),
+                low_stock_threshold=bindparam("b_low_stock_threshold"),
+                last_updated=now,
+            ),
+            [
+                {"b_id": medicine_id, "b_quantity": values["quantity"], "b_expiry_date": values["expiry_date"],
+                 "b_mrp": values["mrp"], "b_purchase_price": values["purchase_price"],
+                 "b_low_stock_threshold": values["low_stock_threshold"]}
+                for _, medicine_id, values in updates
+            ],
+        )
+        for index, medicine_id, values in updates:
+            results[index] = {"index": index, "status": "updated", "id": medicine_id}
+            ledger.append((medicine_id, values["quantity"]))
+
+    ledger_rows = [
+        {"medicine_id": medicine_id, "change_amount": quantity, "action_type": "ADD",
+         "timestamp": now, "note": bulk.note}
+        for medicine_id, quantity in ledger if quantity > 0
+    ]
+    if ledger_rows:
+        connection.execute(insert(Transaction.__table__), ledger_rows)
+        analytics.record_transactions(session, ledger_rows)
+    if inserts or updates:
+        # Many rows changed at once: recount the summary in one pass
+        summary.rebuild_summary(session)
+
+    statuses = [r["status"] for r in results]
+    return {
+        "created": statuses.count("created"),
+        "updated": statuses.count("updated"),
+        "duplicates": statuses.count("duplicate"),
+        "errors": statuses.count("error"),
+        "results": results,
+    }
+
+
+def remove_medicine(session: Session, medicine_id: int):
+    """Stage the deletion of a batch (caller commits)."""
+    medicine = session.get(HomeopathicMedicine, medicine_id)
+    if not medicine:
+        raise HTTPException(status_code=404, detail="Medicine not found")
+    session.delete(medicine)
+    summary.record_medicine(session, medicine, -1)
+
+
+def is_override(note) -> bool:
+    # PRD: "Expired medicines must not be sellable without override confirmation."
+    return bool(note) and "OVERRIDE" in note
+
+
+def apply_stock_change(session: Session, transaction: Transaction) -> int:
+    """Apply ``transaction.change_amount`` to its medicine and stage the ledger row.
+
+    The stock check and the update are a single conditional UPDATE, so two
+    concurrent sales can never both pass the check against the same stale
+    quantity. Returns the new quantity or raises HTTPException.
+    """
+    change = transaction.change_amount
+    conditions = [
+        HomeopathicMedicine.id == transaction.medicine_id,
+        HomeopathicMedicine.quantity + change >= 0,
+    ]
+    if change < 0 and not is_override(transaction.note):
+        conditions.append(HomeopathicMedicine.expiry_date >= date.today())
+
+    statement = (
+        update(HomeopathicMedicine)
+        .where(*conditions)
+        .values(quantity=HomeopathicMedicine.quantity + change, last_updated=datetime.utcnow())
+        .returning(
+            HomeopathicMedicine.quantity,
+            HomeopathicMedicine.low_stock_threshold,
+            HomeopathicMedicine.mrp,
+            HomeopathicMedicine.purchase_price,
+        )
+    )
+    row = session.execute(
+        statement, execution_options={"synchronize_session": False}
+    ).one_or_none()
+    if row is None:
+        raise _rejection(session, transaction)
+
+    new_quantity, threshold, mrp, purchase_price = row
+    summary.record_stock_change(session, new_quantity, change, threshold, mrp, purchase_price)
+    session.add(transaction)
+    analytics.record_transaction(session, transaction)
+    return new_quantity
+
+
+def apply_batch(session: Session, batch: TransactionBatch) -> list:
+    """Apply every line of an invoice; any rejected line fails the whole batch.
+
+    Caller commits (or rolls back on error).
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch has no line items.")
+    results = []
+    for line_no, transaction in enumerate(batch.items, start=1):
+        if transaction.note is None:
+            transaction.note = batch.note
+        try:
+            new_quantity = apply_stock_change(session, transaction)
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Line {line_no}: {e.detail}")
+        results.append({"medicine_id": transaction.medicine_id, "new_quantity": new_quantity})
+    return results
+
+
+def _rejection(session: Session, transaction: Transaction) -> HTTPException:
+    # The UPDATE matched nothing; work out which rule it tripped.
+    medicine = session.get(HomeopathicMedicine, transaction.medicine_id, populate_existing=True)
+    if not medicine:
+        return HTTPException(status_code=404, detail="Medicine not found")
+    if medicine.quantity + transaction.change_amount < 0:
+        return HTTPException(status_code=400, detail="Insufficient stock. Cannot reduce below zero.")
+    return HTTPException(status_code=400, detail="Cannot sell expired medicine. Add 'OVERRIDE' to notes to force.")
+
+
+def sell_fefo(session: Session, sale: SkuSale) -> list:
+    """Sell ``sale.quantity`` units of a SKU, first-expiry-first-out.
+
+    Unexpired batches are drained in expiry order (one ledger row per batch
+    touched). Every decrement goes through apply_stock_change, so a batch
+    emptied by a concurrent sale is re-read and the shortfall carried to the
+    next batch rather than oversold. Caller commits.
+    """
+    if sale.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be greater than 0.")
+
+    M = HomeopathicMedicine
+    statement = select(M.id, M.batch_number, M.expiry_date).where(
+        M.medicine_name == sale.medicine_name,
+        M.potency == sale.potency,
+        M.form == sale.form,
+        M.bottle_size == sale.bottle_size,
+        M.expiry_date >= date.today(),
+        M.quantity > 0,
+    )
+    if sale.manufacturer:
+        statement = statement.where(M.manufacturer == sale.manufacturer)
+    batches = session.exec(statement.order_by(M.expiry_date, M.id)).all()
+
+    remaining = sale.quantity
+    allocations = []
+    for medicine_id, batch_number, expiry_date in batches:
+        while remaining > 0:
+            available = session.exec(select(M.quantity).where(M.id == medicine_id)).one()
+            take = min(remaining, available)
+            if take <= 0:
+                break
+            transaction = Transaction(
+                medicine_id=medicine_id, change_amount=-take, action_type="SELL", note=sale.note
+            )
+            try:
+                new_quantity = apply_stock_change(session, transaction)
+            except HTTPException as e:
+                if e.status_code == 400 and e.detail.startswith("Insufficient stock"):
+                    continue  # sold from under us; re-read what is left
+                raise
+            remaining -= take
+            allocations.append({
+                "medicine_id": medicine_id,
+                "batch_number": batch_number,
+                "expiry_date": expiry_date,
+                "quantity": take,
+                "new_quantity": new_quantity,
+            })
+            break
+        if remaining == 0:
+            break
+
+    if remaining > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient stock. Only {sale.quantity - remaining} unexpired units of this SKU available.",
+        )
+    return allocations
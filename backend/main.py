@@ -1,18 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+# First, so the startup timeline also covers the imports below
+from . import startup
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, UploadFile, File
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlmodel import Session, select
-from typing import List, Optional
+from sqlmodel import Session
+from typing import Optional
 from datetime import datetime, date
 from decimal import Decimal
-import shutil
 import os
-import csv
 import io
-import webbrowser
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from .models import HomeopathicMedicine, Transaction, create_db_and_tables, get_session, engine
+from .models import HomeopathicMedicine, MedicineBulk, Transaction, TransactionBatch, SkuSale, StoreCreate, create_db_and_tables, describe_engine, engine, writer_engine, sqlite_file_name, DB_MODE
+from .inventory import add_medicine, bulk_add_medicines, remove_medicine, apply_stock_change, apply_batch, sell_fefo
+from . import summary, analytics, metrics, http_cache, changes, events, queries, serialize, backups, archive, cache, chain, stores, reorder, sale_queue
+from .stores import Store, current_store, get_session, get_write_session
+from .search import search_medicines
+from .maintenance import start_startup_maintenance, get_status as get_maintenance_status
+
+startup.mark("imports")
 
 app = FastAPI()
 
@@ -29,207 +36,446 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Profile-Id", "ETag", "Last-Modified"],
 )
+# Brotli when the optional brotli-asgi package is installed (it falls back to
+# gzip for clients without br), plain gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1000)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+# Outermost, so latency includes every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine, "reader")
+metrics.instrument_engine(writer_engine, "writer")
+# Commits on the writer are pushed to /api/events subscribers
+events.hub.watch(writer_engine, read_bind=engine)
 
 # Startup event to create tables and backup
 current_dir = os.path.dirname(os.path.abspath(__file__))
+backup_dir = os.environ.get("HOMEOVAULT_BACKUP_DIR", os.path.join(current_dir, "../backups"))
+# Also backs up every branch store, into backups/stores/<id>/
+backup_scheduler = backups.BackupScheduler(sqlite_file_name, backup_dir, engine, writer_engine,
+                                           registry=stores.registry, archive_dir=archive.ARCHIVE_DIR)
 
 @app.on_event("startup")
 def on_startup():
-    # 1. Create DB and Tables
+    # 1. Create DB and Tables (the only step the first request needs)
     create_db_and_tables()
-    
-    # 2. Automatic Backup
-    db_path = os.path.join(current_dir, "../database/inventory.db")
-    backup_dir = os.path.join(current_dir, "../backups")
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    if os.path.exists(db_path):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(backup_dir, f"inventory_backup_{timestamp}.db")
-        try:
-            shutil.copy2(db_path, backup_file)
-            print(f"Backup created: {backup_file}")
-            # Keep only last 10 backups to save space
-            backups = sorted([os.path.join(backup_dir, f) for f in os.listdir(backup_dir)])
-            if len(backups) > 10:
-                for b in backups[:-10]:
-                    os.remove(b)
-        except Exception as e:
-            print(f"Backup failed: {e}")
-
-    # 3. Phase 7: Data Integrity Check
-    try:
-        with Session(engine) as session:
-            # SQLModel doesn't expose raw connection easily for pragma, but we can execute text
-            from sqlalchemy import text
-            result = session.exec(text("PRAGMA integrity_check")).first()
-            # Result might be a tuple ('ok',) or string "ok" depending on driver/version
-            is_ok = result == "ok" or (isinstance(result, (tuple, list)) and result[0] == "ok")
-            
-            if not is_ok:
-                print(f"CRITICAL: Database Integrity Check Failed: {result}")
-            else:
-                print("Database Integrity Check: OK")
-    except Exception as e:
-        print(f"Integrity Check Error: {e}")
-
-    # 4. Phase 4: Startup Scan for Expiry/Health
-    with Session(engine) as session:
-        medicines = session.exec(select(HomeopathicMedicine)).all()
-        expired = [m for m in medicines if m.expiry_date < date.today()]
-        low_stock = [m for m in medicines if m.quantity <= m.low_stock_threshold]
-        
-        print(f"--- STARTUP HEALTH SCAN ---")
-        print(f"Total Medicines: {len(medicines)}")
-        print(f"Expired Batches: {len(expired)}")
-        if expired:
-            for m in expired:
-                print(f"  [EXPIRED] {m.medicine_name} ({m.potency}) Batch: {m.batch_number} Exp: {m.expiry_date}")
-        print(f"Low Stock Items: {len(low_stock)}")
-        print(f"---------------------------")
-    
-    # 5. Launch Browser
-    print("Launching Dashboard...")
-    try:
-        webbrowser.open("http://localhost:8000/index.html")
-    except Exception as e:
-        print(f"Could not open browser: {e}")
+    startup.mark("tables")
+    print(f"Database engine settings: {describe_engine()}")
+
+    # 2. Launch Browser once the server accepts connections
+    if startup.OPEN_BROWSER:
+        startup.on_ready(startup.open_dashboard)
+
+    # 3. Backup, integrity check and health scan run in the background a few
+    # seconds after that, so the dashboard loads first; progress is reported
+    # by /api/health
+    startup.defer(start_startup_maintenance, engine, sqlite_file_name, backup_dir, writer_engine, stores.registry)
+    # Further backups every HOMEOVAULT_BACKUP_INTERVAL minutes, see /api/backups
+    startup.defer(backup_scheduler.start)
+    # Branch stores unused for HOMEOVAULT_STORE_IDLE seconds are closed
+    startup.defer(stores.registry.start)
+    startup.start()
 
 # API Endpoints
 
 @app.get("/api/health")
-def health_check():
-    return {"status": "ok", "timestamp": datetime.now()}
+def health_check(request: Request, response: Response):
+    maintenance = get_maintenance_status()
+    # Unchanged while maintenance makes no progress (the timestamp is not part of the ETag)
+    cached = http_cache.check_content(request, response, {"status": "ok", "maintenance": maintenance})
+    if cached:
+        return cached
+    return {"status": "ok", "timestamp": datetime.now(), "maintenance": maintenance}
 
-@app.get("/api/medicines", response_model=List[HomeopathicMedicine])
-def read_medicines(session: Session = Depends(get_session)):
-    medicines = session.exec(select(HomeopathicMedicine)).all()
-    return medicines
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-@app.post("/api/medicines", response_model=HomeopathicMedicine)
-def create_medicine(medicine: HomeopathicMedicine, session: Session = Depends(get_session)):
-    # 1. Validate MRP and Price
-    if medicine.mrp <= 0:
-        raise HTTPException(status_code=400, detail="MRP must be greater than 0.")
-    if medicine.purchase_price < 0:
-        raise HTTPException(status_code=400, detail="Purchase Price cannot be negative.")
-    if medicine.purchase_price > medicine.mrp:
-        # Warn? For now, we'll allow it but it's suspicious. PRD "Prevent zero or negative pricing" is met.
-        pass
-
-    # 2. Validate Expiry (Warning context essentially, handled by Frontend predominantly, but we ensure it's a date)
-    # If adding already expired medicine?
-    # Ensure conversion if it comes as string (SQLModel/Pydantic quirk sometimes)
-    exp_date = medicine.expiry_date
-    if isinstance(exp_date, str):
-        exp_date = datetime.strptime(exp_date, "%Y-%m-%d").date()
-        medicine.expiry_date = exp_date
-
-    if exp_date < date.today():
-        # strict mode: might reject. PRD says "Warn". We'll allow it (maybe logging historical stock)
-        pass
-
-    # 3. Check for duplicates based on SKU fields
-    statement = select(HomeopathicMedicine).where(
-        HomeopathicMedicine.medicine_name == medicine.medicine_name,
-        HomeopathicMedicine.potency == medicine.potency,
-        HomeopathicMedicine.form == medicine.form,
-        HomeopathicMedicine.bottle_size == medicine.bottle_size,
-        HomeopathicMedicine.manufacturer == medicine.manufacturer,
-        HomeopathicMedicine.batch_number == medicine.batch_number
+@app.get("/api/metrics/cache")
+def read_cache_stats():
+    return cache.responses.stats()
+
+@app.get("/api/metrics/startup")
+def read_startup_timeline():
+    # Milliseconds from the first import to each startup stage
+    return startup.timeline()
+
+@app.get("/api/metrics/slow-queries")
+def read_slow_queries():
+    # Most recent first, with their EXPLAIN QUERY PLAN
+    return metrics.slow_queries()
+
+@app.get("/api/metrics/profiles")
+def read_profiles():
+    return metrics.list_profiles()
+
+@app.get("/api/metrics/profiles/{profile_id}")
+def read_profile(profile_id: str):
+    profile = metrics.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (profiles are kept for the last 50 profiled requests)")
+    return profile
+
+@app.get("/api/backups")
+def read_backups(verify: bool = Query(False, description="Recompute every checksum"),
+                 store: Store = Depends(current_store)):
+    return {"scheduler": backup_scheduler.status(), "backups": backup_scheduler.list(verify, store)}
+
+@app.post("/api/backups")
+def create_backup(store: Store = Depends(current_store)):
+    entry = backup_scheduler.run_once(reason="manual", force=True, store=store)
+    return {"status": "success", "backup": entry}
+
+@app.post("/api/backups/{name}/restore")
+def restore_backup(name: str, store: Store = Depends(current_store)):
+    result = backup_scheduler.restore(name, store)
+    return {"status": "success", **result}
+
+# Branch stores and chain-wide views (see stores.py and chain.py)
+
+@app.get("/api/stores")
+def read_stores():
+    return {"default": stores.DEFAULT_STORE, "stores": stores.registry.describe()}
+
+@app.post("/api/stores")
+def create_store(store: StoreCreate):
+    created = stores.registry.create(store.id)
+    return {"status": "success", "store": created.describe()}
+
+@app.get("/api/chain/summary")
+def read_chain_summary(expiring_within: int = Query(summary.EXPIRING_SOON_DAYS, ge=0)):
+    return chain.chain_summary(stores.registry, expiring_within)
+
+@app.get("/api/chain/stock")
+def read_chain_stock(
+    name: Optional[str] = Query(None, description="Case-insensitive name prefix"),
+    potency: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+):
+    # Sellable (unexpired) units of each product, per store
+    return chain.chain_stock(stores.registry, name, potency, limit)
+
+@app.get("/api/events")
+def stream_events(request: Request, since: Optional[int] = Query(None, ge=0), store: Store = Depends(current_store)):
+    # Server-Sent Events: changes, summary, alert and health events as they
+    # commit. A reconnecting EventSource resumes from its Last-Event-ID.
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        store.hub.stream(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/summary")
+def read_summary(
+    request: Request,
+    response: Response,
+    expiring_within: int = Query(summary.EXPIRING_SOON_DAYS, ge=0),
+    session: Session = Depends(get_session),
+    write_session: Session = Depends(get_write_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    # The write session is only used by the once-a-day expiry rollover
+    return cache.responses.store(request, response, summary.get_summary(session, write_session, expiring_within))
+
+@app.get("/api/search")
+def search(request: Request, response: Response, q: str = "", limit: int = Query(20, ge=1, le=100),
+           session: Session = Depends(get_session)):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    # Typeahead: substring matches first, then tolerant (misspelling) matches
+    return cache.responses.store(request, response, search_medicines(session, q, limit))
+
+@app.get("/api/changes")
+def read_changes(
+    since: Optional[int] = Query(None, ge=0, description="Cursor from the previous response"),
+    limit: int = Query(1000, ge=1, le=changes.MAX_CHANGES),
+    session: Session = Depends(get_session),
+):
+    # Delta sync: medicines created/updated/deleted after the cursor.
+    # Without a cursor (or with a stale one) the client is told to reload.
+    return changes.changes_since(session, since, limit)
+
+@app.get("/api/medicines", responses=serialize.list_responses(serialize.MEDICINE_NAMES, HomeopathicMedicine))
+def read_medicines(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    sort: str = "name",
+    name: Optional[str] = Query(None, description="Case-insensitive name prefix"),
+    potency: Optional[str] = None,
+    form: Optional[str] = None,
+    manufacturer: Optional[str] = None,
+    expired: Optional[bool] = None,
+    low_stock: Optional[bool] = None,
+    expiring_within: Optional[int] = Query(None, ge=0, description="Expired or expiring within N days"),
+    format: serialize.Format = Query("rows", description="columns: one array per field"),
+    session: Session = Depends(get_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    statement, sort_key = queries.medicine_list(
+        limit, cursor, sort, name, potency, form, manufacturer, expired, low_stock, expiring_within
     )
-    existing = session.exec(statement).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Medicine with this Batch/SKU already exists.")
+    values, next_cursor = queries.medicine_page(session.exec(statement).all(), limit, sort_key)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return cache.responses.store(request, response, serialize.shape(serialize.MEDICINE_NAMES, values, format), encode=False)
 
-    session.add(medicine)
+@app.post("/api/medicines", response_model=HomeopathicMedicine)
+def create_medicine(medicine: HomeopathicMedicine, session: Session = Depends(get_write_session)):
+    add_medicine(session, medicine)
     session.commit()
     session.refresh(medicine)
     return medicine
 
+@app.post("/api/medicines/bulk")
+def create_medicines_bulk(bulk: MedicineBulk, session: Session = Depends(get_write_session)):
+    # A whole delivery in one transaction; see inventory.bulk_add_medicines
+    try:
+        report = bulk_add_medicines(session, bulk)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {"status": "success", **report}
+
 @app.delete("/api/medicines/{medicine_id}")
-def delete_medicine(medicine_id: int, session: Session = Depends(get_session)):
-    medicine = session.get(HomeopathicMedicine, medicine_id)
-    if not medicine:
-        raise HTTPException(status_code=404, detail="Medicine not found")
-    session.delete(medicine)
+def delete_medicine(medicine_id: int, session: Session = Depends(get_write_session)):
+    remove_medicine(session, medicine_id)
     session.commit()
     return {"status": "success", "message": "Medicine deleted"}
 
 @app.post("/api/transaction")
-def create_transaction(transaction: Transaction, session: Session = Depends(get_session)):
-    medicine = session.get(HomeopathicMedicine, transaction.medicine_id)
-    if not medicine:
-        raise HTTPException(status_code=404, detail="Medicine not found")
-    
-    # Validation: Prevent negative stock
-    if medicine.quantity + transaction.change_amount < 0:
-        raise HTTPException(status_code=400, detail="Insufficient stock. Cannot reduce below zero.")
-    
-    # Validation: Expiry Check on SELL
-    if transaction.change_amount < 0: # Selling
-        if medicine.expiry_date < date.today():
-             # PRD: "Expired medicines must not be sellable without override confirmation."
-             # We need a flag in transaction payload to override.
-             # For now, we block it unless "note" contains "OVERRIDE"
-             if not transaction.note or "OVERRIDE" not in transaction.note:
-                 raise HTTPException(status_code=400, detail="Cannot sell expired medicine. Add 'OVERRIDE' to notes to force.")
-
-    # Update inventory
-    medicine.quantity += transaction.change_amount
-    medicine.last_updated = datetime.utcnow()
-    
-    session.add(medicine)
-    session.add(transaction)
+def create_transaction(transaction: Transaction, session: Session = Depends(get_write_session),
+                       store: Store = Depends(current_store)):
+    # Stock, negative-stock and expiry checks happen in one conditional UPDATE
+    if sale_queue.GROUP_COMMIT:
+        # Committed together with the other sales queued meanwhile
+        new_quantity = store.sales().run(lambda s: apply_stock_change(s, transaction))
+    else:
+        new_quantity = apply_stock_change(session, transaction)
+        session.commit()
+    return {"status": "success", "new_quantity": new_quantity}
+
+@app.post("/api/transactions/batch")
+def create_transaction_batch(batch: TransactionBatch, session: Session = Depends(get_write_session)):
+    # All lines commit together or not at all
+    try:
+        results = apply_batch(session, batch)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {"status": "success", "count": len(results), "results": results}
+
+@app.post("/api/sell")
+def sell_by_sku(sale: SkuSale, session: Session = Depends(get_write_session), store: Store = Depends(current_store)):
+    # Batches are picked first-expiry-first-out and committed together
+    if sale_queue.GROUP_COMMIT:
+        allocations = store.sales().run(lambda s: sell_fefo(s, sale))
+        return {"status": "success", "quantity": sale.quantity, "allocations": allocations}
+    try:
+        allocations = sell_fefo(session, sale)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {"status": "success", "quantity": sale.quantity, "allocations": allocations}
+
+@app.get("/api/history", responses=serialize.list_responses(serialize.HISTORY_NAMES))
+def read_history(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    medicine_id: Optional[int] = None,
+    action_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: serialize.Format = Query("rows", description="columns: one array per field"),
+    session: Session = Depends(get_session),
+    store: Store = Depends(current_store),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    statement = queries.history_list(limit, cursor, medicine_id, action_type, since, until)
+    # Older pages continue into the yearly ledger archives
+    rows = archive.merge_history(session.exec(statement).all(), limit, cursor, medicine_id, action_type, since, until,
+                                 store.archive_dir)
+    values, next_cursor = queries.history_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return cache.responses.store(request, response, serialize.shape(serialize.HISTORY_NAMES, values, format), encode=False)
+
+@app.get("/api/ledger/archives")
+def read_ledger_archives(store: Store = Depends(current_store)):
+    return {"archive_after_days": archive.ARCHIVE_AFTER_DAYS, "archives": archive.describe(store.archive_dir)}
+
+@app.post("/api/ledger/archive")
+def run_ledger_archive(older_than_days: int = Query(archive.ARCHIVE_AFTER_DAYS, ge=1),
+                       store: Store = Depends(current_store)):
+    # Runs in batches on its own writer sessions, so sales continue meanwhile
+    result = archive.archive_ledger(store.writer, archive.default_cutoff(older_than_days), store.archive_dir)
+    return {"status": "success", **result}
+
+# Sales analytics (served from the DailySales rollup)
+
+@app.get("/api/analytics/sales")
+def analytics_sales(
+    request: Request,
+    response: Response,
+    bucket: str = Query("day", enum=list(analytics.BUCKETS)),
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    medicine_id: Optional[int] = None,
+    action_type: str = "SELL",
+    session: Session = Depends(get_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    return cache.responses.store(request, response, analytics.sales_series(session, bucket, since, until, medicine_id, action_type))
+
+@app.get("/api/analytics/velocity")
+def analytics_velocity(
+    request: Request,
+    response: Response,
+    days: int = Query(30, ge=1, le=3650),
+    medicine_id: Optional[int] = None,
+    session: Session = Depends(get_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    return cache.responses.store(request, response, analytics.velocity(session, days, medicine_id))
+
+@app.get("/api/analytics/movers")
+def analytics_movers(
+    request: Request,
+    response: Response,
+    days: int = Query(30, ge=1, le=3650),
+    limit: int = Query(10, ge=1, le=500),
+    direction: str = Query("fast", enum=["fast", "slow"]),
+    session: Session = Depends(get_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    return cache.responses.store(request, response, analytics.movers(session, days, limit, direction))
+
+@app.get("/api/analytics/stock-cover")
+def analytics_stock_cover(
+    request: Request,
+    response: Response,
+    days: int = Query(30, ge=1, le=3650),
+    limit: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    return cache.responses.store(request, response, analytics.stock_cover(session, days, limit))
+
+@app.post("/api/analytics/rebuild")
+def analytics_rebuild(session: Session = Depends(get_write_session), store: Store = Depends(current_store)):
+    buckets = analytics.rebuild_rollups(session, store.archive_dir)
+    reorder.refresh_demand(session, full=True) # averages over the old rollup are stale
+    session.commit()
+    return {"status": "success", "buckets": buckets}
+
+# Reorder suggestions (demand averages from the DailySales rollup)
+
+@app.get("/api/reorder")
+def read_reorder(
+    request: Request,
+    response: Response,
+    lead_days: int = Query(reorder.LEAD_DAYS, ge=0, le=365),
+    cover_days: int = Query(reorder.COVER_DAYS, ge=1, le=365),
+    service_level: float = Query(reorder.SERVICE_LEVEL, gt=0.5, lt=1),
+    manufacturer: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    session: Session = Depends(get_session),
+    write_session: Session = Depends(get_write_session),
+):
+    cached = http_cache.check_inventory(request, response, session) or cache.responses.lookup(request, response)
+    if cached:
+        return cached
+    # The write session is only used by the once-a-day demand refresh
+    return cache.responses.store(request, response, reorder.purchase_list(
+        session, write_session, lead_days, cover_days, service_level, manufacturer, limit))
+
+@app.post("/api/reorder/recompute")
+def recompute_reorder(full: bool = False, session: Session = Depends(get_write_session)):
+    result = reorder.refresh_demand(session, full=full)
     session.commit()
-    return {"status": "success", "new_quantity": medicine.quantity}
-
-@app.get("/api/history")
-def read_history(session: Session = Depends(get_session)):
-    # Join Transaction with HomeopathicMedicine to get names
-    statement = select(Transaction, HomeopathicMedicine.medicine_name, HomeopathicMedicine.batch_number).join(HomeopathicMedicine).order_by(Transaction.timestamp.desc()).limit(50)
-    results = session.exec(statement).all()
-    
-    # Format for frontend
-    history = []
-    for txn, name, batch in results:
-        history.append({
-            "id": txn.id,
-            "medicine_name": name,
-            "batch_number": batch,
-            "change": txn.change_amount,
-            "action_type": txn.action_type,
-            "timestamp": txn.timestamp,
-            "note": txn.note
-        })
-    return history
+    return {"status": "success", **result}
 
 @app.get("/api/export")
-def export_csv(session: Session = Depends(get_session)):
-    medicines = session.exec(select(HomeopathicMedicine)).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        'ID', 'Name', 'Potency', 'Form', 'Size', 'Manufacturer', 
-        'Batch', 'Expiry', 'MRP', 'Purchase Price', 'Quantity'
-    ])
-    
-    for m in medicines:
-        writer.writerow([
-            m.id, m.medicine_name, m.potency, m.form, m.bottle_size, 
-            m.manufacturer, m.batch_number, m.expiry_date, m.mrp, 
-            m.purchase_price, m.quantity
-        ])
-    
-    output.seek(0)
+def export_csv(gzip: bool = False, session: Session = Depends(get_session)):
+    from . import csv_io # only loaded once someone exports or imports
+    # Rows are fetched in batches and streamed as they are written
+    return _csv_response(csv_io.export_medicines(session.get_bind()), "inventory_export", gzip)
+
+@app.get("/api/export/transactions")
+def export_transactions_csv(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    session: Session = Depends(get_session),
+):
+    from . import csv_io
+    return _csv_response(csv_io.export_ledger(session.get_bind(), since, until), "transactions_export", gzip)
+
+def _csv_response(chunks, filename: str, gzip: bool):
+    from . import csv_io
+    if gzip:
+        return StreamingResponse(
+            csv_io.gzip_chunks(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f"attachment; filename={filename}.csv.gz"}
+        )
     return StreamingResponse(
-        iter([output.getvalue()]),
+        chunks,
         media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=inventory_export.csv"}
+        headers={"Content-Disposition": f"attachment; filename={filename}.csv"}
     )
 
+@app.post("/api/import")
+def import_csv(file: UploadFile = File(...), session: Session = Depends(get_write_session)):
+    # Parse the upload row by row; never read the whole file into memory
+    from . import csv_io
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        report = csv_io.import_medicines(session, lines)
+        session.commit()
+    except (ValueError, UnicodeDecodeError) as e:
+        session.rollback()
+        raise HTTPException(status_code=400, detail=f"Import failed: {e}")
+    except Exception:
+        session.rollback()
+        raise
+    return {"status": "success", **report}
+
+# HOMEOVAULT_DB_MODE=async: the medicine, transaction, history and export
+# routes are served by their async versions instead of the ones above
+if DB_MODE == "async":
+    from . import async_routes
+    async_routes.install(app)
+
 # Mount static files (Frontend)
 frontend_dir = os.path.join(current_dir, "../frontend")
 if not os.path.exists(frontend_dir):
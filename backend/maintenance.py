@@ -0,0 +1,259 @@
+import os
+import threading
+from datetime import date, datetime
+
+from sqlmodel import Session, select
+
+from .models import HomeopathicMedicine
+from . import analytics, archive, changes, reorder, summary
+from .backups import BRANCH_BACKUP_DIR, backup_database, take_snapshot, prune as prune_backups
+
+# Startup maintenance (backup, integrity check, health scan) runs in a
+# background thread so the server accepts requests immediately.
+# Progress is published through get_status() and shown at /api/health.
+# Branch stores (stores.py) get the same steps afterwards, one store at a
+# time, reported together under the "branch_stores" task.
+
+INTEGRITY_CHECK_MODE = os.environ.get("HOMEOVAULT_INTEGRITY_CHECK", "full")  # full | quick | off
+
+_status_lock = threading.Lock()
+_status = {"state": "idle", "tasks": {}}
+
+
+def get_status() -> dict:
+    with _status_lock:
+        return {"state": _status["state"], "tasks": {k: dict(v) for k, v in _status["tasks"].items()}}
+
+
+def _set_task(name: str, **fields):
+    with _status_lock:
+        task = _status["tasks"].setdefault(name, {"state": "pending", "progress": 0.0})
+        task.update(fields)
+
+
+def integrity_check(engine, mode: str = INTEGRITY_CHECK_MODE):
+    """Run PRAGMA integrity_check (or the much faster quick_check). Returns (ok, messages)."""
+    pragma = "quick_check" if mode == "quick" else "integrity_check"
+    with engine.connect() as conn:
+        messages = [row[0] for row in conn.exec_driver_sql(f"PRAGMA {pragma}")]
+    return messages == ["ok"], messages
+
+
+def health_scan(engine, today: date = None, sample: int = 20) -> dict:
+    """Expiry / low stock counts read from the maintained summary, not a table scan."""
+    today = today or date.today()
+    with Session(engine) as session:
+        counters = summary.rollover(session, today)
+        session.commit()
+        examples = session.exec(
+            select(HomeopathicMedicine.medicine_name, HomeopathicMedicine.potency,
+                   HomeopathicMedicine.batch_number, HomeopathicMedicine.expiry_date)
+            .where(HomeopathicMedicine.expiry_date < today)
+            .order_by(HomeopathicMedicine.expiry_date).limit(sample)
+        ).all()
+        return {
+            "total_medicines": counters.total_skus,
+            "expired_batches": counters.expired_count,
+            "low_stock_items": counters.low_stock_count,
+            "expired_examples": [
+                {"medicine_name": n, "potency": p, "batch_number": b, "expiry_date": e} for n, p, b, e in examples
+            ],
+        }
+
+
+def maintain_branch(store, backup_dir: str) -> dict:
+    """Every startup step for one branch store. Returns {step: detail}.
+
+    A failing step is reported (and printed) without skipping the rest.
+    """
+    steps = {}
+
+    def step(name, fn):
+        try:
+            steps[name] = fn()
+        except Exception as e:
+            steps[name] = f"failed: {e}"
+            print(f"Branch {store.id} {name} Error: {e}")
+
+    def backup():
+        branch_dir = os.path.join(backup_dir, BRANCH_BACKUP_DIR, store.id)
+        entry = take_snapshot(store.db_path, branch_dir, store.reader, reason="startup", archive_dir=store.archive_dir)
+        prune_backups(branch_dir)
+        return entry["name"] if entry else "unchanged since the last backup"
+
+    def ledger_archive():
+        if archive.ARCHIVE_AFTER_DAYS <= 0:
+            return "skipped"
+        result = archive.archive_ledger(store.writer, archive.default_cutoff(), store.archive_dir)
+        return f"{result['archived']} transactions archived"
+
+    def check():
+        if INTEGRITY_CHECK_MODE == "off":
+            return "skipped"
+        ok, messages = integrity_check(store.reader)
+        if not ok:
+            print(f"CRITICAL: Branch {store.id} Integrity Check Failed: {messages[:10]}")
+        return "ok" if ok else f"failed: {messages[:10]}"
+
+    def scan():
+        result = health_scan(store.writer)
+        return {k: v for k, v in result.items() if k != "expired_examples"}
+
+    def in_writer(fn):
+        def run():
+            with Session(store.writer) as session:
+                result = fn(session)
+                session.commit()
+            return result
+        return run
+
+    step("backup", backup)
+    step("ledger_archive", ledger_archive)
+    step("integrity_check", check)
+    step("health_scan", scan)
+    step("sales_rollup", in_writer(lambda s: "rebuilt from ledger" if analytics.ensure_rollups(s) else "up to date"))
+    step("demand_rates", in_writer(lambda s: "{advanced} updated, {added} added".format(**reorder.refresh_demand(s))))
+    step("changelog_prune", in_writer(lambda s: f"{changes.prune(s)} entries removed"))
+    return steps
+
+
+def run_startup_maintenance(engine, db_path: str, backup_dir: str, writer=None, registry=None):
+    with _status_lock:
+        _status["state"] = "running"
+        _status["tasks"] = {}
+    for name in ("backup", "ledger_archive", "integrity_check", "health_scan", "sales_rollup", "demand_rates",
+                 "changelog_prune", "branch_stores"):
+        _set_task(name)
+
+    # 1. Automatic Backup
+    if os.path.exists(db_path):
+        _set_task("backup", state="running", started_at=datetime.now())
+        try:
+            # Skipped when nothing changed since the newest backup
+            entry = take_snapshot(db_path, backup_dir, engine, reason="startup", archive_dir=archive.ARCHIVE_DIR,
+                                  progress=lambda p: _set_task("backup", progress=round(p, 3)))
+            prune_backups(backup_dir)
+            detail = entry["name"] if entry else "unchanged since the last backup"
+            _set_task("backup", state="done", progress=1.0, detail=detail, finished_at=datetime.now())
+            print(f"Backup: {detail}")
+        except Exception as e:
+            _set_task("backup", state="failed", detail=str(e), finished_at=datetime.now())
+            print(f"Backup failed: {e}")
+    else:
+        _set_task("backup", state="skipped", detail="No database file yet")
+
+    # 1b. Move old ledger rows to the yearly archives (after the backup, which still has them)
+    if archive.ARCHIVE_AFTER_DAYS <= 0:
+        _set_task("ledger_archive", state="skipped", detail="Disabled")
+    else:
+        _set_task("ledger_archive", state="running", started_at=datetime.now())
+        try:
+            result = archive.archive_ledger(writer or engine, archive.default_cutoff())
+            _set_task("ledger_archive", state="done", progress=1.0,
+                      detail=f"{result['archived']} transactions archived", finished_at=datetime.now())
+        except Exception as e:
+            _set_task("ledger_archive", state="failed", detail=str(e), finished_at=datetime.now())
+            print(f"Ledger Archive Error: {e}")
+
+    # 2. Data Integrity Check
+    if INTEGRITY_CHECK_MODE == "off":
+        _set_task("integrity_check", state="skipped", detail="Disabled")
+    else:
+        _set_task("integrity_check", state="running", mode=INTEGRITY_CHECK_MODE, started_at=datetime.now())
+        try:
+            ok, messages = integrity_check(engine)
+            _set_task("integrity_check", state="done" if ok else "failed", progress=1.0,
+                      detail=messages[:10], finished_at=datetime.now())
+            if ok:
+                print(f"Database Integrity Check ({INTEGRITY_CHECK_MODE}): OK")
+            else:
+                print(f"CRITICAL: Database Integrity Check Failed: {messages[:10]}")
+        except Exception as e:
+            _set_task("integrity_check", state="failed", detail=str(e), finished_at=datetime.now())
+            print(f"Integrity Check Error: {e}")
+
+    # 3. Startup Scan for Expiry/Health
+    _set_task("health_scan", state="running", started_at=datetime.now())
+    try:
+        # May roll the summary over to today, so it goes through the writer
+        scan = health_scan(writer or engine)
+        _set_task("health_scan", state="done", progress=1.0, detail=scan, finished_at=datetime.now())
+        print(f"--- STARTUP HEALTH SCAN ---")
+        print(f"Total Medicines: {scan['total_medicines']}")
+        print(f"Expired Batches: {scan['expired_batches']}")
+        for m in scan["expired_examples"]:
+            print(f"  [EXPIRED] {m['medicine_name']} ({m['potency']}) Batch: {m['batch_number']} Exp: {m['expiry_date']}")
+        print(f"Low Stock Items: {scan['low_stock_items']}")
+        print(f"---------------------------")
+    except Exception as e:
+        _set_task("health_scan", state="failed", detail=str(e), finished_at=datetime.now())
+        print(f"Health Scan Error: {e}")
+
+    # 4. Sales rollup for ledgers recorded before it existed
+    _set_task("sales_rollup", state="running", started_at=datetime.now())
+    try:
+        with Session(writer or engine) as session:
+            rebuilt = analytics.ensure_rollups(session)
+            session.commit()
+        _set_task("sales_rollup", state="done", progress=1.0,
+                  detail="rebuilt from ledger" if rebuilt else "up to date", finished_at=datetime.now())
+    except Exception as e:
+        _set_task("sales_rollup", state="failed", detail=str(e), finished_at=datetime.now())
+        print(f"Sales Rollup Error: {e}")
+
+    # 5. Demand averages for the reorder list, up to yesterday
+    _set_task("demand_rates", state="running", started_at=datetime.now())
+    try:
+        with Session(writer or engine) as session:
+            result = reorder.refresh_demand(session)
+            session.commit()
+        _set_task("demand_rates", state="done", progress=1.0,
+                  detail=f"{result['advanced']} updated, {result['added']} added", finished_at=datetime.now())
+    except Exception as e:
+        _set_task("demand_rates", state="failed", detail=str(e), finished_at=datetime.now())
+        print(f"Demand Rates Error: {e}")
+
+    # 6. Drop delta-sync entries older than the retention window
+    _set_task("changelog_prune", state="running", started_at=datetime.now())
+    try:
+        with Session(writer or engine) as session:
+            removed = changes.prune(session)
+            session.commit()
+        _set_task("changelog_prune", state="done", progress=1.0,
+                  detail=f"{removed} entries removed", finished_at=datetime.now())
+    except Exception as e:
+        _set_task("changelog_prune", state="failed", detail=str(e), finished_at=datetime.now())
+        print(f"Change Log Prune Error: {e}")
+
+    # 7. The same for every branch store
+    branch_ids = registry.ids()[1:] if registry is not None else []
+    if not branch_ids:
+        _set_task("branch_stores", state="skipped", detail="No branch stores")
+    else:
+        _set_task("branch_stores", state="running", started_at=datetime.now(), detail={})
+        failed = False
+        for done, store_id in enumerate(branch_ids, 1):
+            try:
+                with registry.use(store_id) as store:
+                    steps = maintain_branch(store, backup_dir)
+            except Exception as e:
+                steps = {"open": f"failed: {e}"}
+                print(f"Branch {store_id} Maintenance Error: {e}")
+            failed = failed or any(isinstance(v, str) and v.startswith("failed") for v in steps.values())
+            with _status_lock:
+                task = _status["tasks"]["branch_stores"]
+                task["detail"][store_id] = steps
+                task["progress"] = round(done / len(branch_ids), 3)
+        _set_task("branch_stores", state="failed" if failed else "done", finished_at=datetime.now())
+
+    with _status_lock:
+        _status["state"] = "done"
+
+
+def start_startup_maintenance(engine, db_path: str, backup_dir: str, writer=None, registry=None) -> threading.Thread:
+    thread = threading.Thread(
+        target=run_startup_maintenance, args=(engine, db_path, backup_dir, writer, registry),
+        name="homeovault-maintenance", daemon=True,
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,388 @@
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Request timing and SQL instrumentation, exported at /api/metrics in the
+# Prometheus text format.
+# - MetricsMiddleware times every request by route template (not raw path,
+#   so /api/medicines/17 and /api/medicines/18 share a series).
+# - instrument_engine() hooks the cursor events of an engine: statement
+#   latency, statements per request, and slow statements captured together
+#   with their EXPLAIN QUERY PLAN.
+# - TimedQueuePool measures how long a request waited for a pooled
+#   connection (the single writer connection is the usual suspect).
+# The request being served is tracked in a ContextVar, which Starlette copies
+# into the threadpool that runs sync endpoints and dependencies.
+#
+# Per-request profiling is opt-in: with HOMEOVAULT_PROFILING=1 a request
+# sent with "X-Profile: 1" gets a Server-Timing header and an X-Profile-Id;
+# the full profile (every statement, its plan, repeated statements) is then
+# served from /api/metrics/profiles/{id}.
+
+SLOW_QUERY_MS = float(os.environ.get("HOMEOVAULT_SLOW_QUERY_MS", "100"))
+PROFILING_ENABLED = os.environ.get("HOMEOVAULT_PROFILING", "0") == "1"
+SLOW_QUERIES_KEPT = 50
+PROFILES_KEPT = 50
+# A statement run this often in one request is likely an N+1 loop
+REPEATED_STATEMENT_THRESHOLD = 5
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple."""
+
+    def __init__(self, name: str, help_text: str, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, series in items:
+            label_text = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="+Inf"}} {series[-1]}'
+            yield f"{self.name}_sum{{{label_text}}} {series[-2]:.6f}"
+            yield f"{self.name}_count{{{label_text}}} {series[-1]}"
+
+
+class CounterMetric:
+    def __init__(self, name: str, help_text: str, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{{{_labels(self.label_names, labels)}}} {value}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+REQUEST_DURATION = Histogram(
+    "homeovault_http_request_duration_seconds", "Request latency by route template.",
+    ("method", "route"), LATENCY_BUCKETS)
+REQUESTS = CounterMetric(
+    "homeovault_http_requests_total", "Requests by route template and status code.",
+    ("method", "route", "status"))
+REQUEST_STATEMENTS = Histogram(
+    "homeovault_http_request_sql_statements", "SQL statements executed per request.",
+    ("method", "route"), COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram(
+    "homeovault_http_request_sql_seconds", "Time spent in SQL per request.",
+    ("method", "route"), LATENCY_BUCKETS)
+STATEMENT_DURATION = Histogram(
+    "homeovault_sql_statement_duration_seconds", "SQL statement latency by engine and verb.",
+    ("engine", "operation"), LATENCY_BUCKETS)
+SLOW_STATEMENTS = CounterMetric(
+    "homeovault_sql_slow_statements_total", "Statements slower than HOMEOVAULT_SLOW_QUERY_MS.",
+    ("engine", "route"))
+FULL_SCANS = CounterMetric(
+    "homeovault_sql_full_scans_total", "Explained statements whose plan scans a whole table.",
+    ("engine", "table"))
+POOL_WAIT = Histogram(
+    "homeovault_db_pool_wait_seconds", "Time spent waiting for a pooled connection.",
+    ("pool",), LATENCY_BUCKETS)
+POOL_TIMEOUTS = CounterMetric(
+    "homeovault_db_pool_timeouts_total", "Connection checkouts that gave up waiting.", ("pool",))
+CACHE_EVENTS = CounterMetric(
+    "homeovault_cache_events_total", "Response cache hits, misses, evictions, expirations and invalidations.",
+    ("cache", "event"))
+GROUP_COMMIT_BATCH = Histogram(
+    "homeovault_group_commit_batch_size", "Sales committed together by the group-commit queue.",
+    ("store",), COUNT_BUCKETS)
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+_engines = {}  # name -> engine, for the checked-out gauge
+_slow_queries = deque(maxlen=SLOW_QUERIES_KEPT)
+_profiles = {}
+_profile_order = deque()
+_profiles_lock = threading.Lock()
+
+
+class RequestStats:
+    __slots__ = ("scope", "statements", "sql_seconds", "pool_wait", "profile")
+
+    def __init__(self, scope, profile: bool = False):
+        self.scope = scope
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.pool_wait = 0.0
+        # Only filled in profiling mode: [(engine, sql, seconds, plan)]
+        self.profile = [] if profile else None
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope before the endpoint runs
+        return _route_label(self.scope)
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("homeovault_request", default=None)
+
+
+# --- Connection pool ---
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited.
+
+    The pool is labelled with the engine's ``pool_logging_name``.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        name = self._orig_logging_name or "default"
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc((name,))
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            POOL_WAIT.observe((name,), waited)
+            stats = _current.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+# --- SQL ---
+
+def _explain(cursor, statement, parameters):
+    try:
+        rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    except Exception as e:
+        return [f"(no plan: {e})"]
+    return [row[-1] for row in rows]
+
+
+def _scanned_tables(plan):
+    # "SCAN homeopathicmedicine" is a full table scan; "SCAN t USING INDEX"
+    # and "SCAN ... VIRTUAL TABLE" (FTS) walk an index instead
+    for detail in plan:
+        if detail.startswith("SCAN ") and "USING" not in detail and "VIRTUAL TABLE" not in detail:
+            yield detail.split()[1]
+
+
+def instrument_engine(target_engine, name: str):
+    """Time every statement run on ``target_engine``."""
+    _engines[name] = target_engine
+
+    @event.listens_for(target_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("homeovault_started", []).append(time.perf_counter())
+
+    @event.listens_for(target_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["homeovault_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+        STATEMENT_DURATION.observe((name, operation), elapsed)
+
+        stats = _current.get()
+        route = stats.route if stats is not None else "-"
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_seconds += elapsed
+
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+        profiling = stats is not None and stats.profile is not None
+        plan = None
+        if (slow or profiling) and not executemany and operation in ("SELECT", "WITH", "UPDATE", "DELETE"):
+            plan = _explain(cursor, statement, parameters)
+            for table in _scanned_tables(plan):
+                FULL_SCANS.inc((name, table))
+        if slow:
+            SLOW_STATEMENTS.inc((name, route))
+            _slow_queries.append({
+                "at": time.time(),
+                "engine": name,
+                "route": route,
+                "duration_ms": round(elapsed * 1000, 2),
+                "statement": statement,
+                "executemany": executemany,
+                "plan": plan,
+            })
+        if profiling:
+            stats.profile.append((name, statement, elapsed, plan))
+
+
+def forget_engine(name: str):
+    """Drop a disposed engine from the checked-out gauge."""
+    _engines.pop(name, None)
+
+
+def slow_queries() -> list:
+    return list(reversed(_slow_queries))
+
+
+# --- Requests ---
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        path = getattr(route, "path", "")
+        # The static frontend is mounted at "/": one series for all files
+        return path if path and getattr(route, "methods", None) else (getattr(route, "name", None) or "mount")
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", None) or "unmatched"
+
+
+def _store_profile(profile_id: str, profile: dict):
+    with _profiles_lock:
+        _profiles[profile_id] = profile
+        _profile_order.append(profile_id)
+        while len(_profile_order) > PROFILES_KEPT:
+            _profiles.pop(_profile_order.popleft(), None)
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> list:
+    with _profiles_lock:
+        return [
+            {"id": i, **{k: _profiles[i][k] for k in ("method", "path", "status", "duration_ms", "statements")}}
+            for i in reversed(_profile_order)
+        ]
+
+
+def _build_profile(scope, stats: RequestStats, status, duration: float) -> dict:
+    repeated = Counter(sql for _, sql, _, _ in stats.profile)
+    return {
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": stats.route,
+        "status": status,
+        "duration_ms": round(duration * 1000, 2),
+        "sql_ms": round(stats.sql_seconds * 1000, 2),
+        "pool_wait_ms": round(stats.pool_wait * 1000, 2),
+        "statements": stats.statements,
+        "repeated_statements": [
+            {"statement": sql, "count": n} for sql, n in repeated.most_common() if n >= REPEATED_STATEMENT_THRESHOLD
+        ],
+        "queries": [
+            {"engine": e, "statement": sql, "duration_ms": round(s * 1000, 3), "plan": plan}
+            for e, sql, s, plan in stats.profile
+        ],
+    }
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware buffering), so streamed
+    exports are timed until their last chunk."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiling = PROFILING_ENABLED and (dict(scope["headers"]).get(b"x-profile") == b"1")
+        stats = RequestStats(scope, profile=profiling)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = [500]
+        profile_id = uuid.uuid4().hex[:12] if profiling else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if profiling:
+                    # Timings as of the first byte (streamed bodies keep going)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timing = (f'app;dur={elapsed:.2f}, db;dur={stats.sql_seconds * 1000:.2f};'
+                              f'desc="{stats.statements} statements", pool;dur={stats.pool_wait * 1000:.2f}')
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", timing.encode()),
+                        (b"x-profile-id", profile_id.encode()),
+                    ]
+            await send(message)
+
+        with _in_flight_lock:
+            _in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            with _in_flight_lock:
+                _in_flight -= 1
+            duration = time.perf_counter() - started
+            route = stats.route
+            labels = (scope["method"], route)
+            REQUEST_DURATION.observe(labels, duration)
+            REQUESTS.inc(labels + (str(status[0]),))
+            REQUEST_STATEMENTS.observe(labels, stats.statements)
+            REQUEST_SQL_TIME.observe(labels, stats.sql_seconds)
+            if profiling:
+                _store_profile(profile_id, _build_profile(scope, stats, status[0], duration))
+            _current.reset(token)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in (REQUEST_DURATION, REQUESTS, REQUEST_STATEMENTS, REQUEST_SQL_TIME,
+                   STATEMENT_DURATION, SLOW_STATEMENTS, FULL_SCANS, POOL_WAIT, POOL_TIMEOUTS, CACHE_EVENTS,
+                   GROUP_COMMIT_BATCH):
+        lines.extend(metric.render())
+    lines.append("# HELP homeovault_http_requests_in_flight Requests currently being served.")
+    lines.append("# TYPE homeovault_http_requests_in_flight gauge")
+    lines.append(f"homeovault_http_requests_in_flight {_in_flight}")
+    lines.append("# HELP homeovault_db_pool_checked_out Connections currently checked out.")
+    lines.append("# TYPE homeovault_db_pool_checked_out gauge")
+    for name, target_engine in sorted(_engines.items()):
+        pool = target_engine.pool
+        checked_out = pool.checkedout() if hasattr(pool, "checkedout") else 0
+        lines.append(f'homeovault_db_pool_checked_out{{pool="{name}"}} {checked_out}')
+    return "\n".join(lines) + "\n"
@@ -1,37 +1,137 @@
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 from decimal import Decimal
-from sqlmodel import Field, SQLModel, create_engine, Session, UniqueConstraint
+from sqlmodel import Field, SQLModel, create_engine, UniqueConstraint
+from sqlalchemy import Index, event, func
+from sqlalchemy.schema import CreateIndex
+
+from .metrics import TimedQueuePool
 
 # Database setup
 import os
+import sqlite3
 current_dir = os.path.dirname(os.path.abspath(__file__))
 # "../database/inventory.db" relative to backend/models.py
-sqlite_file_name = os.path.join(current_dir, "../database/inventory.db")
+sqlite_file_name = os.environ.get("HOMEOVAULT_DB_PATH", os.path.join(current_dir, "../database/inventory.db"))
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+# Engine profile. Every value can be overridden with an environment variable
+# (HOMEOVAULT_JOURNAL_MODE, HOMEOVAULT_SYNCHRONOUS, ...).
+# WAL lets readers keep working while a sale commits. synchronous=FULL keeps
+# the old "every commit is on disk" guarantee; NORMAL is faster under WAL but
+# may lose the last commits on power failure.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("HOMEOVAULT_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("HOMEOVAULT_SYNCHRONOUS", "FULL"),
+    "cache_size": int(os.environ.get("HOMEOVAULT_CACHE_SIZE", "-65536")), # negative = KiB, i.e. 64 MB
+    "mmap_size": int(os.environ.get("HOMEOVAULT_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.environ.get("HOMEOVAULT_BUSY_TIMEOUT", "5000")), # ms
+    "temp_store": os.environ.get("HOMEOVAULT_TEMP_STORE", "MEMORY"),
+}
+# Sync endpoints run on Starlette's threadpool (40 threads by default), so the
+# read pool is sized to match and requests never queue for a connection.
+READ_POOL_SIZE = int(os.environ.get("HOMEOVAULT_READ_POOL_SIZE", "40"))
+WRITE_TIMEOUT = float(os.environ.get("HOMEOVAULT_WRITE_TIMEOUT", "30")) # seconds to wait for the writer
+# "async" serves the busiest routes from async_routes.py on an aiosqlite
+# engine (see async_db.py); "sync" keeps every route on the threadpool.
+DB_MODE = os.environ.get("HOMEOVAULT_DB_MODE", "sync")
+
+def apply_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def _make_engine(name: str, pool_size: int, pool_timeout: float, url: str = sqlite_url):
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=TimedQueuePool, # records checkout waits for /api/metrics
+        pool_logging_name=name,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=pool_timeout,
+    )
+    event.listen(new_engine, "connect", apply_pragmas)
+    return new_engine
+
+def use_immediate_transactions(target_engine):
+    """Start every transaction with BEGIN IMMEDIATE.
+
+    A transaction that reads and then writes (e.g. FEFO allocation) would
+    otherwise hold a read lock while waiting to upgrade, and two of them
+    deadlock ("database is locked"). Taking the write lock up front makes
+    writers from other processes queue on busy_timeout instead.
+    """
+    @event.listens_for(target_engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(target_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+# Readers share a pool; all writes go through one serialized writer
+# connection so they queue in Python instead of fighting over SQLite's lock.
+engine = _make_engine("reader", READ_POOL_SIZE, pool_timeout=30)
+writer_engine = _make_engine("writer", 1, pool_timeout=WRITE_TIMEOUT)
+use_immediate_transactions(writer_engine)
+
+def make_engines(db_path: str, name: str, read_pool_size: int = READ_POOL_SIZE):
+    """(reader pool, single writer) for another database file, e.g. a branch store."""
+    url = f"sqlite:///{db_path}"
+    reader = _make_engine(f"{name}-reader", read_pool_size, pool_timeout=30, url=url)
+    writer = _make_engine(f"{name}-writer", 1, pool_timeout=WRITE_TIMEOUT, url=url)
+    use_immediate_transactions(writer)
+    return reader, writer
+
+def describe_engine():
+    """PRAGMA values as SQLite actually applied them (e.g. WAL can be refused)."""
+    with writer_engine.connect() as conn:
+        applied = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS}
+    applied["read_pool_size"] = READ_POOL_SIZE
+    applied["writer_connections"] = 1
+    applied["db_mode"] = DB_MODE
+    return applied
+
+def create_db_and_tables(target=None):
+    # Also brings a restored backup from an older version up to date
+    target = target or writer_engine
+    SQLModel.metadata.create_all(target)
+    ensure_indexes(target)
+    with target.begin() as conn:
+        ensure_search_index(conn)
+        ensure_change_triggers(conn)
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def ensure_indexes(target=None):
+    # create_all() only emits indexes together with a new table, so databases
+    # created by older versions would never get the indexes added since.
+    # IF NOT EXISTS rather than checkfirst: expression indexes can't be reflected.
+    with (target or writer_engine).begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+# One stock-keeping unit: a batch of one product from one manufacturer
+SKU_COLUMNS = ["medicine_name", "potency", "form", "bottle_size", "manufacturer", "batch_number"]
+# One product: every batch of it, as it is reordered and compared across stores
+PRODUCT_COLUMNS = SKU_COLUMNS[:-1]
 
 class HomeopathicMedicine(SQLModel, table=True):
     __table_args__ = (
-        UniqueConstraint("medicine_name", "potency", "form", "bottle_size", "manufacturer", "batch_number", name="unique_medicine_sku"),
+        UniqueConstraint(*SKU_COLUMNS, name="unique_medicine_sku"),
+        # FEFO allocation: batches of one SKU in expiry order
+        Index("ix_homeopathicmedicine_sku_expiry", "medicine_name", "potency", "form", "bottle_size", "expiry_date"),
     )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     medicine_name: str = Field(index=True)
     potency: str = Field(index=True)  # e.g., "30C", "200C"
-    form: str = Field(default="Dilution") # e.g., "Dilution", "Globules"
+    form: str = Field(default="Dilution", index=True) # e.g., "Dilution", "Globules"
     bottle_size: str = Field(default="30ml") # e.g., "10ml", "30ml"
-    manufacturer: str = Field(default="Dr. Reckeweg")
+    manufacturer: str = Field(default="Dr. Reckeweg", index=True)
     batch_number: str = Field(index=True)
-    expiry_date: date
+    expiry_date: date = Field(index=True)
     mrp: Decimal = Field(default=0, max_digits=10, decimal_places=2)
     purchase_price: Decimal = Field(default=0, max_digits=10, decimal_places=2)
     quantity: int = Field(default=0)
@@ -40,10 +140,202 @@ class HomeopathicMedicine(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_updated: datetime = Field(default_factory=datetime.utcnow)
 
+# Expression indexes backing the list filters in main.read_medicines:
+# case-insensitive name prefix search and the "low stock" comparison.
+Index("ix_homeopathicmedicine_name_lower", func.lower(HomeopathicMedicine.medicine_name))
+Index("ix_homeopathicmedicine_stock_margin", HomeopathicMedicine.quantity - HomeopathicMedicine.low_stock_threshold)
+
+# Full-text search indexes over the catalogue (see search.py), kept in sync by
+# triggers. medicine_fts covers every batch row; medicine_names holds one row
+# per distinct name (with a batch count) and medicine_names_fts indexes it,
+# so ranking and fuzzy matching work on a few thousand names rather than
+# every batch. The trigram tokenizer gives substring/typeahead matching and
+# the overlap used for misspellings. It needs SQLite 3.34+; older builds
+# fall back to the name index.
+FTS_AVAILABLE = sqlite3.sqlite_version_info >= (3, 34, 0)
+FTS_COLUMNS = "medicine_name, manufacturer, potency, batch_number"
+_FTS_NEW = "new.id, new.medicine_name, new.manufacturer, new.potency, new.batch_number"
+_FTS_OLD = "old.id, old.medicine_name, old.manufacturer, old.potency, old.batch_number"
+_NAME_ADD = """INSERT OR IGNORE INTO medicine_names(name, batches) VALUES (new.medicine_name, 0);
+        UPDATE medicine_names SET batches = batches + 1 WHERE name = new.medicine_name;"""
+_NAME_REMOVE = """UPDATE medicine_names SET batches = batches - 1 WHERE name = old.medicine_name;
+        DELETE FROM medicine_names WHERE name = old.medicine_name AND batches <= 0;"""
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS medicine_fts USING fts5(
+        {FTS_COLUMNS}, content='homeopathicmedicine', content_rowid='id', tokenize='trigram')""",
+    "CREATE TABLE IF NOT EXISTS medicine_names (name TEXT NOT NULL UNIQUE, batches INTEGER NOT NULL DEFAULT 0)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS medicine_names_fts USING fts5(
+        name, content='medicine_names', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS medicine_fts_insert AFTER INSERT ON homeopathicmedicine BEGIN
+        INSERT INTO medicine_fts(rowid, {FTS_COLUMNS}) VALUES ({_FTS_NEW});
+        {_NAME_ADD}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS medicine_fts_delete AFTER DELETE ON homeopathicmedicine BEGIN
+        INSERT INTO medicine_fts(medicine_fts, rowid, {FTS_COLUMNS}) VALUES ('delete', {_FTS_OLD});
+        {_NAME_REMOVE}
+    END""",
+    # Only the indexed columns: stock updates don't touch the search index
+    f"""CREATE TRIGGER IF NOT EXISTS medicine_fts_update
+        AFTER UPDATE OF {FTS_COLUMNS} ON homeopathicmedicine BEGIN
+        INSERT INTO medicine_fts(medicine_fts, rowid, {FTS_COLUMNS}) VALUES ('delete', {_FTS_OLD});
+        INSERT INTO medicine_fts(rowid, {FTS_COLUMNS}) VALUES ({_FTS_NEW});
+        {_NAME_REMOVE}
+        {_NAME_ADD}
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS medicine_names_insert AFTER INSERT ON medicine_names BEGIN
+        INSERT INTO medicine_names_fts(rowid, name) VALUES (new.rowid, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS medicine_names_delete AFTER DELETE ON medicine_names BEGIN
+        INSERT INTO medicine_names_fts(medicine_names_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    END""",
+]
+
+def ensure_search_index(connection):
+    if not FTS_AVAILABLE:
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='medicine_names'"
+    ).first()
+    for ddl in FTS_DDL:
+        connection.exec_driver_sql(ddl)
+    if not exists:
+        # Index rows that were added before the search index existed
+        connection.exec_driver_sql(
+            "INSERT INTO medicine_names(name, batches) "
+            "SELECT medicine_name, count(*) FROM homeopathicmedicine GROUP BY medicine_name"
+        )
+        connection.exec_driver_sql("INSERT INTO medicine_fts(medicine_fts) VALUES ('rebuild')")
+
+event.listen(
+    HomeopathicMedicine.__table__, "after_create",
+    lambda target, connection, **kw: ensure_search_index(connection),
+)
+
 class Transaction(SQLModel, table=True):
+    __table_args__ = (
+        # History pages: newest first overall, or per medicine
+        Index("ix_transaction_timestamp", "timestamp"),
+        Index("ix_transaction_medicine_timestamp", "medicine_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     medicine_id: int = Field(foreign_key="homeopathicmedicine.id")
     change_amount: int
-    action_type: str = Field(default="ADJUST") # ADD, SELL, ADJUST, EXPIRE
+    action_type: str = Field(default="ADJUST") # ADD, SELL, ADJUST, EXPIRE, OPENING
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     note: Optional[str] = Field(default=None)
+
+# Ledger row holding the sum of a medicine's archived rows (see archive.py)
+OPENING_BALANCE = "OPENING"
+
+class TransactionBatch(SQLModel):
+    # One invoice: every line is applied in a single database transaction
+    items: List[Transaction]
+    note: Optional[str] = Field(default=None) # used for lines without their own note
+
+class MedicineBulk(SQLModel):
+    # Supplier delivery: every batch is written in a single database transaction
+    items: List[HomeopathicMedicine]
+    upsert: bool = Field(default=False) # add to batches that already exist instead of rejecting them
+    note: Optional[str] = Field(default=None) # note on the ADD ledger rows
+
+class InventorySummary(SQLModel, table=True):
+    # Single row (id=1) of dashboard counters, kept up to date by every
+    # stock mutation so the dashboard never has to scan the catalogue.
+    id: Optional[int] = Field(default=1, primary_key=True)
+    total_skus: int = Field(default=0)
+    total_units: int = Field(default=0)
+    stock_value_purchase: Decimal = Field(default=0, max_digits=14, decimal_places=2)
+    stock_value_mrp: Decimal = Field(default=0, max_digits=14, decimal_places=2)
+    low_stock_count: int = Field(default=0)
+    expired_count: int = Field(default=0)
+    expiring_count: int = Field(default=0) # not yet expired, expiring within EXPIRING_SOON_DAYS of as_of
+    as_of: date # day the expiry counts refer to
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class InventoryVersion(SQLModel, table=True):
+    # Single row (id=1): bumped in the same transaction as every inventory
+    # write. Read endpoints derive their ETag from it (see http_cache.py).
+    id: Optional[int] = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DailySales(SQLModel, table=True):
+    # Ledger rollup: one row per (day, medicine, action type), maintained by
+    # analytics.record_transaction in the same transaction as the sale.
+    __table_args__ = (
+        Index("ix_dailysales_medicine_day", "medicine_id", "day"),
+    )
+
+    day: date = Field(primary_key=True)
+    medicine_id: int = Field(primary_key=True)
+    action_type: str = Field(primary_key=True)
+    units: int = Field(default=0) # sum of change_amount (negative for sales)
+    txn_count: int = Field(default=0)
+
+class DemandRate(SQLModel, table=True):
+    # Exponentially weighted daily demand per product, folded forward one
+    # day of the DailySales rollup at a time by reorder.refresh_demand.
+    # mean / weight is units per day; square / weight the mean square.
+    __table_args__ = (
+        UniqueConstraint(*PRODUCT_COLUMNS, name="unique_demand_product"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    medicine_name: str
+    potency: str
+    form: str
+    bottle_size: str
+    manufacturer: str
+    mean: float = Field(default=0)
+    square: float = Field(default=0)
+    weight: float = Field(default=0) # share of the weights covered by the product's history
+    half_life: float # days; the averages are rebuilt when it changes
+    through: date = Field(index=True) # last complete (UTC) day folded in
+
+class ChangeLog(SQLModel, table=True):
+    # Append-only log of catalogue changes for delta sync (see changes.py).
+    # Rows are written by the CHANGELOG_DDL triggers, so every insert, update
+    # and delete of a medicine - whichever code path makes it - is logged in
+    # the same transaction. AUTOINCREMENT: ids are never reused, even after
+    # old entries are pruned, so an id is a safe sync cursor.
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    medicine_id: int
+    op: str # "upsert" or "delete"
+    changed_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+CHANGELOG_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS changelog_{event_name.lower()} AFTER {event_name} ON homeopathicmedicine BEGIN
+        INSERT INTO changelog(medicine_id, op, changed_at) VALUES ({row}.id, '{op}', datetime('now'));
+    END"""
+    for event_name, row, op in (("INSERT", "new", "upsert"), ("UPDATE", "new", "upsert"), ("DELETE", "old", "delete"))
+]
+
+def ensure_change_triggers(connection):
+    for ddl in CHANGELOG_DDL:
+        connection.exec_driver_sql(ddl)
+
+# After the whole schema exists (the triggers span two tables)
+event.listen(
+    SQLModel.metadata, "after_create",
+    lambda target, connection, **kw: ensure_change_triggers(connection),
+)
+
+class SkuSale(SQLModel):
+    # Sell by SKU; the batches are chosen first-expiry-first-out
+    medicine_name: str
+    potency: str
+    form: str = Field(default="Dilution")
+    bottle_size: str = Field(default="30ml")
+    manufacturer: Optional[str] = Field(default=None) # any manufacturer if omitted
+    quantity: int
+    note: Optional[str] = Field(default=None)
+
+# Branch store ids double as directory names: lowercase letters, digits, "-" and "_"
+STORE_ID_PATTERN = r"^[a-z0-9][a-z0-9_-]{0,31}$"
+
+class StoreCreate(SQLModel):
+    # A new branch store with its own database file (see stores.py)
+    id: str = Field(schema_extra={"pattern": STORE_ID_PATTERN}) # validated before the registry sees it
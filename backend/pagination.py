@@ -0,0 +1,63 @@
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination helpers.
+# A cursor is the (sort value, id) pair of the last row on a page, encoded as
+# an opaque url-safe token. The next page starts strictly after that pair, so
+# SQLite can seek straight into the index instead of counting OFFSET rows.
+
+
+def encode_cursor(value: Any, row_id: int) -> str:
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def parse_sort(sort: str, allowed: dict) -> Tuple[str, bool]:
+    # "name" -> ascending, "-name" -> descending
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    if key not in allowed:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort key '{key}'. Use one of: {', '.join(allowed)}",
+        )
+    return key, descending
+
+
+def after_cursor(column, id_column, value, row_id: int, descending: bool):
+    """WHERE clause selecting rows that come after (value, row_id) in sort order.
+
+    The leading ``column <= value`` (or ``>=``) gives SQLite an index range to
+    seek to; the OR alone would make it walk the index from the start.
+    """
+    if descending:
+        return and_(column <= value, or_(column < value, id_column < row_id))
+    return and_(column >= value, or_(column > value, id_column > row_id))
+
+
+def order_by(column, id_column, descending: bool):
+    if descending:
+        return column.desc(), id_column.desc()
+    return column.asc(), id_column.asc()
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with ``prefix``."""
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
@@ -0,0 +1,147 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlmodel import select
+
+from .models import HomeopathicMedicine, Transaction, OPENING_BALANCE
+from . import serialize
+from .pagination import encode_cursor, decode_cursor, parse_sort, after_cursor, order_by, prefix_upper_bound
+
+# Statements behind the list endpoints, shared by the sync routes in main.py
+# and the async ones in async_routes.py. Builders only return a select; the
+# caller runs it on whichever kind of session it has and hands the rows to
+# the matching *_page function. Rows are plain column tuples (serialize.py).
+
+# Sort keys accepted by GET /api/medicines (prefix with "-" for descending)
+MEDICINE_SORT_KEYS = {
+    "name": HomeopathicMedicine.medicine_name,
+    "expiry_date": HomeopathicMedicine.expiry_date,
+    "quantity": HomeopathicMedicine.quantity,
+    "created_at": HomeopathicMedicine.created_at,
+    "id": HomeopathicMedicine.id,
+}
+
+
+def _cursor_value(key: str, value):
+    # Cursors carry JSON values; turn them back into what the column binds
+    if value is None:
+        return None
+    if key == "expiry_date":
+        return date.fromisoformat(value)
+    if key == "created_at":
+        return datetime.fromisoformat(value)
+    return value
+
+
+def medicine_list(
+    limit: int,
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    name: Optional[str] = None,
+    potency: Optional[str] = None,
+    form: Optional[str] = None,
+    manufacturer: Optional[str] = None,
+    expired: Optional[bool] = None,
+    low_stock: Optional[bool] = None,
+    expiring_within: Optional[int] = None,
+):
+    """(statement, sort key) for one page of GET /api/medicines (limit + 1 rows)."""
+    sort_key, descending = parse_sort(sort, MEDICINE_SORT_KEYS)
+    sort_column = MEDICINE_SORT_KEYS[sort_key]
+    statement = select(*serialize.MEDICINE_COLUMNS)
+
+    # Filters (each one is backed by an index, see models.py)
+    # A blank search box filters nothing (an empty prefix has no upper bound)
+    prefix = (name or "").strip().lower()
+    if prefix:
+        name_key = func.lower(HomeopathicMedicine.medicine_name)
+        statement = statement.where(name_key >= prefix, name_key < prefix_upper_bound(prefix))
+    if potency:
+        statement = statement.where(HomeopathicMedicine.potency == potency)
+    if form:
+        statement = statement.where(HomeopathicMedicine.form == form)
+    if manufacturer:
+        statement = statement.where(HomeopathicMedicine.manufacturer == manufacturer)
+    if expired is not None:
+        if expired:
+            statement = statement.where(HomeopathicMedicine.expiry_date < date.today())
+        else:
+            statement = statement.where(HomeopathicMedicine.expiry_date >= date.today())
+    if expiring_within is not None:
+        horizon = date.today() + timedelta(days=expiring_within)
+        statement = statement.where(HomeopathicMedicine.expiry_date <= horizon)
+    if low_stock is not None:
+        margin = HomeopathicMedicine.quantity - HomeopathicMedicine.low_stock_threshold
+        statement = statement.where(margin <= 0 if low_stock else margin > 0)
+
+    # Keyset pagination: seek past the last row of the previous page
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        try:
+            value = _cursor_value(sort_key, value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        statement = statement.where(
+            after_cursor(sort_column, HomeopathicMedicine.id, value, last_id, descending)
+        )
+
+    statement = statement.order_by(*order_by(sort_column, HomeopathicMedicine.id, descending))
+    return statement.limit(limit + 1), sort_key
+
+
+def medicine_page(rows: list, limit: int, sort_key: str) -> Tuple[List[list], Optional[str]]:
+    """Trim the extra row and return (JSON-ready values, next cursor or None)."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        sort_attr = "medicine_name" if sort_key == "name" else sort_key
+        next_cursor = encode_cursor(getattr(last, sort_attr), last.id)
+    return serialize.medicine_values(rows), next_cursor
+
+
+def history_list(
+    limit: int,
+    cursor: Optional[str] = None,
+    medicine_id: Optional[int] = None,
+    action_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Statement for one page of GET /api/history (limit + 1 rows)."""
+    # Join Transaction with HomeopathicMedicine to get names
+    statement = select(*serialize.HISTORY_COLUMNS).join_from(Transaction, HomeopathicMedicine)
+    if medicine_id is not None:
+        statement = statement.where(Transaction.medicine_id == medicine_id)
+    if action_type:
+        statement = statement.where(Transaction.action_type == action_type)
+    else:
+        # Bookkeeping: the rows it sums up are listed from the archive instead
+        statement = statement.where(Transaction.action_type != OPENING_BALANCE)
+    if since:
+        statement = statement.where(Transaction.timestamp >= since)
+    if until:
+        statement = statement.where(Transaction.timestamp < until)
+
+    # Newest first; the cursor is the (timestamp, id) of the last row served
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        statement = statement.where(after_cursor(Transaction.timestamp, Transaction.id, value, last_id, True))
+    statement = statement.order_by(*order_by(Transaction.timestamp, Transaction.id, True))
+    return statement.limit(limit + 1)
+
+
+def history_page(rows: list, limit: int) -> Tuple[List[list], Optional[str]]:
+    """(JSON-ready values, next cursor or None)."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
+    return serialize.history_values(rows), next_cursor
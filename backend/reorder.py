@@ -0,0 +1,252 @@
+import math
+import os
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+from typing import Optional
+
+from sqlalchemy import and_, bindparam, case, delete, func, insert, update
+from sqlmodel import Session, select
+
+from .models import DailySales, DemandRate, HomeopathicMedicine, PRODUCT_COLUMNS
+
+# Reorder suggestions from the sales history.
+# Daily demand per product (all batches together) is an exponentially
+# weighted moving average of the SELL units in the DailySales rollup, kept
+# in the DemandRate table. refresh_demand() folds in only the days since the
+# last refresh: the stored sums are decayed by keep ** days in one UPDATE,
+# and the few (product, day) rollup rows in between are added on top, so a
+# daily refresh reads one day of the rollup instead of the whole ledger.
+# Days without sales need no rows: they are the decay. A product's rate,
+# the spread of its daily demand, the supplier lead time and the wanted
+# service level give its reorder point; purchase_list() ranks what is below
+# it and groups the order by manufacturer.
+
+HALF_LIFE_DAYS = float(os.environ.get("HOMEOVAULT_REORDER_HALF_LIFE", "28"))
+LEAD_DAYS = int(os.environ.get("HOMEOVAULT_REORDER_LEAD_DAYS", "7"))
+COVER_DAYS = int(os.environ.get("HOMEOVAULT_REORDER_COVER_DAYS", "30"))
+SERVICE_LEVEL = float(os.environ.get("HOMEOVAULT_REORDER_SERVICE_LEVEL", "0.95"))
+MIN_DAILY_RATE = 0.01 # below this (under one unit in 100 days) a product is not reordered
+
+
+def _keep(half_life: float) -> float:
+    # Share of the average that survives one more day
+    return 0.5 ** (1 / half_life)
+
+
+def _last_complete_day(today: Optional[date] = None) -> date:
+    # Rollup days are UTC; today's is still filling up
+    return (today or datetime.utcnow().date()) - timedelta(days=1)
+
+
+def _product_join(M=HomeopathicMedicine):
+    return and_(*(getattr(DemandRate, column) == getattr(M, column) for column in PRODUCT_COLUMNS))
+
+
+def _daily_sales(session: Session, statement, through: date, keep: float) -> dict:
+    """key -> (sum of a * keep**age * units, same for units**2) over the (key, day) rows of ``statement``."""
+    a = 1 - keep
+    sums = {}
+    for *key, day, units in session.exec(statement).all():
+        weight = a * keep ** (through - day).days
+        mean, square = sums.get(tuple(key), (0.0, 0.0))
+        sums[tuple(key)] = (mean + weight * units, square + weight * units * units)
+    return sums
+
+
+def refresh_demand(session: Session, today: Optional[date] = None, full: bool = False,
+                   half_life: float = HALF_LIFE_DAYS) -> dict:
+    """Bring every product's demand average up to yesterday (caller commits)."""
+    through = _last_complete_day(today)
+    keep = _keep(half_life)
+    M = HomeopathicMedicine
+    product = [getattr(M, column) for column in PRODUCT_COLUMNS]
+    sold = -func.sum(DailySales.units)
+    sales = (
+        select(DailySales.day, sold)
+        .join(M, M.id == DailySales.medicine_id)
+        .where(DailySales.action_type == "SELL", DailySales.day <= through)
+    )
+
+    stale_half_life = session.exec(
+        select(DemandRate.id).where(DemandRate.half_life != half_life).limit(1)
+    ).first() is not None
+    if full or stale_half_life:
+        session.execute(delete(DemandRate))
+
+    # 1. Products seen before: decay, then add the days since their last refresh
+    table = DemandRate.__table__
+    advanced = 0
+    for since in session.exec(
+        select(DemandRate.through).where(DemandRate.through < through).group_by(DemandRate.through)
+    ).all():
+        recent = _daily_sales(session, (
+            sales.with_only_columns(DemandRate.id, DailySales.day, sold)
+            .join(DemandRate, _product_join())
+            .where(DemandRate.through == since, DailySales.day > since)
+            .group_by(DemandRate.id, DailySales.day)
+        ), through, keep)
+        decay = keep ** (through - since).days
+        result = session.execute(
+            update(table).where(table.c.through == since).values(
+                mean=table.c.mean * decay,
+                square=table.c.square * decay,
+                weight=table.c.weight * decay + (1 - decay),
+                through=through,
+            )
+        )
+        advanced += result.rowcount
+        if recent:
+            session.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values(
+                    mean=table.c.mean + bindparam("add_mean"),
+                    square=table.c.square + bindparam("add_square"),
+                ),
+                [{"row_id": row_id, "add_mean": m, "add_square": s} for (row_id,), (m, s) in recent.items()],
+            )
+
+    # 2. New products: their whole history, weighted from their first day on the books
+    new = (
+        select(*product, func.min(DailySales.day))
+        .join(M, M.id == DailySales.medicine_id)
+        .outerjoin(DemandRate, _product_join())
+        .where(DemandRate.id.is_(None), DailySales.day <= through)
+        .group_by(*product)
+    )
+    first_seen = {tuple(key): first for *key, first in session.exec(new).all()}
+    if first_seen:
+        history = _daily_sales(session, (
+            sales.with_only_columns(*product, DailySales.day, sold)
+            .outerjoin(DemandRate, _product_join())
+            .where(DemandRate.id.is_(None))
+            .group_by(*product, DailySales.day)
+        ), through, keep)
+        session.execute(insert(table), [
+            {
+                **dict(zip(PRODUCT_COLUMNS, key)),
+                "mean": history.get(key, (0.0, 0.0))[0],
+                "square": history.get(key, (0.0, 0.0))[1],
+                "weight": 1 - keep ** ((through - first).days + 1),
+                "half_life": half_life,
+                "through": through,
+            }
+            for key, first in first_seen.items()
+        ])
+    return {"through": through, "advanced": advanced, "added": len(first_seen),
+            "rebuilt": full or stale_half_life}
+
+
+def needs_refresh(session: Session, today: Optional[date] = None) -> bool:
+    through = _last_complete_day(today)
+    oldest = session.exec(select(func.min(DemandRate.through))).one()
+    if oldest is not None:
+        return oldest < through
+    # Rollup rows of deleted medicines never become demand rows; ignore them here too
+    return session.exec(
+        select(DailySales.day)
+        .join(HomeopathicMedicine, HomeopathicMedicine.id == DailySales.medicine_id)
+        .where(DailySales.day <= through)
+        .limit(1)
+    ).first() is not None
+
+
+def _suggestion(row, lead_days: int, cover_days: int, z: float) -> Optional[dict]:
+    *key, on_hand, threshold, unit_cost, mean, square, weight = row
+    on_hand = on_hand or 0
+    unit_cost = float(unit_cost) if unit_cost is not None else None
+    item = dict(zip(PRODUCT_COLUMNS, key))
+    if weight:
+        rate = mean / weight
+        if rate < MIN_DAILY_RATE:
+            return None
+        spread = math.sqrt(max(0.0, square / weight - rate * rate))
+        safety_stock = z * spread * math.sqrt(lead_days)
+        reorder_point = rate * lead_days + safety_stock
+        target = rate * (lead_days + cover_days) + safety_stock
+        basis = "demand"
+    else:
+        # No sales history yet: fall back to the low-stock threshold
+        rate = spread = safety_stock = None
+        reorder_point = threshold
+        target = 2 * threshold
+        basis = "threshold"
+    if on_hand > reorder_point or target <= on_hand:
+        return None
+    order = math.ceil(round(target - on_hand, 6)) # no extra unit for float noise
+    item.update({
+        "on_hand": on_hand,
+        "daily_rate": round(rate, 3) if rate is not None else None,
+        "daily_spread": round(spread, 3) if spread is not None else None,
+        "safety_stock": round(safety_stock, 1) if safety_stock is not None else None,
+        "reorder_point": round(reorder_point, 1),
+        # Days until stockout at the current rate
+        "days_of_cover": round(on_hand / rate, 1) if rate else (0.0 if on_hand <= 0 else None),
+        "order_quantity": order,
+        "unit_cost": unit_cost,
+        "estimated_cost": round(order * unit_cost, 2) if unit_cost is not None else None,
+        "basis": basis,
+    })
+    return item
+
+
+def _urgency(item: dict):
+    # Soonest stockout first; items without a rate that still have stock last
+    cover = item["days_of_cover"]
+    return (cover is None, cover if cover is not None else 0, -item["order_quantity"])
+
+
+def purchase_list(session: Session, write_session: Session, lead_days: int = LEAD_DAYS,
+                  cover_days: int = COVER_DAYS, service_level: float = SERVICE_LEVEL,
+                  manufacturer: Optional[str] = None, limit: int = 500) -> dict:
+    """Products at or below their reorder point, grouped by manufacturer, most urgent first."""
+    if needs_refresh(session):
+        # Once a day, like the summary's expiry rollover
+        refresh_demand(write_session)
+        write_session.commit()
+
+    M = HomeopathicMedicine
+    product = [getattr(M, column) for column in PRODUCT_COLUMNS]
+    sellable = and_(M.quantity > 0, M.expiry_date >= date.today())
+    statement = (
+        select(
+            *product,
+            func.sum(case((sellable, M.quantity), else_=0)),
+            func.max(M.low_stock_threshold),
+            func.max(M.purchase_price),
+            func.max(DemandRate.mean), func.max(DemandRate.square), func.max(DemandRate.weight),
+        )
+        .select_from(M)
+        .outerjoin(DemandRate, _product_join())
+        .group_by(*product)
+    )
+    if manufacturer:
+        statement = statement.where(M.manufacturer == manufacturer)
+
+    z = NormalDist().inv_cdf(service_level)
+    items = [
+        item for item in (_suggestion(row, lead_days, cover_days, z) for row in session.exec(statement).all())
+        if item is not None
+    ]
+    items.sort(key=_urgency)
+    items = items[:limit]
+
+    groups = {}
+    for item in items:
+        group = groups.get(item["manufacturer"])
+        if group is None:
+            group = groups[item["manufacturer"]] = {
+                "manufacturer": item["manufacturer"], "units": 0, "estimated_cost": 0.0, "items": [],
+            }
+        group["items"].append(item)
+        group["units"] += item["order_quantity"]
+        group["estimated_cost"] = round(group["estimated_cost"] + (item["estimated_cost"] or 0), 2)
+    return {
+        "lead_days": lead_days,
+        "cover_days": cover_days,
+        "service_level": service_level,
+        "half_life_days": HALF_LIFE_DAYS,
+        "through": _last_complete_day(),
+        "total_units": sum(group["units"] for group in groups.values()),
+        "estimated_cost": round(sum(group["estimated_cost"] for group in groups.values()), 2),
+        # Groups keep the order of their most urgent item
+        "manufacturers": list(groups.values()),
+    }
@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable
+
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from . import metrics
+
+# Group commit for sales.
+# Every sale normally commits on its own, and with synchronous=FULL each
+# commit waits for the disk to sync: at rush hour the disk, not the CPU,
+# limits the sales per second. With HOMEOVAULT_GROUP_COMMIT=1 the sale
+# endpoints hand their work to the store's SaleQueue instead. One writer
+# thread takes what has queued up (at most GROUP_COMMIT_MAX_ITEMS, waiting
+# up to GROUP_COMMIT_WINDOW_MS after the first for more), runs every sale in
+# its own savepoint on one writer session and commits them together, so one
+# sync covers the whole batch. A sale that fails its checks only rolls back
+# its savepoint. Requests answer after their batch has committed, so a
+# confirmed sale is on disk exactly as before.
+
+GROUP_COMMIT = os.environ.get("HOMEOVAULT_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("HOMEOVAULT_GROUP_COMMIT_MS", "2"))
+GROUP_COMMIT_MAX_ITEMS = int(os.environ.get("HOMEOVAULT_GROUP_COMMIT_MAX", "64"))
+RESULT_TIMEOUT = 30 # seconds a request waits for its batch to commit
+
+
+class SaleQueue:
+    """Applies queued writes on one writer session and commits them in batches."""
+
+    def __init__(self, writer, name: str, window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                 max_items: int = GROUP_COMMIT_MAX_ITEMS):
+        self.writer = writer
+        self.name = name
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, work: Callable[[Session], object]) -> Future:
+        """Queue ``work(session)``; the future resolves once its batch has committed."""
+        future = Future()
+        with self._lock:
+            if self._stopping:
+                raise HTTPException(status_code=503, detail="Store is closing, please retry.")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"homeovault-sales-{self.name}", daemon=True)
+                self._thread.start()
+            self._queue.put((work, future))
+        return future
+
+    def run(self, work: Callable[[Session], object], timeout: float = RESULT_TIMEOUT):
+        """submit() and wait for the result (or the HTTPException the work raised)."""
+        try:
+            return self.submit(work).result(timeout)
+        except FutureTimeout:
+            raise HTTPException(status_code=503, detail="Sale was not confirmed in time, please check the stock and retry.")
+
+    def stop(self, timeout: float = RESULT_TIMEOUT):
+        """Commit what is queued, then end the writer thread."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _take(self) -> list:
+        # Blocks for the first item, then collects more for up to ``window``
+        batch = []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.window
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.max_items:
+                break
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if item is None:
+            self._queue.put(None) # seen again once this batch is done
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            self._commit(batch)
+
+    def _commit(self, batch: list):
+        outcomes = []
+        try:
+            with Session(self.writer) as session:
+                for work, future in batch:
+                    try:
+                        with session.begin_nested():
+                            outcomes.append((future, work(session), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                session.commit()
+        except Exception as e:
+            print(f"Group Commit Error: {e}")
+            error = HTTPException(status_code=503, detail="Sale was not saved, please retry.")
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        metrics.GROUP_COMMIT_BATCH.observe((self.name,), len(batch))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,138 @@
+import re
+from difflib import SequenceMatcher
+
+from sqlalchemy import func, text
+from sqlmodel import Session, select
+
+from .models import FTS_AVAILABLE, HomeopathicMedicine
+from .pagination import prefix_upper_bound
+
+# Catalogue search for the search box (one request per keystroke).
+# 1. Terms of 3+ characters are matched as substrings against the distinct
+#    medicine names (medicine_names_fts), ranked by bm25, and the batches of
+#    the best names are returned.
+# 2. Remaining slots are filled from the per-batch index, which also covers
+#    manufacturer, potency and batch number ("arnica 200c", "sbl").
+# 3. If nothing matched as typed, the query's trigrams are OR-ed together so
+#    a misspelt Latin name ("Arnika", "Belladona", "Pulsatila") still shares
+#    most trigrams with the real one; candidate names are re-ranked by string
+#    similarity and weak matches dropped.
+# Shorter input (and SQLite builds without trigram support) uses the
+# lower(medicine_name) prefix index.
+
+RESULT_COLUMNS = (
+    "id", "medicine_name", "potency", "form", "bottle_size", "manufacturer",
+    "batch_number", "expiry_date", "quantity", "mrp",
+)
+FUZZY_CANDIDATES = 100
+FUZZY_MIN_SCORE = 0.6
+
+_SELECT = ", ".join(f"m.{c}" for c in RESULT_COLUMNS)
+
+
+def _terms(query: str):
+    return [t for t in re.split(r"\s+", query.strip().lower()) if t]
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _trigrams(term: str):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def _rows(result, match: str):
+    return [dict(zip(RESULT_COLUMNS, row), match=match) for row in result]
+
+
+def _match_names(session: Session, match: str, limit: int):
+    """Distinct medicine names matching an FTS query, best first."""
+    statement = text(
+        "SELECT name FROM medicine_names_fts WHERE medicine_names_fts MATCH :match "
+        "ORDER BY rank LIMIT :limit"
+    )
+    return [row[0] for row in session.execute(statement, {"match": match, "limit": limit})]
+
+
+def _batches_for_names(session: Session, names, limit: int):
+    # One indexed lookup per name, in rank order, until the page is full
+    rows = []
+    for name in names:
+        if len(rows) >= limit:
+            break
+        rows += session.exec(
+            select(*(getattr(HomeopathicMedicine, c) for c in RESULT_COLUMNS))
+            .where(HomeopathicMedicine.medicine_name == name)
+            .order_by(HomeopathicMedicine.expiry_date, HomeopathicMedicine.id)
+            .limit(limit - len(rows))
+        ).all()
+    return rows
+
+
+def _match_batches(session: Session, match: str, limit: int):
+    # No ORDER BY: FTS5 can stop after ``limit`` hits instead of ranking all
+    statement = text(
+        f"SELECT {_SELECT} FROM medicine_fts JOIN homeopathicmedicine m ON m.id = medicine_fts.rowid "
+        f"WHERE medicine_fts MATCH :match LIMIT :limit"
+    )
+    return session.execute(statement, {"match": match, "limit": limit}).all()
+
+
+def _similar_names(query: str, names, cutoff: float = FUZZY_MIN_SCORE):
+    """Names ranked by their best similarity to the query (whole name, any word,
+    or the name's prefix of the query's length); weak matches dropped."""
+    matcher = SequenceMatcher()
+    matcher.set_seq2(query)  # SequenceMatcher caches work on seq2
+    scored = []
+    for name in names:
+        lowered = name.lower()
+        best = 0.0
+        for candidate in [lowered, lowered[:len(query)]] + lowered.split():
+            matcher.set_seq1(candidate)
+            # Cheap upper bounds first, like difflib.get_close_matches
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                best = max(best, matcher.ratio())
+        if best >= cutoff:
+            scored.append((best, name))
+    scored.sort(key=lambda pair: -pair[0])
+    return [name for _, name in scored]
+
+
+def _prefix_search(session: Session, query: str, limit: int):
+    name_key = func.lower(HomeopathicMedicine.medicine_name)
+    statement = (
+        select(*(getattr(HomeopathicMedicine, c) for c in RESULT_COLUMNS))
+        .where(name_key >= query, name_key < prefix_upper_bound(query))
+        .order_by(name_key)  # index order: no sort step
+        .limit(limit)
+    )
+    return _rows(session.exec(statement).all(), "prefix")
+
+
+def search_medicines(session: Session, query: str, limit: int = 20) -> list:
+    terms = _terms(query)
+    if not terms:
+        return []
+    normalized = " ".join(terms)
+    if not FTS_AVAILABLE or all(len(t) < 3 for t in terms):
+        return _prefix_search(session, normalized, limit)
+
+    # 1. Names containing every term
+    exact_terms = [t for t in terms if len(t) >= 3]
+    match = " ".join(_quote(t) for t in exact_terms)
+    results = _rows(_batches_for_names(session, _match_names(session, match, limit), limit), "exact")
+
+    # 2. Other columns (manufacturer, potency, batch) and mixed queries
+    if len(results) < limit:
+        seen = {r["id"] for r in results}
+        more = _match_batches(session, match, limit + len(seen))
+        results += [r for r in _rows(more, "exact") if r["id"] not in seen][:limit - len(results)]
+    if results:
+        return results
+
+    # 3. Nothing matched as typed: names sharing trigrams, by similarity
+    grams = set().union(*(_trigrams(t) for t in exact_terms))
+    candidates = _match_names(session, " OR ".join(_quote(g) for g in sorted(grams)), FUZZY_CANDIDATES)
+    names = _similar_names(normalized, candidates)
+    return _rows(_batches_for_names(session, names, limit), "fuzzy")
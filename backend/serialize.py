@@ -0,0 +1,131 @@
+import json
+from typing import Iterable, List, Literal, Optional, Sequence
+
+from fastapi import Response
+from sqlalchemy import Float, String, type_coerce
+
+from .models import HomeopathicMedicine, Transaction
+
+# Lean read path for the list endpoints.
+# Rows are selected as plain column tuples, so nothing is loaded into the
+# session's identity map, and with the column types coerced away SQLite's
+# own values come back untouched: dates and timestamps as their stored
+# ISO strings, prices as floats (no Decimal per field). They are shaped into
+# the same JSON the ORM path produced and encoded in one call, with orjson
+# when it is installed. "columns" responses carry one array per field,
+# which is smaller and what the dashboard table consumes.
+
+try:
+    import orjson
+
+    def dumps(content) -> bytes:
+        return orjson.dumps(content)
+except ImportError:
+    def dumps(content) -> bytes:
+        return json.dumps(content, separators=(",", ":")).encode()
+
+Format = Literal["rows", "columns"]
+
+M = HomeopathicMedicine
+T = Transaction
+
+# (JSON field, raw column) in response order
+MEDICINE_FIELDS = [
+    ("id", M.id),
+    ("medicine_name", M.medicine_name),
+    ("potency", M.potency),
+    ("form", M.form),
+    ("bottle_size", M.bottle_size),
+    ("manufacturer", M.manufacturer),
+    ("batch_number", M.batch_number),
+    ("expiry_date", type_coerce(M.expiry_date, String)),
+    ("mrp", type_coerce(M.mrp, Float)),
+    ("purchase_price", type_coerce(M.purchase_price, Float)),
+    ("quantity", M.quantity),
+    ("low_stock_threshold", M.low_stock_threshold),
+    ("created_at", type_coerce(M.created_at, String)),
+    ("last_updated", type_coerce(M.last_updated, String)),
+]
+MEDICINE_COLUMNS = [column.label(name) for name, column in MEDICINE_FIELDS]
+MEDICINE_NAMES = [name for name, _ in MEDICINE_FIELDS]
+
+HISTORY_FIELDS = [
+    ("id", T.id),
+    ("medicine_id", T.medicine_id),
+    ("medicine_name", M.medicine_name),
+    ("batch_number", M.batch_number),
+    ("change", T.change_amount),
+    ("action_type", T.action_type),
+    ("timestamp", type_coerce(T.timestamp, String)),
+    ("note", T.note),
+]
+HISTORY_COLUMNS = [column.label(name) for name, column in HISTORY_FIELDS]
+HISTORY_NAMES = [name for name, _ in HISTORY_FIELDS]
+
+_MEDICINE_PRICES = (MEDICINE_NAMES.index("mrp"), MEDICINE_NAMES.index("purchase_price"))
+_MEDICINE_TIMES = (MEDICINE_NAMES.index("created_at"), MEDICINE_NAMES.index("last_updated"))
+_HISTORY_TIME = HISTORY_NAMES.index("timestamp")
+
+
+def _timestamp(value: Optional[str]) -> Optional[str]:
+    # Stored as "YYYY-MM-DD HH:MM:SS.ffffff"; the API has always sent ISO 8601
+    return value.replace(" ", "T", 1) if value else value
+
+
+def medicine_values(rows: Iterable[Sequence]) -> List[list]:
+    """Raw medicine rows as JSON-ready value lists (prices as "12.50" strings)."""
+    mrp, purchase = _MEDICINE_PRICES
+    created, updated = _MEDICINE_TIMES
+    values = []
+    for row in rows:
+        row = list(row)
+        row[mrp] = f"{row[mrp]:.2f}"
+        row[purchase] = f"{row[purchase]:.2f}"
+        row[created] = _timestamp(row[created])
+        row[updated] = _timestamp(row[updated])
+        values.append(row)
+    return values
+
+
+def history_values(rows: Iterable[Sequence]) -> List[list]:
+    values = []
+    for row in rows:
+        row = list(row)
+        row[_HISTORY_TIME] = _timestamp(row[_HISTORY_TIME])
+        values.append(row)
+    return values
+
+
+def shape(names: List[str], values: List[list], fmt: str = "rows"):
+    """A list of objects, or one array per field for ``fmt="columns"``."""
+    if fmt == "columns":
+        arrays = zip(*values) if values else [()] * len(names)
+        return {name: list(array) for name, array in zip(names, arrays)}
+    return [dict(zip(names, row)) for row in values]
+
+
+def list_responses(names: List[str], model=None) -> dict:
+    """OpenAPI ``responses=`` for a list served in either shape (format=rows / format=columns).
+
+    The routes return encoded bodies, so FastAPI cannot derive the schema itself.
+    """
+    item = model.model_json_schema(mode="serialization") if model is not None else {"type": "object"}
+    rows = {"type": "array", "items": item, "title": "rows"}
+    columns = {
+        "type": "object", "title": "columns",
+        "properties": {name: {"type": "array", "items": {}} for name in names},
+    }
+    return {200: {
+        "description": "format=rows: one object per row; format=columns: one array per field",
+        "content": {"application/json": {"schema": {"oneOf": [rows, columns]}}},
+    }}
+
+
+def json_response(content, response: Optional[Response] = None) -> Response:
+    """Encoded JSON (or ``bytes`` already encoded) carrying the headers already
+    set on ``response`` (ETag, cursor)."""
+    headers = dict(response.headers) if response is not None else None
+    if headers:
+        headers.pop("content-length", None)
+    body = content if isinstance(content, bytes) else dumps(content)
+    return Response(content=body, media_type="application/json", headers=headers)
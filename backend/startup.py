@@ -0,0 +1,95 @@
+import os
+import socket
+import threading
+import time
+
+# Startup timeline and deferred startup work.
+# mark() records when each stage finished, counted from the moment this
+# module was first imported (main.py imports it before anything else). The
+# timeline is printed once the server is ready and served at
+# /api/metrics/startup. Work the first page doesn't need is handed to
+# on_ready() or defer(): it runs once the port accepts connections, the
+# deferred part STARTUP_DEFER_SECONDS later, so the dashboard's first
+# requests don't compete with the backup and integrity check.
+
+HOST = os.environ.get("HOMEOVAULT_HOST", "0.0.0.0")
+PORT = int(os.environ.get("HOMEOVAULT_PORT", "8000"))
+OPEN_BROWSER = os.environ.get("HOMEOVAULT_OPEN_BROWSER", "1") == "1"
+STARTUP_DEFER_SECONDS = float(os.environ.get("HOMEOVAULT_STARTUP_DEFER", "3"))
+READY_TIMEOUT = 30 # seconds to wait for the port before running the deferred work anyway
+
+_started = time.perf_counter()
+_lock = threading.Lock()
+_stages = []
+_on_ready = []
+_deferred = []
+_thread = None
+
+
+def mark(stage: str):
+    with _lock:
+        _stages.append((stage, time.perf_counter() - _started))
+
+
+def timeline() -> dict:
+    with _lock:
+        stages = [{"stage": stage, "at_ms": round(at * 1000, 1)} for stage, at in _stages]
+    ready = next((s["at_ms"] for s in stages if s["stage"] == "ready"), None)
+    return {"stages": stages, "ready_ms": ready}
+
+
+def on_ready(fn, *args):
+    """Run ``fn(*args)`` as soon as the server accepts connections."""
+    _on_ready.append((fn, args))
+
+
+def defer(fn, *args):
+    """Run ``fn(*args)`` STARTUP_DEFER_SECONDS after the server is ready."""
+    _deferred.append((fn, args))
+
+
+def _port_open(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+def _run(tasks: list):
+    while tasks:
+        fn, args = tasks.pop(0)
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Startup Task Error: {e}")
+
+
+def _wait_and_run(port: int, delay: float):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while not _port_open(port) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    mark("ready")
+    print("Startup timeline: " + ", ".join(f"{s['stage']} {s['at_ms']:.0f} ms" for s in timeline()["stages"]))
+    _run(_on_ready)
+    time.sleep(delay)
+    mark("deferred tasks started")
+    _run(_deferred)
+
+
+def start(port: int = PORT, delay: float = STARTUP_DEFER_SECONDS) -> threading.Thread:
+    """Wait for ``port`` in the background, then run the queued tasks."""
+    global _thread
+    _thread = threading.Thread(target=_wait_and_run, args=(port, delay), name="homeovault-startup", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def open_dashboard(url: str = f"http://localhost:{PORT}/index.html"):
+    # webbrowser (and the subprocess machinery behind it) is only needed here
+    import webbrowser
+    print("Launching Dashboard...")
+    try:
+        webbrowser.open(url)
+    except Exception as e:
+        print(f"Could not open browser: {e}")
@@ -0,0 +1,272 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from fastapi import Depends, Header, HTTPException, Query, Request
+from sqlmodel import Session
+
+from .models import STORE_ID_PATTERN, create_db_and_tables, engine, make_engines, sqlite_file_name, writer_engine
+from .sale_queue import SaleQueue
+from . import events, metrics
+
+# Branch stores.
+# Every store of a chain keeps its inventory in its own SQLite file, with its
+# own reader pool and its own writer connection, so a sale in one branch
+# never waits for another branch's write lock. A request picks its store with
+# ?store=<id> or an X-Store header; without one it uses "main", the original
+# database/inventory.db. Branch files live under STORES_DIR/<id>/, are opened
+# on first use and closed again after STORE_IDLE_SECONDS without requests.
+# fan_out() runs one function per store on a thread pool for the chain-wide
+# views in chain.py.
+
+DEFAULT_STORE = "main"
+STORES_DIR = os.environ.get("HOMEOVAULT_STORES_DIR", os.path.join(os.path.dirname(sqlite_file_name), "stores"))
+STORE_IDLE_SECONDS = float(os.environ.get("HOMEOVAULT_STORE_IDLE", "600")) # 0 = keep open
+# Branch read pools are smaller than main's: many of them can be open at once
+STORE_READ_POOL_SIZE = int(os.environ.get("HOMEOVAULT_STORE_READ_POOL_SIZE", "8"))
+FAN_OUT_WORKERS = int(os.environ.get("HOMEOVAULT_FAN_OUT_WORKERS", "8"))
+
+# fullmatch(): "$" alone would also accept a trailing newline
+STORE_ID = re.compile(STORE_ID_PATTERN)
+STORE_DB_NAME = "inventory.db"
+
+
+class Store:
+    """One open store: its database file, engines, archives and event hub."""
+
+    def __init__(self, store_id: str, db_path: str, reader, writer, archive_dir: Optional[str], hub: events.EventHub):
+        self.id = store_id
+        self.db_path = db_path
+        self.reader = reader
+        self.writer = writer
+        self.archive_dir = archive_dir # None: archive.ARCHIVE_DIR
+        self.hub = hub
+        self.active = 0 # requests using it right now
+        self.last_used = time.monotonic()
+        self._async = None
+        self._async_lock = threading.Lock()
+        self._sales = None
+
+    def _metric_name(self, role: str) -> str:
+        return role if self.id == DEFAULT_STORE else f"{self.id}-{role}"
+
+    def async_engines(self):
+        """(reader, writer) on aiosqlite, opened on first use (HOMEOVAULT_DB_MODE=async)."""
+        with self._async_lock:
+            if self._async is None:
+                from .async_db import make_async_engines
+                read_pool_size = self.reader.pool.size()
+                reader, writer = make_async_engines(self.db_path, read_pool_size)
+                metrics.instrument_engine(reader.sync_engine, self._metric_name("async-reader"))
+                metrics.instrument_engine(writer.sync_engine, self._metric_name("async-writer"))
+                self.hub.watch(writer.sync_engine, read_bind=self.reader)
+                self._async = reader, writer
+            return self._async
+
+    def sales(self) -> SaleQueue:
+        """The group-commit queue for this store's sales (HOMEOVAULT_GROUP_COMMIT=1)."""
+        with self._async_lock:
+            if self._sales is None:
+                self._sales = SaleQueue(self.writer, self.id)
+            return self._sales
+
+    def binds(self) -> list:
+        engines = [self.reader, self.writer]
+        if self._async is not None:
+            engines.extend(e.sync_engine for e in self._async)
+        return engines
+
+    def close(self):
+        if self._sales is not None:
+            self._sales.stop() # queued sales still commit
+        # Checked-out connections finish normally and are closed when returned
+        for role in ("reader", "writer"):
+            metrics.forget_engine(self._metric_name(role))
+        self.reader.dispose()
+        self.writer.dispose()
+
+    def describe(self) -> dict:
+        return {"id": self.id, "open": True, "active_requests": self.active,
+                "size": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0}
+
+
+class StoreRegistry:
+    """Opens stores on demand and closes the idle ones."""
+
+    def __init__(self, stores_dir: str, main: Store, idle_seconds: float = STORE_IDLE_SECONDS,
+                 read_pool_size: int = STORE_READ_POOL_SIZE):
+        self.stores_dir = stores_dir
+        self.main = main
+        self.idle_seconds = idle_seconds
+        self.read_pool_size = read_pool_size
+        self._open = {main.id: main}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _path(self, store_id: str) -> str:
+        if not STORE_ID.fullmatch(store_id):
+            raise HTTPException(status_code=400, detail="Store ids are 1-32 lowercase letters, digits, '-' or '_'.")
+        return os.path.join(self.stores_dir, store_id, STORE_DB_NAME)
+
+    def ids(self) -> List[str]:
+        """Every store, main first."""
+        branches = []
+        if os.path.isdir(self.stores_dir):
+            branches = sorted(
+                name for name in os.listdir(self.stores_dir)
+                if name != DEFAULT_STORE and STORE_ID.fullmatch(name)
+                and os.path.isfile(os.path.join(self.stores_dir, name, STORE_DB_NAME))
+            )
+        return [self.main.id] + branches
+
+    def exists(self, store_id: str) -> bool:
+        return store_id == self.main.id or os.path.isfile(self._path(store_id))
+
+    def _open_store(self, store_id: str) -> Store:
+        db_path = self._path(store_id)
+        reader, writer = make_engines(db_path, store_id, self.read_pool_size)
+        create_db_and_tables(writer)
+        metrics.instrument_engine(reader, f"{store_id}-reader")
+        metrics.instrument_engine(writer, f"{store_id}-writer")
+        hub = events.EventHub()
+        hub.watch(writer, read_bind=reader)
+        archive_dir = os.path.join(os.path.dirname(db_path), "archive")
+        return Store(store_id, db_path, reader, writer, archive_dir, hub)
+
+    def _get(self, store_id: str) -> Store:
+        # Caller holds self._lock
+        store = self._open.get(store_id)
+        if store is None:
+            if not self.exists(store_id):
+                raise HTTPException(status_code=404, detail=f"Store '{store_id}' not found.")
+            store = self._open[store_id] = self._open_store(store_id)
+        return store
+
+    def get(self, store_id: str) -> Store:
+        with self._lock:
+            return self._get(store_id)
+
+    def create(self, store_id: str) -> Store:
+        with self._lock:
+            if self.exists(store_id):
+                raise HTTPException(status_code=409, detail=f"Store '{store_id}' already exists.")
+            os.makedirs(os.path.dirname(self._path(store_id)), exist_ok=True)
+            store = self._open[store_id] = self._open_store(store_id)
+            return store
+
+    @contextmanager
+    def use(self, store_id: str):
+        """The store, counted as busy (never closed) until the block ends."""
+        with self._lock:
+            store = self._get(store_id)
+            store.active += 1
+        try:
+            yield store
+        finally:
+            with self._lock:
+                store.active -= 1
+                store.last_used = time.monotonic()
+
+    def describe(self) -> List[dict]:
+        with self._lock:
+            open_stores = dict(self._open)
+        described = []
+        for store_id in self.ids():
+            store = open_stores.get(store_id)
+            if store is not None:
+                described.append(store.describe())
+            else:
+                path = self._path(store_id)
+                described.append({"id": store_id, "open": False, "active_requests": 0, "size": os.path.getsize(path)})
+        return described
+
+    def id_for_bind(self, bind) -> Optional[str]:
+        """The store an engine belongs to (None for engines of no store)."""
+        with self._lock:
+            open_stores = list(self._open.values())
+        return next((store.id for store in open_stores if bind in store.binds()), None)
+
+    def close_idle(self, now: Optional[float] = None) -> List[str]:
+        """Dispose branch stores unused for ``idle_seconds``. Returns their ids."""
+        now = time.monotonic() if now is None else now
+        closed = []
+        with self._lock:
+            for store_id, store in list(self._open.items()):
+                if (store is self.main or store.active or store.hub.subscriber_count
+                        or store._async is not None or now - store.last_used < self.idle_seconds):
+                    continue
+                del self._open[store_id]
+                store.close()
+                closed.append(store_id)
+        return closed
+
+    def start(self):
+        if self.idle_seconds <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._reap, name="homeovault-stores", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _reap(self):
+        while not self._stop.wait(max(self.idle_seconds / 4, 1)):
+            try:
+                self.close_idle()
+            except Exception as e:
+                print(f"Store Reaper Error: {e}")
+
+    def fan_out(self, fn: Callable[[Store], object], store_ids: Optional[List[str]] = None) -> dict:
+        """``fn(store)`` for every store (or ``store_ids``) in parallel.
+
+        Returns {store id: result}; a store that failed maps to {"error": ...}
+        instead, so one damaged branch doesn't hide the rest of the chain.
+        """
+        store_ids = store_ids or self.ids()
+
+        def run(store_id):
+            try:
+                with self.use(store_id) as store:
+                    return fn(store)
+            except HTTPException as e:
+                return {"error": e.detail}
+            except Exception as e:
+                print(f"Store Query Error ({store_id}): {e}")
+                return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(FAN_OUT_WORKERS, len(store_ids)))) as pool:
+            return dict(zip(store_ids, pool.map(run, store_ids)))
+
+
+registry = StoreRegistry(
+    STORES_DIR,
+    Store(DEFAULT_STORE, sqlite_file_name, engine, writer_engine, None, events.hub),
+)
+
+
+def store_id(request: Request) -> str:
+    """The store a request is for, without opening it."""
+    return request.query_params.get("store") or request.headers.get("x-store") or DEFAULT_STORE
+
+
+def current_store(store: Optional[str] = Query(None, description="Branch store id (default: main)"),
+                  x_store: Optional[str] = Header(None)):
+    with registry.use(store or x_store or DEFAULT_STORE) as entry:
+        yield entry
+
+
+def get_session(store: Store = Depends(current_store)):
+    with Session(store.reader) as session:
+        yield session
+
+
+def get_write_session(store: Store = Depends(current_store)):
+    # Use for endpoints that modify data
+    with Session(store.writer) as session:
+        yield session
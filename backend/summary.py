@@ -0,0 +1,178 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import case, func, update
+from sqlmodel import Session, select
+
+from .models import HomeopathicMedicine, InventorySummary, InventoryVersion
+
+# Maintained dashboard counters.
+# Mutations apply small deltas to the single InventorySummary row in the same
+# database transaction as the change itself; the expiry counts are recomputed
+# once per day (rollover) with indexed range counts. Every one of these
+# writes also bumps the inventory version that HTTP caching is keyed on.
+
+EXPIRING_SOON_DAYS = 60
+SUMMARY_ID = 1
+VERSION_ID = 1
+
+
+def _is_low(quantity: int, threshold: int) -> bool:
+    return quantity <= threshold
+
+
+def _expiry_counts(session: Session, today: date, days: int):
+    horizon = today + timedelta(days=days)
+    expired = session.exec(
+        select(func.count()).where(HomeopathicMedicine.expiry_date < today)
+    ).one()
+    expiring = session.exec(
+        select(func.count()).where(
+            HomeopathicMedicine.expiry_date >= today, HomeopathicMedicine.expiry_date <= horizon
+        )
+    ).one()
+    return expired, expiring
+
+
+def bump_version(session: Session):
+    """Mark the inventory as changed (caller commits)."""
+    result = session.execute(
+        update(InventoryVersion).where(InventoryVersion.id == VERSION_ID)
+        .values(version=InventoryVersion.version + 1, updated_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount == 0:
+        session.add(InventoryVersion(id=VERSION_ID, version=1))
+        session.flush()
+
+
+def current_version(session: Session):
+    """(version, updated_at) of the inventory; (0, None) before the first write."""
+    row = session.exec(
+        select(InventoryVersion.version, InventoryVersion.updated_at).where(InventoryVersion.id == VERSION_ID)
+    ).first()
+    return tuple(row) if row else (0, None)
+
+
+def rebuild_summary(session: Session, today: Optional[date] = None) -> InventorySummary:
+    """Recompute every counter from the catalogue (one aggregate query)."""
+    today = today or date.today()
+    M = HomeopathicMedicine
+    skus, units, value_purchase, value_mrp, low = session.exec(
+        select(
+            func.count(),
+            func.coalesce(func.sum(M.quantity), 0),
+            func.coalesce(func.sum(M.quantity * M.purchase_price), 0),
+            func.coalesce(func.sum(M.quantity * M.mrp), 0),
+            func.coalesce(func.sum(case((M.quantity <= M.low_stock_threshold, 1), else_=0)), 0),
+        )
+    ).one()
+    expired, expiring = _expiry_counts(session, today, EXPIRING_SOON_DAYS)
+
+    summary = session.get(InventorySummary, SUMMARY_ID) or InventorySummary(id=SUMMARY_ID, as_of=today)
+    summary.total_skus = skus
+    summary.total_units = units
+    summary.stock_value_purchase = Decimal(str(value_purchase)).quantize(Decimal("0.01"))
+    summary.stock_value_mrp = Decimal(str(value_mrp)).quantize(Decimal("0.01"))
+    summary.low_stock_count = low
+    summary.expired_count = expired
+    summary.expiring_count = expiring
+    summary.as_of = today
+    summary.updated_at = datetime.utcnow()
+    session.add(summary)
+    session.flush()
+    bump_version(session)
+    return summary
+
+
+def _apply_deltas(session: Session, **deltas):
+    values = {
+        name: getattr(InventorySummary, name) + delta for name, delta in deltas.items() if delta
+    }
+    values["updated_at"] = datetime.utcnow()
+    result = session.execute(
+        update(InventorySummary).where(InventorySummary.id == SUMMARY_ID).values(**values),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount == 0:
+        # No summary yet (new or upgraded database): build it from scratch.
+        # The caller's change is already flushed, so it is included.
+        rebuild_summary(session)
+    else:
+        bump_version(session)
+
+
+def record_medicine(session: Session, medicine: HomeopathicMedicine, sign: int):
+    """Count a medicine row in (+1, after session.add) or out (-1, after session.delete)."""
+    session.flush()
+    as_of = session.exec(select(InventorySummary.as_of).where(InventorySummary.id == SUMMARY_ID)).first()
+    as_of = as_of or date.today()
+    expiry = medicine.expiry_date
+    quantity = medicine.quantity
+    _apply_deltas(
+        session,
+        total_skus=sign,
+        total_units=sign * quantity,
+        stock_value_purchase=Decimal(sign * quantity) * Decimal(str(medicine.purchase_price)),
+        stock_value_mrp=Decimal(sign * quantity) * Decimal(str(medicine.mrp)),
+        low_stock_count=sign if _is_low(quantity, medicine.low_stock_threshold) else 0,
+        expired_count=sign if expiry < as_of else 0,
+        expiring_count=sign if as_of <= expiry <= as_of + timedelta(days=EXPIRING_SOON_DAYS) else 0,
+    )
+
+
+def record_stock_change(session: Session, new_quantity: int, change: int, threshold: int, mrp, purchase_price):
+    old_quantity = new_quantity - change
+    low_delta = int(_is_low(new_quantity, threshold)) - int(_is_low(old_quantity, threshold))
+    _apply_deltas(
+        session,
+        total_units=change,
+        stock_value_purchase=Decimal(change) * Decimal(str(purchase_price)),
+        stock_value_mrp=Decimal(change) * Decimal(str(mrp)),
+        low_stock_count=low_delta,
+    )
+
+
+def rollover(session: Session, today: Optional[date] = None) -> InventorySummary:
+    """Move the expiry counts forward to ``today`` (batches expire overnight)."""
+    today = today or date.today()
+    summary = session.get(InventorySummary, SUMMARY_ID, populate_existing=True)
+    if summary is None:
+        return rebuild_summary(session, today)
+    if summary.as_of != today:
+        summary.expired_count, summary.expiring_count = _expiry_counts(session, today, EXPIRING_SOON_DAYS)
+        summary.as_of = today
+        summary.updated_at = datetime.utcnow()
+        session.add(summary)
+        session.flush()
+        bump_version(session)
+    return summary
+
+
+def get_summary(session: Session, write_session: Session, expiring_within: int = EXPIRING_SOON_DAYS) -> dict:
+    """Dashboard counters. Reads one row; writes only on the first call of a day."""
+    today = date.today()
+    summary = session.get(InventorySummary, SUMMARY_ID, populate_existing=True)
+    if summary is None or summary.as_of != today:
+        summary = rollover(write_session, today)
+        write_session.commit()
+        write_session.refresh(summary)
+
+    expiring = summary.expiring_count
+    if expiring_within != EXPIRING_SOON_DAYS:
+        # Non-default window: one indexed range count
+        expiring = _expiry_counts(session, today, expiring_within)[1]
+
+    return {
+        "total_skus": summary.total_skus,
+        "total_units": summary.total_units,
+        "stock_value_purchase": summary.stock_value_purchase,
+        "stock_value_mrp": summary.stock_value_mrp,
+        "expired_count": summary.expired_count,
+        "expiring_within_days": expiring_within,
+        "expiring_count": expiring,
+        "low_stock_count": summary.low_stock_count,
+        "as_of": summary.as_of,
+        "updated_at": summary.updated_at,
+    }
@@ -1,15 +1,22 @@
 import PyInstaller.__main__
+import argparse
 import os
 import shutil
 
 # Configuration
 APP_NAME = "HomeoVault"
-BACKEND_ENTRY = "backend/main.py"
+BACKEND_ENTRY = "backend/__main__.py"
 FRONTEND_DIR = "frontend"
 DATABASE_DIR = "database"
 
-def build():
-    print(f"Building {APP_NAME}...")
+# Never imported by the server; leaving them out makes the bundle smaller
+EXCLUDED_MODULES = ["tkinter", "unittest", "pydoc_data", "lib2to3"]
+
+def pyinstaller_version():
+    return tuple(int(part) for part in PyInstaller.__version__.split(".")[:2] if part.isdigit())
+
+def build(onefile=False):
+    print(f"Building {APP_NAME} ({'one file' if onefile else 'one folder'})...")
 
     # Ensure clean build
     if os.path.exists("dist"):
@@ -21,13 +28,17 @@ def build():
     args = [
         BACKEND_ENTRY,
         f"--name={APP_NAME}",
-        "--onefile",
+        # One folder (the default) starts much faster: a --onefile build
+        # unpacks the whole archive to a temporary directory on every launch
+        "--onefile" if onefile else "--onedir",
         "--clean",
+        # UPX-compressed libraries would be decompressed on every launch too
+        "--noupx",
+        # The entry point imports the backend package from the project root
+        "--paths=.",
         # Include Frontend files
         f"--add-data={FRONTEND_DIR}{os.pathsep}frontend",
-        # Include Database directory (empty structure, not the db file itself usually, but here we want it)
-        # We might want to handle DB creation on startup if missing, which we do.
-        # But let's verify if we need to bundle anything else.
+        # The database is created on first start if missing.
         # Hidden imports often needed for SQLModel/FastAPI/Uvicorn
         "--hidden-import=uvicorn.logging",
         "--hidden-import=uvicorn.loops",
@@ -39,10 +50,23 @@ def build():
         "--hidden-import=uvicorn.lifespan.on",
         "--hidden-import=sqlmodel",
         "--hidden-import=sqlite3",
+        # Imported on first use (exports, imports), not at startup
+        "--hidden-import=backend.csv_io",
     ]
+    args += [f"--exclude-module={name}" for name in EXCLUDED_MODULES]
+    # Bytecode is compiled at build time either way; PyInstaller 6.6+ can
+    # also compile it optimized (no assert statements)
+    if pyinstaller_version() >= (6, 6):
+        args.append("--optimize=1")
 
     PyInstaller.__main__.run(args)
-    print("Build Complete. Executable is in 'dist/' folder.")
+    if onefile:
+        print("Build Complete. Executable is in 'dist/' folder.")
+    else:
+        print(f"Build Complete. Ship the whole 'dist/{APP_NAME}/' folder; the executable is inside it.")
 
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser(description=f"Package {APP_NAME} with PyInstaller.")
+    parser.add_argument("--onefile", action="store_true",
+                        help="Single executable (easier to copy, slower to start)")
+    build(parser.parse_args().onefile)
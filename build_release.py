@@ -18,7 +18,8 @@ def build():
     add_data = f"frontend{sep}frontend"
     
     # 3. run PyInstaller
-    # --onefile: Create a single executable
+    # --onedir: One folder; starts faster than --onefile, which unpacks
+    #   everything to a temporary directory on every launch (see build.py)
     # --name: Name of the executable
     # --add-data: Include frontend files
     # --hidden-import: Ensure sqlmodel/fastapi dependencies are found
@@ -26,19 +27,22 @@ def build():
     cmd = [
         sys.executable, "-m", "PyInstaller",
         "--name=SimpleVault",
-        "--onefile",
+        "--onedir",
+        "--noupx",
+        "--paths=.",
         f"--add-data={add_data}",
         "--hidden-import=uvicorn",
         "--hidden-import=sqlmodel",
         "--hidden-import=sqlite3",
-        "backend/main.py"
+        "--hidden-import=backend.csv_io",
+        "backend/__main__.py"
     ]
     
     print(f"Running: {' '.join(cmd)}")
     subprocess.check_call(cmd)
     
     print("Build Complete.")
-    print(f"Executable should be in 'dist/SimpleVault'")
+    print(f"Executable should be in 'dist/SimpleVault/' (ship the whole folder)")
 
 if __name__ == "__main__":
     # Ensure we are in project root
@@ -1,4 +1,7 @@
 const API_URL = '/api';
+// Branch store of a chain (open the page with ?store=<id>); main when absent
+const STORE = new URLSearchParams(location.search).get('store');
+const STORE_HEADERS = STORE ? { 'X-Store': STORE } : {};
 
 // --- Store Name Logic ---
 function editStoreName() {
@@ -22,10 +25,9 @@ if (savedName) updateTitle(savedName);
 
 // --- Initialization ---
 document.addEventListener('DOMContentLoaded', () => {
-    fetchMedicines();
     setupEventListeners();
-    // Health check loop
-    setInterval(checkHealth, 5000);
+    // The first "reset" event loads the list; later events patch it
+    connectEvents();
 });
 
 function setupEventListeners() {
@@ -36,111 +38,243 @@ function setupEventListeners() {
     document.getElementById('add-form').addEventListener('submit', handleAddStock);
 }
 
+// --- Conditional GETs ---
+// Responses are kept with their ETag and revalidated with If-None-Match; an
+// unchanged resource comes back as an empty 304 and the kept copy is reused.
+const HTTP_CACHE_LIMIT = 50;
+const httpCache = new Map(); // url -> { etag, data, nextCursor }
+
+async function getJson(url) {
+    const cached = httpCache.get(url);
+    const headers = cached ? { ...STORE_HEADERS, 'If-None-Match': cached.etag } : STORE_HEADERS;
+    // no-store: this cache does the revalidation, not the browser's
+    const res = await fetch(url, { headers, cache: 'no-store' });
+    if (res.status === 304 && cached) {
+        httpCache.delete(url); // re-insert: most recently used last
+        httpCache.set(url, cached);
+        return { ...cached, changed: false };
+    }
+    if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+    const entry = { etag: res.headers.get('ETag'), data: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+    if (entry.etag) {
+        httpCache.delete(url);
+        httpCache.set(url, entry);
+        if (httpCache.size > HTTP_CACHE_LIMIT) httpCache.delete(httpCache.keys().next().value);
+    }
+    return { ...entry, changed: true };
+}
+
 // --- Health Check ---
-async function checkHealth() {
+function setOnline(online) {
     const indicator = document.getElementById('status-indicator');
-    try {
-        const res = await fetch(`${API_URL}/health`);
-        if (res.ok) {
-            indicator.textContent = "System Online";
-            indicator.className = "status-ok";
-        } else {
-            throw new Error("Server error");
-        }
-    } catch (e) {
-        indicator.textContent = "Offline / Connection Lost";
-        indicator.className = "status-error";
-    }
+    indicator.textContent = online ? "System Online" : "Offline / Connection Lost";
+    indicator.className = online ? "status-ok" : "status-error";
 }
 
 // --- Core Data Logic ---
-async function fetchMedicines() {
+const PAGE_SIZE = 100;
+let listState = { cursor: null, filters: {}, loaded: [], firstPageUrl: null };
+
+// Columnar responses (one array per field) are smaller on the wire
+function fromColumns(columns) {
+    const names = Object.keys(columns);
+    const count = names.length ? columns[names[0]].length : 0;
+    const rows = [];
+    for (let i = 0; i < count; i++) {
+        const row = {};
+        names.forEach(name => { row[name] = columns[name][i]; });
+        rows.push(row);
+    }
+    return rows;
+}
+
+function buildQuery(params) {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value !== null && value !== undefined && value !== '') query.set(key, value);
+    });
+    return query.toString();
+}
+
+// Fetch the first page (reset) or the next page of the inventory list
+async function fetchMedicines(reset = true) {
     const container = document.getElementById('items-container');
-    container.innerHTML = '<div class="loading">Loading inventory...</div>';
+    if (reset) {
+        listState.cursor = null;
+        if (!listState.firstPageUrl) container.innerHTML = '<div class="loading">Loading inventory...</div>';
+    }
 
     try {
-        const res = await fetch(`${API_URL}/medicines`);
-        if (!res.ok) throw new Error("Failed to fetch");
-        const medicines = await res.json();
-        renderMedicines(medicines);
-        updateStats(medicines);
+        const query = buildQuery({ ...listState.filters, limit: PAGE_SIZE, cursor: listState.cursor, format: 'columns' });
+        const url = `${API_URL}/medicines?${query}`;
+        const { data: columns, nextCursor, changed } = await getJson(url);
+        const medicines = fromColumns(columns);
+        if (reset) updateStats();
+        // Same first page as on screen and unchanged: keep the rendered list
+        if (reset && !changed && listState.firstPageUrl === url && listState.loaded.length === medicines.length) {
+            listState.cursor = nextCursor;
+            updateLoadMore();
+            return;
+        }
+        if (reset) {
+            listState.loaded = [];
+            listState.firstPageUrl = url;
+        }
+        listState.cursor = nextCursor;
+        listState.loaded = listState.loaded.concat(medicines);
+        renderMedicines(medicines, !reset);
+        updateLoadMore();
     } catch (err) {
         console.error(err);
         container.innerHTML = '<div class="error-message">Could not load inventory. Check server connection.</div>';
     }
 }
 
-function renderMedicines(medicines) {
+function updateLoadMore() {
+    const btn = document.getElementById('load-more-btn');
+    if (btn) btn.style.display = listState.cursor ? 'block' : 'none';
+}
+
+function loadMoreMedicines() {
+    if (listState.cursor) fetchMedicines(false);
+}
+window.loadMoreMedicines = loadMoreMedicines;
+
+function renderMedicines(medicines, append = false) {
     const container = document.getElementById('items-container');
-    container.innerHTML = '';
+    if (!append) container.innerHTML = '';
 
-    if (medicines.length === 0) {
+    if (medicines.length === 0 && !append) {
         container.innerHTML = '<div class="empty-state">No medicines found. Click "+ Add Stock" to begin.</div>';
         return;
     }
 
-    medicines.forEach(med => {
-        const card = document.createElement('div');
-        card.className = 'item-card';
+    medicines.forEach(med => container.appendChild(renderCard(med)));
+}
 
-        // Check expiry status
-        const today = new Date().toISOString().split('T')[0];
-        const isExpired = med.expiry_date < today;
-
-        // Calculate days to expiry
-        const daysToExpiry = Math.ceil((new Date(med.expiry_date) - new Date()) / (1000 * 60 * 60 * 24));
-        let expiryClass = 'status-expiry';
-        let expiryText = `Exp: ${med.expiry_date}`;
-
-        if (isExpired) {
-            expiryClass += ' expired';
-            expiryText = `EXPIRED (${med.expiry_date})`;
-        } else if (daysToExpiry <= 60) {
-            expiryClass += ' near';
-            expiryText = `Expiring Soon (${med.expiry_date})`;
-        }
+function renderCard(med) {
+    const card = document.createElement('div');
+    card.className = 'item-card';
+    card.dataset.id = med.id;
 
-        card.innerHTML = `
-            <div class="item-info">
-                <h3>${med.medicine_name} <span class="sku-badge">${med.potency}</span></h3>
-                <div class="details">
-                    <span class="sku-badge">${med.form}</span>
-                    <span class="sku-badge">${med.bottle_size}</span>
-                    <span class="sku-badge">${med.manufacturer}</span>
-                </div>
-                <div class="batch-info">
-                    Batch: <strong>${med.batch_number}</strong> | 
-                    <span class="${expiryClass}">${expiryText}</span>
-                </div>
-                <div class="price-info" style="margin-top: 5px; color: #555;">
-                     MRP: ₹${med.mrp} | Stock: <strong>${med.quantity}</strong>
-                </div>
+    // Check expiry status
+    const today = new Date().toISOString().split('T')[0];
+    const isExpired = med.expiry_date < today;
+
+    // Calculate days to expiry
+    const daysToExpiry = Math.ceil((new Date(med.expiry_date) - new Date()) / (1000 * 60 * 60 * 24));
+    let expiryClass = 'status-expiry';
+    let expiryText = `Exp: ${med.expiry_date}`;
+
+    if (isExpired) {
+        expiryClass += ' expired';
+        expiryText = `EXPIRED (${med.expiry_date})`;
+    } else if (daysToExpiry <= 60) {
+        expiryClass += ' near';
+        expiryText = `Expiring Soon (${med.expiry_date})`;
+    }
+
+    card.innerHTML = `
+        <div class="item-info">
+            <h3>${med.medicine_name} <span class="sku-badge">${med.potency}</span></h3>
+            <div class="details">
+                <span class="sku-badge">${med.form}</span>
+                <span class="sku-badge">${med.bottle_size}</span>
+                <span class="sku-badge">${med.manufacturer}</span>
+            </div>
+            <div class="batch-info">
+                Batch: <strong>${med.batch_number}</strong> | 
+                <span class="${expiryClass}">${expiryText}</span>
             </div>
-            <div class="item-actions">
-                <button class="qty-btn minus" onclick="sellMedicine(${med.id}, '${med.medicine_name}', ${isExpired})">SELL</button>
-                <button class="delete-btn" onclick="deleteMedicine(${med.id})">🗑️</button>
+            <div class="price-info" style="margin-top: 5px; color: #555;">
+                 MRP: ₹${med.mrp} | Stock: <strong>${med.quantity}</strong>
             </div>
-        `;
-        container.appendChild(card);
+        </div>
+        <div class="item-actions">
+            <button class="qty-btn minus" onclick="sellMedicine(${med.id}, '${med.medicine_name}', ${isExpired})">SELL</button>
+            <button class="delete-btn" onclick="deleteMedicine(${med.id})">🗑️</button>
+        </div>
+    `;
+    return card;
+}
+
+// --- Live Updates ---
+// One Server-Sent Events stream replaces polling: changes committed on any
+// terminal arrive as deltas and patch the cards on screen. EventSource
+// reconnects by itself and sends the last event id, so the server replays
+// exactly what was missed ("reset" when too much was).
+let eventSource = null;
+
+function connectEvents() {
+    // EventSource can't send headers, so the store goes in the query
+    eventSource = new EventSource(`${API_URL}/events${STORE ? `?store=${encodeURIComponent(STORE)}` : ''}`);
+    eventSource.onopen = () => setOnline(true);
+    eventSource.onerror = () => setOnline(false);
+    eventSource.addEventListener('health', () => setOnline(true));
+    eventSource.addEventListener('reset', () => fetchMedicines());
+    eventSource.addEventListener('changes', e => applyChanges(JSON.parse(e.data)));
+    eventSource.addEventListener('summary', e => renderStats(JSON.parse(e.data)));
+    eventSource.addEventListener('alert', e => showAlerts(JSON.parse(e.data)));
+}
+
+function showAlerts({ low_stock, expired }) {
+    const indicator = document.getElementById('status-indicator');
+    const names = low_stock.map(m => `${m.medicine_name} (${m.quantity} left)`)
+        .concat(expired.map(m => `${m.medicine_name} EXPIRED`));
+    indicator.title = names.join('\n');
+}
+
+function applyChanges({ upserts, deletes }) {
+    if (upserts.length === 0 && deletes.length === 0) return;
+    const container = document.getElementById('items-container');
+    const gone = new Set(deletes);
+    const changed = new Map(upserts.map(m => [m.id, m]));
+
+    listState.loaded = listState.loaded
+        .filter(m => !gone.has(m.id))
+        .map(m => changed.get(m.id) || m);
+    gone.forEach(id => {
+        const card = container.querySelector(`.item-card[data-id="${id}"]`);
+        if (card) card.remove();
+    });
+    changed.forEach((med, id) => {
+        const card = container.querySelector(`.item-card[data-id="${id}"]`);
+        if (card) {
+            card.replaceWith(renderCard(med));
+        } else if (listState.firstPageUrl && !listState.cursor && isUnfilteredList()) {
+            // The whole list is on screen: new rows go in name order
+            listState.loaded.push(med);
+            const next = Array.from(container.querySelectorAll('.item-card'))
+                .find(c => listState.loaded.find(m => m.id == c.dataset.id).medicine_name > med.medicine_name);
+            container.querySelector('.empty-state')?.remove();
+            container.insertBefore(renderCard(med), next || null);
+        }
     });
 }
 
-function updateStats(medicines) {
-    const today = new Date().toISOString().split('T')[0];
+function isUnfilteredList() {
+    return Object.keys(listState.filters).length === 0 && !document.getElementById('search-box').value.trim();
+}
 
-    const totalMedicines = medicines.length;
-    const totalBottles = medicines.reduce((sum, m) => sum + m.quantity, 0);
-    const expiredCount = medicines.filter(m => m.expiry_date < today).length;
-    const lowStockCount = medicines.filter(m => m.quantity <= m.low_stock_threshold).length;
+// Dashboard counters come from the server-maintained summary (O(1))
+async function updateStats() {
+    try {
+        const { data: summary, changed } = await getJson(`${API_URL}/summary`);
+        if (changed) renderStats(summary);
+    } catch (err) {
+        console.error(err);
+    }
+}
 
-    document.getElementById('total-medicines').textContent = totalMedicines;
-    document.getElementById('total-bottles').textContent = totalBottles;
-    document.getElementById('expired-count').textContent = expiredCount;
-    document.getElementById('low-stock-count').textContent = lowStockCount;
+function renderStats(summary) {
+    document.getElementById('total-medicines').textContent = summary.total_skus;
+    document.getElementById('total-bottles').textContent = summary.total_units;
+    document.getElementById('expired-count').textContent = summary.expired_count;
+    document.getElementById('low-stock-count').textContent = summary.low_stock_count;
 
     // Visual Alerts
-    document.querySelector('.stat-card.expired').style.opacity = expiredCount > 0 ? '1' : '0.7';
-    document.querySelector('.stat-card.low-stock').style.opacity = lowStockCount > 0 ? '1' : '0.7';
+    document.querySelector('.stat-card.expired').style.opacity = summary.expired_count > 0 ? '1' : '0.7';
+    document.querySelector('.stat-card.low-stock').style.opacity = summary.low_stock_count > 0 ? '1' : '0.7';
 }
 
 // --- Action Handlers ---
@@ -168,7 +302,7 @@ async function handleAddStock(e) {
     try {
         const res = await fetch(`${API_URL}/medicines`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { ...STORE_HEADERS, 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
         });
 
@@ -176,7 +310,6 @@ async function handleAddStock(e) {
 
         if (res.ok) {
             closeModal();
-            fetchMedicines();
             document.getElementById('add-form').reset();
             alert("Stock Added Successfully!");
         } else {
@@ -203,7 +336,7 @@ async function sellMedicine(id, name, isExpired) {
     try {
         const res = await fetch(`${API_URL}/transaction`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { ...STORE_HEADERS, 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 medicine_id: id,
                 change_amount: -1,
@@ -213,7 +346,7 @@ async function sellMedicine(id, name, isExpired) {
         });
 
         if (res.ok) {
-            fetchMedicines(); // Refresh UI
+            // The sold card is patched by the "changes" event
         } else {
             const err = await res.json();
             alert("Sale Failed: " + err.detail);
@@ -227,14 +360,41 @@ async function deleteMedicine(id) {
     if (!confirm("Are you sure? This will delete the medicine record permanently.")) return;
 
     try {
-        const res = await fetch(`${API_URL}/medicines/${id}`, { method: 'DELETE' });
-        if (res.ok) fetchMedicines();
-        else alert("Delete failed");
+        const res = await fetch(`${API_URL}/medicines/${id}`, { method: 'DELETE', headers: STORE_HEADERS });
+        if (!res.ok) alert("Delete failed"); // the card goes with the "changes" event
     } catch (e) {
         alert("Network error");
     }
 }
 
+async function importCsv(input) {
+    const file = input.files[0];
+    if (!file) return;
+    const form = new FormData();
+    form.append('file', file);
+
+    try {
+        const res = await fetch(`${API_URL}/import`, { method: 'POST', body: form, headers: STORE_HEADERS });
+        const result = await res.json();
+        if (res.ok) {
+            let message = `Imported ${result.processed} rows (${result.inserted} new, ${result.updated} updated).`;
+            if (result.error_count > 0) {
+                const sample = result.errors.slice(0, 10).map(e => `Line ${e.line}: ${e.error}`).join('\n');
+                message += `\n${result.error_count} rows skipped:\n${sample}`;
+            }
+            alert(message);
+            fetchMedicines();
+        } else {
+            alert("Import Failed: " + (result.detail || "Unknown error"));
+        }
+    } catch (e) {
+        alert("Network error during import");
+    } finally {
+        input.value = '';
+    }
+}
+window.importCsv = importCsv;
+
 // --- Reports Logic ---
 async function showReports() {
     openModal('reports-modal');
@@ -242,16 +402,15 @@ async function showReports() {
     document.getElementById('report-low').innerHTML = 'Loading...';
 
     try {
-        const res = await fetch(`${API_URL}/medicines`);
-        const medicines = await res.json();
+        // Let the server filter: expired/near-expiry and low stock lists only
+        const [{ data: expired }, { data: low }] = await Promise.all([
+            getJson(`${API_URL}/medicines?${buildQuery({ expiring_within: 60, sort: 'expiry_date', limit: 500 })}`),
+            getJson(`${API_URL}/medicines?${buildQuery({ low_stock: true, sort: 'quantity', limit: 500 })}`)
+        ]);
 
         const today = new Date().toISOString().split('T')[0];
 
         // Expired Report
-        const expired = medicines.filter(m => {
-            const daysToExpiry = Math.ceil((new Date(m.expiry_date) - new Date()) / (1000 * 60 * 60 * 24));
-            return m.expiry_date < today || daysToExpiry <= 60;
-        });
 
         if (expired.length === 0) {
             document.getElementById('report-expired').innerHTML = '<p class="status-ok">No expired or near-expiry items.</p>';
@@ -272,7 +431,6 @@ async function showReports() {
         }
 
         // Low Stock Report
-        const low = medicines.filter(m => m.quantity <= m.low_stock_threshold);
         if (low.length === 0) {
             document.getElementById('report-low').innerHTML = '<p class="status-ok">Stock levels are healthy.</p>';
         } else {
@@ -295,17 +453,27 @@ async function showReports() {
 }
 
 // --- History Logic ---
+let historyCursor = null;
+
 async function showHistory() {
     const list = document.getElementById('history-list');
     list.innerHTML = 'Loading...';
     openModal('history-modal');
+    historyCursor = null;
+    await loadHistoryPage(true);
+}
+
+async function loadHistoryPage(reset = false) {
+    const list = document.getElementById('history-list');
 
     try {
-        const res = await fetch(`${API_URL}/history`);
-        const data = await res.json();
-        list.innerHTML = '';
+        const { data, nextCursor } = await getJson(`${API_URL}/history?${buildQuery({ limit: 50, cursor: historyCursor })}`);
+        historyCursor = nextCursor;
+        if (reset) list.innerHTML = '';
+        const oldMore = document.getElementById('history-more-btn');
+        if (oldMore) oldMore.remove();
 
-        if (data.length === 0) {
+        if (reset && data.length === 0) {
             list.innerHTML = '<p>No transactions yet.</p>';
             return;
         }
@@ -329,6 +497,15 @@ async function showHistory() {
             list.appendChild(row);
         });
 
+        if (historyCursor) {
+            const more = document.createElement('button');
+            more.id = 'history-more-btn';
+            more.className = 'btn btn-secondary';
+            more.textContent = 'Load older';
+            more.onclick = () => loadHistoryPage(false);
+            list.appendChild(more);
+        }
+
     } catch (e) {
         list.innerHTML = '<p>Error loading history.</p>';
     }
@@ -352,12 +529,27 @@ function closeModal() {
 }
 window.closeModal = closeModal; // Expose to global for button onclicks
 
-// Search Filter
+// Search (server-side full-text, tolerant of misspellings)
+let searchTimer = null;
+let searchSeq = 0;
 window.filterItems = function () {
-    const term = document.getElementById('search-box').value.toLowerCase();
-    const items = document.querySelectorAll('.item-card');
-    items.forEach(item => {
-        const text = item.textContent.toLowerCase();
-        item.style.display = text.includes(term) ? 'grid' : 'none';
-    });
+    const term = document.getElementById('search-box').value.trim();
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(async () => {
+        if (!term) {
+            fetchMedicines();
+            return;
+        }
+        const seq = ++searchSeq;
+        try {
+            const { data: results } = await getJson(`${API_URL}/search?${buildQuery({ q: term, limit: 50 })}`);
+            if (seq !== searchSeq) return; // a newer keystroke already answered
+            listState.cursor = null;
+            listState.firstPageUrl = null; // the list no longer shows the first page
+            renderMedicines(results);
+            updateLoadMore();
+        } catch (err) {
+            console.error(err);
+        }
+    }, 120);
 }
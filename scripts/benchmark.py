@@ -0,0 +1,533 @@
+"""HomeoVault benchmark harness.
+
+Runs a fixed set of scenarios against the API and reports latency
+percentiles, throughput and error rates:
+
+    seed      bulk CSV import of the catalogue (1k / 10k / 100k SKUs)
+    create    single POST /api/medicines calls
+    mixed     concurrent reads (list, summary, search) and sales
+    rush      concurrent sales only (sales per second at rush hour)
+    history   cursor paging through /api/history
+    export    full CSV export
+    search    typeahead / misspelt / manufacturer queries
+
+At the end the stock of every medicine is checked against the ledger
+(quantity change == sum of ledger changes after seeding) and against the
+maintained /api/summary counters. Any mismatch fails the run.
+
+By default everything runs in-process against a fresh temporary SQLite
+file; pass --url to benchmark a running server instead.
+
+    python scripts/benchmark.py --skus 1000 10000 100000 --output bench.json
+    python scripts/benchmark.py --url http://localhost:8000 --skus 1000
+    python scripts/benchmark.py --skus 10000 --compare bench.json
+    python scripts/benchmark.py --db-mode async --compare bench.json
+
+To compare group commit with the per-request commit, run the same sizes
+with and without --group-commit; --compare prints each scenario's
+throughput next to the p95 latencies:
+
+    python scripts/benchmark.py --workers 32 --output per_request.json
+    python scripts/benchmark.py --workers 32 --group-commit --compare per_request.json
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REMEDIES = [
+    "Arnica Montana", "Belladonna", "Nux Vomica", "Pulsatilla", "Rhus Toxicodendron",
+    "Bryonia Alba", "Calcarea Carbonica", "Sulphur", "Lycopodium", "Sepia",
+    "Natrum Muriaticum", "Phosphorus", "Gelsemium", "Chamomilla", "Aconitum Napellus",
+    "Apis Mellifica", "Arsenicum Album", "Hepar Sulphuris", "Ignatia Amara", "Thuja Occidentalis",
+    "Silicea", "Graphites", "Kali Bichromicum", "Mercurius Solubilis", "Lachesis",
+    "Causticum", "Staphysagria", "Hypericum", "Ruta Graveolens", "Ledum Palustre",
+]
+POTENCIES = ["6C", "30C", "200C", "1M", "Q"]
+FORMS = ["Dilution", "Globules", "Mother Tincture"]
+MANUFACTURERS = ["Dr. Reckeweg", "SBL", "Schwabe", "Bakson", "Adel"]
+SEARCH_QUERIES = ["ar", "arn", "arnica", "arnika", "beladona", "nux vom", "pulsatila", "sbl", "200c"]
+
+# Names per distinct remedy name, roughly what a real catalogue looks like
+SKUS_PER_NAME = 50
+SEED_CHUNK = 5000
+INITIAL_QUANTITY = 1000
+
+
+# --- Clients ---
+
+class InProcessClient:
+    """TestClient against a temporary database (no uvicorn, no network)."""
+
+    def __init__(self, db_path, db_mode="sync", group_commit=False):
+        os.environ["HOMEOVAULT_DB_PATH"] = db_path
+        os.environ["HOMEOVAULT_DB_MODE"] = db_mode
+        os.environ["HOMEOVAULT_GROUP_COMMIT"] = "1" if group_commit else "0"
+        sys.path.insert(0, ROOT)
+        from fastapi.testclient import TestClient
+        from backend.main import app
+        from backend.models import create_db_and_tables, describe_engine
+
+        # Skip the startup hook: no browser, no backup thread
+        create_db_and_tables()
+        self.engine_settings = describe_engine()
+        self._client = TestClient(app)
+        if db_mode == "async":
+            # Async engines belong to one event loop (as under uvicorn), so
+            # keep the client's loop open for the whole run
+            app.router.on_startup.clear()
+            self._client.__enter__()
+
+    def request(self, method, path, **kwargs):
+        return self._client.request(method, path, **kwargs)
+
+
+class LiveClient:
+    """requests.Session against a running server; one session per thread."""
+
+    def __init__(self, base_url):
+        import requests
+        self._requests = requests
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+        self.engine_settings = None
+
+    def request(self, method, path, **kwargs):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        return session.request(method, self.base_url + path, **kwargs)
+
+
+# --- Measurement ---
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)  # operation -> [(seconds, ok)]
+        self.failures = defaultdict(int)  # "operation status" -> count
+
+    def call(self, client, operation, method, path, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = client.request(method, path, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, type(e).__name__
+        elapsed = time.perf_counter() - started
+        ok = status in expect
+        with self._lock:
+            self.samples[operation].append((elapsed, ok))
+            if not ok:
+                self.failures[f"{operation} {status}"] += 1
+        return response if ok else None
+
+    def report(self, wall_seconds):
+        scenario = {}
+        for operation, samples in sorted(self.samples.items()):
+            latencies = sorted(s for s, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            scenario[operation] = {
+                "count": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+            }
+        total = sum(len(s) for s in self.samples.values())
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "requests": total,
+            "throughput_rps": round(total / wall_seconds, 1) if wall_seconds else None,
+            "errors": sum(self.failures.values()),
+            "failures": dict(self.failures),
+            "operations": scenario,
+        }
+
+
+def run_scenario(name, body, results):
+    recorder = Recorder()
+    print(f"  {name} ...", end="", flush=True)
+    started = time.perf_counter()
+    body(recorder)
+    report = recorder.report(time.perf_counter() - started)
+    results[name] = report
+    print(f" {report['requests']} requests in {report['wall_seconds']}s "
+          f"({report['throughput_rps']} req/s, {report['errors']} errors)")
+    return report
+
+
+def run_concurrently(workers, tasks):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(task) for task in tasks]:
+            future.result()
+
+
+# --- Data ---
+
+def catalogue_rows(count, run_id, rng):
+    names = max(1, count // SKUS_PER_NAME)
+    today = date.today()
+    for i in range(count):
+        j = i % names
+        name = REMEDIES[j % len(REMEDIES)] + (f" {j // len(REMEDIES)}" if j >= len(REMEDIES) else "")
+        yield {
+            "Name": name,
+            "Potency": POTENCIES[i % len(POTENCIES)],
+            "Form": FORMS[i % len(FORMS)],
+            "Size": "30ml",
+            "Manufacturer": MANUFACTURERS[i % len(MANUFACTURERS)],
+            "Batch": f"B{run_id}-{i}",
+            # Unexpired, so every batch can be sold
+            "Expiry": (today + timedelta(days=rng.randint(180, 1500))).isoformat(),
+            "MRP": "120.00",
+            "Purchase Price": "70.00",
+            "Quantity": str(INITIAL_QUANTITY),
+        }
+
+
+def csv_text(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def stock_snapshot(client):
+    """medicine id -> (quantity, SKU row) from the CSV export."""
+    response = client.request("GET", "/api/export")
+    response.raise_for_status()
+    return {
+        int(row["ID"]): (int(row["Quantity"]), row)
+        for row in csv.DictReader(io.StringIO(response.text))
+    }
+
+
+def ledger_totals(client):
+    """medicine id -> sum of ledger changes, from the ledger export."""
+    response = client.request("GET", "/api/export/transactions")
+    response.raise_for_status()
+    totals = defaultdict(int)
+    rows = 0
+    for row in csv.DictReader(io.StringIO(response.text)):
+        totals[int(row["Medicine ID"])] += int(row["Change"])
+        rows += 1
+    return totals, rows
+
+
+# --- Scenarios ---
+
+def benchmark(client, skus, workers, operations, seed):
+    rng = random.Random(seed)
+    run_id = f"{seed}{int(time.time()) % 100000}"
+    results = {}
+
+    stock_before = stock_snapshot(client)
+
+    # Catalogue seeding through the bulk import, in upload-sized chunks
+    rows = list(catalogue_rows(skus, run_id, rng))
+
+    def seed_catalogue(rec):
+        for start in range(0, len(rows), SEED_CHUNK):
+            chunk = csv_text(rows[start:start + SEED_CHUNK])
+            rec.call(client, "import_chunk", "POST", "/api/import",
+                     files={"file": ("seed.csv", chunk, "text/csv")})
+
+    run_scenario(f"seed_{skus}", seed_catalogue, results)
+
+    # Single creates
+    def create(rec):
+        def one(i):
+            row = rows[i % len(rows)]
+            rec.call(client, "create_medicine", "POST", "/api/medicines", json={
+                "medicine_name": row["Name"], "potency": row["Potency"], "form": row["Form"],
+                "bottle_size": row["Size"], "manufacturer": row["Manufacturer"],
+                "batch_number": f"C{run_id}-{i}", "expiry_date": row["Expiry"],
+                "mrp": 120.0, "purchase_price": 70.0, "quantity": INITIAL_QUANTITY,
+                "low_stock_threshold": 5,
+            })
+        run_concurrently(workers, [lambda i=i: one(i) for i in range(min(200, operations))])
+
+    run_scenario("create", create, results)
+
+    # The sales below are checked against the ledger from here on
+    stock_seeded = stock_snapshot(client)
+    ledger_seeded, _ = ledger_totals(client)
+    new_ids = sorted(set(stock_seeded) - set(stock_before))
+    if not new_ids:
+        raise SystemExit("Seeding created no medicines; cannot continue.")
+    skus_by_id = {i: stock_seeded[i][1] for i in new_ids}
+
+    # Mixed workload: mostly reads, one in five operations a sale
+    sold = defaultdict(int)
+    sold_lock = threading.Lock()
+
+    def mixed(rec):
+        def one(i):
+            op_rng = random.Random(seed * 1000003 + i)
+            roll = op_rng.random()
+            if roll < 0.1:
+                medicine_id = op_rng.choice(new_ids)
+                if rec.call(client, "sell_batch", "POST", "/api/transaction", json={
+                    "medicine_id": medicine_id, "change_amount": -1,
+                    "action_type": "SELL", "note": "Benchmark sale",
+                }):
+                    with sold_lock:
+                        sold["units"] += 1
+            elif roll < 0.2:
+                sku = skus_by_id[op_rng.choice(new_ids)]
+                if rec.call(client, "sell_sku", "POST", "/api/sell", json={
+                    "medicine_name": sku["Name"], "potency": sku["Potency"], "form": sku["Form"],
+                    "bottle_size": sku["Size"], "manufacturer": sku["Manufacturer"],
+                    "quantity": 1, "note": "Benchmark sale",
+                }):
+                    with sold_lock:
+                        sold["units"] += 1
+            elif roll < 0.5:
+                rec.call(client, "list_medicines", "GET", "/api/medicines",
+                         params={"limit": 50, "sort": op_rng.choice(["name", "-expiry_date", "quantity"])})
+            elif roll < 0.7:
+                rec.call(client, "summary", "GET", "/api/summary")
+            else:
+                rec.call(client, "search", "GET", "/api/search", params={"q": op_rng.choice(SEARCH_QUERIES)})
+        run_concurrently(workers, [lambda i=i: one(i) for i in range(operations)])
+
+    run_scenario("mixed", mixed, results)
+
+    # Rush hour: nothing but single-unit sales, as fast as the clients send them
+    def rush(rec):
+        def one(i):
+            medicine_id = random.Random(seed * 7919 + i).choice(new_ids)
+            if rec.call(client, "rush_sale", "POST", "/api/transaction", json={
+                "medicine_id": medicine_id, "change_amount": -1,
+                "action_type": "SELL", "note": "Benchmark sale",
+            }):
+                with sold_lock:
+                    sold["units"] += 1
+        run_concurrently(workers, [lambda i=i: one(i) for i in range(operations)])
+
+    run_scenario("rush", rush, results)
+
+    # History paging, newest first, as the dashboard does
+    def history(rec):
+        def walk(medicine_id=None):
+            cursor = None
+            for _ in range(20):
+                params = {"limit": 100}
+                if cursor:
+                    params["cursor"] = cursor
+                if medicine_id is not None:
+                    params["medicine_id"] = medicine_id
+                response = rec.call(client, "history_page", "GET", "/api/history", params=params)
+                cursor = response.headers.get("X-Next-Cursor") if response is not None else None
+                if not cursor:
+                    return
+        tasks = [walk] + [lambda m=m: walk(m) for m in rng.sample(new_ids, min(len(new_ids), 50))]
+        run_concurrently(workers, tasks)
+
+    run_scenario("history", history, results)
+
+    def export(rec):
+        for _ in range(3):
+            rec.call(client, "export_csv", "GET", "/api/export")
+            rec.call(client, "export_csv_gzip", "GET", "/api/export", params={"gzip": "true"})
+
+    run_scenario("export", export, results)
+
+    def search(rec):
+        tasks = [
+            lambda q=q: rec.call(client, f"search '{q}'", "GET", "/api/search", params={"q": q})
+            for q in SEARCH_QUERIES for _ in range(20)
+        ]
+        run_concurrently(workers, tasks)
+
+    run_scenario("search", search, results)
+
+    verification = verify(client, stock_seeded, ledger_seeded, sold["units"])
+    return results, verification
+
+
+def verify(client, stock_before, ledger_before, units_sold):
+    stock_after = stock_snapshot(client)
+    ledger_after, ledger_rows = ledger_totals(client)
+    problems = []
+    for medicine_id, (quantity, row) in stock_after.items():
+        start = stock_before[medicine_id][0] if medicine_id in stock_before else INITIAL_QUANTITY
+        moved = ledger_after.get(medicine_id, 0) - ledger_before.get(medicine_id, 0)
+        if quantity - start != moved:
+            problems.append(f"medicine {medicine_id} ({row['Name']} {row['Batch']}): "
+                            f"stock moved {quantity - start}, ledger says {moved}")
+
+    ledger_moved = sum(ledger_after.values()) - sum(ledger_before.values())
+    if ledger_moved != -units_sold:
+        problems.append(f"{units_sold} units sold by the client, ledger moved {ledger_moved}")
+
+    summary = client.request("GET", "/api/summary").json()
+    units = sum(q for q, _ in stock_after.values())
+    if summary["total_units"] != units or summary["total_skus"] != len(stock_after):
+        problems.append(f"summary says {summary['total_skus']} SKUs / {summary['total_units']} units, "
+                        f"export has {len(stock_after)} / {units}")
+
+    return {
+        "ok": not problems,
+        "medicines": len(stock_after),
+        "ledger_rows": ledger_rows,
+        "units_sold": units_sold,
+        "problems": problems[:50],
+    }
+
+
+# --- Comparison ---
+
+def compare(current, baseline, max_regression):
+    """Print p95 changes against a saved run; returns the regressed operations."""
+    regressions = []
+    for size, run in current["runs"].items():
+        base_run = baseline.get("runs", {}).get(size)
+        if not base_run:
+            continue
+        for scenario, report in run["scenarios"].items():
+            base_report = base_run["scenarios"].get(scenario, {})
+            if base_report.get("throughput_rps") and report["throughput_rps"]:
+                change = (report["throughput_rps"] - base_report["throughput_rps"]) / base_report["throughput_rps"] * 100
+                print(f"  {size:>7} {scenario:<12} {'throughput':<22}     {base_report['throughput_rps']:>9.1f} -> "
+                      f"{report['throughput_rps']:>9.1f} req/s ({change:+.0f}%)")
+            base_ops = base_report.get("operations", {})
+            for operation, stats in report["operations"].items():
+                base = base_ops.get(operation)
+                if not base or not base["p95_ms"]:
+                    continue
+                change = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+                flag = ""
+                if change > max_regression:
+                    flag = "  <-- REGRESSION"
+                    regressions.append(f"{size}/{scenario}/{operation}")
+                print(f"  {size:>7} {scenario:<12} {operation:<22} p95 {base['p95_ms']:>9.2f} -> "
+                      f"{stats['p95_ms']:>9.2f} ms ({change:+.0f}%){flag}")
+    return regressions
+
+
+# --- Entry point ---
+
+def run_size(args, skus):
+    if args.url:
+        client = LiveClient(args.url)
+        db_file = None
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="homeovault-bench-")
+        db_file = os.path.join(tmp_dir, "inventory.db")
+        client = InProcessClient(db_file, args.db_mode, args.group_commit)
+
+    commit = "group commit" if args.group_commit else "per-request commit"
+    print(f"\n== {skus} SKUs ({'live ' + args.url if args.url else 'in-process, ' + commit}, {args.workers} workers) ==")
+    scenarios, verification = benchmark(client, skus, args.workers, args.operations, args.seed)
+    print(f"  verification: {'OK' if verification['ok'] else 'FAILED'} "
+          f"({verification['medicines']} medicines, {verification['ledger_rows']} ledger rows)")
+    for problem in verification["problems"]:
+        print(f"    {problem}")
+    run = {"scenarios": scenarios, "verification": verification, "engine": client.engine_settings}
+    if db_file:
+        run["db_bytes"] = os.path.getsize(db_file)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HomeoVault API.")
+    parser.add_argument("--url", help="Benchmark a running server (e.g. http://localhost:8000) instead of in-process")
+    parser.add_argument("--skus", type=int, nargs="+", default=[1000], help="Catalogue sizes to seed, e.g. 1000 10000 100000")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--operations", type=int, default=2000, help="Requests in the mixed workload")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (runs are reproducible)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=25.0, help="Allowed p95 slowdown in percent (with --compare)")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync",
+                        help="In-process only: serve requests from the sync or the async (aiosqlite) routes")
+    parser.add_argument("--group-commit", action="store_true",
+                        help="In-process only: commit sales in batches (HOMEOVAULT_GROUP_COMMIT=1)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # One catalogue size in a fresh interpreter (the app binds its
+        # database path at import time); the parent merges the JSON.
+        json.dump(run_size(args, args.skus[0]), sys.stdout, default=str)
+        return
+
+    runs = {}
+    for skus in args.skus:
+        if args.url or len(args.skus) == 1:
+            runs[str(skus)] = run_size(args, skus)
+            continue
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--skus", str(skus),
+                   "--workers", str(args.workers), "--operations", str(args.operations), "--seed", str(args.seed),
+                   "--db-mode", args.db_mode] + (["--group-commit"] if args.group_commit else [])
+        child = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+        if child.returncode != 0:
+            raise SystemExit(f"Benchmark for {skus} SKUs failed (exit {child.returncode}).")
+        # Progress lines come first; the JSON result is the last line
+        lines = child.stdout.rstrip().splitlines()
+        print("\n".join(lines[:-1]))
+        runs[str(skus)] = json.loads(lines[-1])
+
+    results = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "mode": "live" if args.url else "in-process",
+            "db_mode": None if args.url else args.db_mode,
+            "group_commit": None if args.url else args.group_commit,
+            "url": args.url,
+            "workers": args.workers,
+            "operations": args.operations,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"\nResults written to {args.output}")
+
+    failed = [size for size, run in runs.items() if not run["verification"]["ok"]]
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        regressions = compare(results, baseline, args.max_regression)
+
+    if failed:
+        raise SystemExit(f"Stock does not match the ledger for: {', '.join(failed)} SKUs")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} operation(s) regressed more than {args.max_regression}%")
+
+
+if __name__ == "__main__":
+    main()
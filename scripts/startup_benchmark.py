@@ -0,0 +1,256 @@
+"""HomeoVault cold-start benchmark.
+
+Measures how long it takes from launching the server until the dashboard
+can be used, and where the time goes:
+
+    imports   `python -X importtime` report for backend.main: total import
+              time, the slowest modules and the time per top-level package
+    launch    starts the server N times against a temporary database and
+              times the first successful GET /index.html (dashboard),
+              GET /api/summary (first API answer) and the moment the
+              deferred startup maintenance reports "done"; the server's own
+              timeline from /api/metrics/startup is included
+
+Launches `python -m backend` by default; pass --exe to time a packaged
+build (dist/HomeoVault/HomeoVault or the --onefile executable) instead.
+
+    python scripts/startup_benchmark.py --output startup.json
+    python scripts/startup_benchmark.py --exe dist/HomeoVault/HomeoVault --runs 10
+    python scripts/startup_benchmark.py --compare startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POLL_SECONDS = 0.01
+TIMEOUT_SECONDS = 120
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def isolated_env(tmp_dir, port):
+    """Environment for a server that only touches ``tmp_dir``."""
+    env = dict(os.environ)
+    env.update({
+        "HOMEOVAULT_DB_PATH": os.path.join(tmp_dir, "inventory.db"),
+        "HOMEOVAULT_BACKUP_DIR": os.path.join(tmp_dir, "backups"),
+        "HOMEOVAULT_PORT": str(port),
+        "HOMEOVAULT_HOST": "127.0.0.1",
+        "HOMEOVAULT_OPEN_BROWSER": "0",
+    })
+    return env
+
+
+# --- Import profile ---
+
+def import_profile(top):
+    """Parse `python -X importtime -c "import backend.main"`."""
+    tmp_dir = tempfile.mkdtemp(prefix="homeovault-startup-")
+    try:
+        child = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+            cwd=ROOT, env=isolated_env(tmp_dir, 0), stderr=subprocess.PIPE, text=True,
+        )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if child.returncode != 0:
+        raise SystemExit(f"Importing backend.main failed:\n{child.stderr[-2000:]}")
+
+    modules = []
+    for line in child.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    total_us = sum(self_us for _, self_us, _, _ in modules)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    # Imported directly by our modules: what a lazy import could save
+    backend_imports = sorted(
+        ((name, cumulative_us) for name, _, cumulative_us, _ in modules if name.startswith("backend.")),
+        key=lambda m: -m[1],
+    )
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "modules": len(modules),
+        "slowest": [{"module": name, "self_ms": round(s / 1000, 2), "cumulative_ms": round(c / 1000, 2)}
+                    for name, s, c, _ in sorted(modules, key=lambda m: -m[1])[:top]],
+        "packages": [{"package": name, "ms": round(us / 1000, 1)}
+                     for name, us in sorted(packages.items(), key=lambda p: -p[1])[:top]],
+        "backend": [{"module": name, "cumulative_ms": round(c / 1000, 2)} for name, c in backend_imports],
+    }
+
+
+def print_import_profile(profile):
+    print(f"\n== Imports: {profile['total_ms']} ms for {profile['modules']} modules ==")
+    print("  by package:")
+    for entry in profile["packages"]:
+        share = entry["ms"] / profile["total_ms"] * 100 if profile["total_ms"] else 0
+        print(f"    {entry['package']:<28} {entry['ms']:>8.1f} ms {share:>5.1f}%")
+    print("  slowest modules (self time):")
+    for entry in profile["slowest"]:
+        print(f"    {entry['module']:<44} {entry['self_ms']:>8.2f} ms (cumulative {entry['cumulative_ms']:.2f})")
+    print("  backend modules (cumulative):")
+    for entry in profile["backend"]:
+        print(f"    {entry['module']:<44} {entry['cumulative_ms']:>8.2f} ms")
+
+
+# --- Launch timing ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+    except OSError:
+        return None, b""
+
+
+def launch_once(command, seed_db):
+    tmp_dir = tempfile.mkdtemp(prefix="homeovault-startup-")
+    port = free_port()
+    env = isolated_env(tmp_dir, port)
+    if seed_db:
+        shutil.copy(seed_db, env["HOMEOVAULT_DB_PATH"])
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {}
+    try:
+        pending = {"dashboard_ms": "/index.html", "first_api_ms": "/api/summary"}
+        while pending or "maintenance_done_ms" not in timings:
+            elapsed = time.perf_counter() - started
+            if elapsed > TIMEOUT_SECONDS or server.poll() is not None:
+                raise SystemExit(f"Server did not come up (exit code {server.poll()}, {elapsed:.1f}s)")
+            for key, path in list(pending.items()):
+                if get(base + path)[0] == 200:
+                    timings[key] = round((time.perf_counter() - started) * 1000, 1)
+                    del pending[key]
+            if not pending:
+                status, body = get(base + "/api/health")
+                if status == 200 and json.loads(body)["maintenance"]["state"] == "done":
+                    timings["maintenance_done_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            time.sleep(POLL_SECONDS)
+        status, body = get(base + "/api/metrics/startup")
+        timings["server_timeline"] = json.loads(body) if status == 200 else None
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return timings
+
+
+def launch_report(command, runs, seed_db):
+    samples = []
+    for i in range(runs):
+        samples.append(launch_once(command, seed_db))
+        print(f"  run {i + 1}: dashboard {samples[-1]['dashboard_ms']} ms, "
+              f"maintenance done {samples[-1]['maintenance_done_ms']} ms")
+    report = {}
+    for key in ("dashboard_ms", "first_api_ms", "maintenance_done_ms"):
+        values = sorted(s[key] for s in samples)
+        report[key] = {"p50": percentile(values, 50), "min": values[0], "max": values[-1]}
+    report["server_timeline"] = samples[-1]["server_timeline"]
+    return report
+
+
+def compare(current, baseline, max_regression):
+    """Print p50 changes against a saved run; returns the regressed measurements."""
+    regressions = []
+    for key, stats in current["launch"].items():
+        base = baseline.get("launch", {}).get(key)
+        if not isinstance(stats, dict) or "p50" not in stats or not base or not base.get("p50"):
+            continue
+        change = (stats["p50"] - base["p50"]) / base["p50"] * 100
+        flag = ""
+        if change > max_regression:
+            flag = "  <-- REGRESSION"
+            regressions.append(key)
+        print(f"  {key:<22} p50 {base['p50']:>9.1f} -> {stats['p50']:>9.1f} ms ({change:+.0f}%){flag}")
+    return regressions
+
+
+# --- Entry point ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HomeoVault's cold start.")
+    parser.add_argument("--exe", help="Time this packaged executable instead of `python -m backend`")
+    parser.add_argument("--runs", type=int, default=5, help="Launches to time")
+    parser.add_argument("--db", help="Start every run from a copy of this database (default: a new one)")
+    parser.add_argument("--top", type=int, default=15, help="Modules and packages listed in the import report")
+    parser.add_argument("--skip-imports", action="store_true", help="Only time launches")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare p50 timings against")
+    parser.add_argument("--max-regression", type=float, default=25.0, help="Allowed slowdown in percent (with --compare)")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "command": args.exe or "python -m backend",
+            "runs": args.runs,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+    }
+    if not args.skip_imports and not args.exe:
+        results["imports"] = import_profile(args.top)
+        print_import_profile(results["imports"])
+
+    command = [os.path.abspath(args.exe)] if args.exe else [sys.executable, "-m", "backend"]
+    print(f"\n== Launch: {results['meta']['command']} ({args.runs} runs) ==")
+    results["launch"] = launch_report(command, args.runs, args.db)
+    for key in ("dashboard_ms", "first_api_ms", "maintenance_done_ms"):
+        stats = results["launch"][key]
+        print(f"  {key:<22} p50 {stats['p50']:>9.1f} ms (min {stats['min']}, max {stats['max']})")
+    timeline = results["launch"]["server_timeline"]
+    if timeline:
+        print("  server timeline: " + ", ".join(f"{s['stage']} {s['at_ms']:.0f} ms" for s in timeline["stages"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} measurement(s) regressed more than {args.max_regression}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlalchemy import func
 from sqlmodel.pool import StaticPool
 import pytest
 from datetime import date, timedelta
@@ -9,8 +10,9 @@ import os
 # Add backend to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.main import app, get_session
+from backend.main import app, get_session, get_write_session
 from backend.models import HomeopathicMedicine, Transaction
+from backend.cache import responses
 
 # In-memory database for testing
 @pytest.fixture(name="session")
@@ -30,6 +32,9 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_write_session] = get_session_override
+    # Each test starts a new database whose versions count from 0 again
+    responses.clear()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
@@ -194,3 +199,1272 @@ def test_export_csv(client):
     assert response.status_code == 200
     assert response.headers["content-type"] == "text/csv; charset=utf-8"
     assert "ID,Name,Potency" in response.text
+
+def test_medicines_keyset_pagination(client):
+    for i in range(5):
+        client.post("/api/medicines", json={
+            "medicine_name": f"Page{i}", "potency": "30C", "form": "D", "bottle_size": "30ml",
+            "manufacturer": "M", "batch_number": f"P{i}", "expiry_date": "2030-01-01",
+            "mrp": 10, "purchase_price": 5, "quantity": 10
+        })
+
+    names = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/medicines", params=params)
+        assert response.status_code == 200
+        names += [m["medicine_name"] for m in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert names == [f"Page{i}" for i in range(5)]
+
+    response = client.get("/api/medicines", params={"sort": "-name", "limit": 1})
+    assert response.json()[0]["medicine_name"] == "Page4"
+
+    response = client.get("/api/medicines", params={"sort": "bogus"})
+    assert response.status_code == 400
+
+def test_medicines_filters(client):
+    expired_date = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+    client.post("/api/medicines", json={
+        "medicine_name": "Arnica Montana", "potency": "30C", "form": "Dilution", "bottle_size": "30ml",
+        "manufacturer": "SBL", "batch_number": "F1", "expiry_date": "2030-01-01",
+        "mrp": 10, "purchase_price": 5, "quantity": 2, "low_stock_threshold": 5
+    })
+    client.post("/api/medicines", json={
+        "medicine_name": "Belladonna", "potency": "200C", "form": "Globules", "bottle_size": "30ml",
+        "manufacturer": "Schwabe", "batch_number": "F2", "expiry_date": expired_date,
+        "mrp": 10, "purchase_price": 5, "quantity": 50, "low_stock_threshold": 5
+    })
+
+    def names(**params):
+        return [m["medicine_name"] for m in client.get("/api/medicines", params=params).json()]
+
+    assert names(name="arn") == ["Arnica Montana"]
+    # A blank search box shows the whole catalogue
+    assert names(name=" ") == ["Arnica Montana", "Belladonna"]
+    assert names(potency="200C") == ["Belladonna"]
+    assert names(form="Dilution") == ["Arnica Montana"]
+    assert names(manufacturer="Schwabe") == ["Belladonna"]
+    assert names(expired="true") == ["Belladonna"]
+    assert names(expired="false") == ["Arnica Montana"]
+    assert names(low_stock="true") == ["Arnica Montana"]
+    assert names(expiring_within=60) == ["Belladonna"]
+
+def test_transaction_batch_is_all_or_nothing(client):
+    ids = []
+    for i, qty in enumerate([5, 1]):
+        res = client.post("/api/medicines", json={
+            "medicine_name": f"Batch{i}", "potency": "30C", "form": "D", "bottle_size": "30ml",
+            "manufacturer": "M", "batch_number": f"BB{i}", "expiry_date": "2030-01-01",
+            "mrp": 10, "purchase_price": 5, "quantity": qty
+        })
+        ids.append(res.json()["id"])
+
+    # Second line oversells, so nothing from the invoice may stick
+    response = client.post("/api/transactions/batch", json={"note": "Invoice 1", "items": [
+        {"medicine_id": ids[0], "change_amount": -2, "action_type": "SELL"},
+        {"medicine_id": ids[1], "change_amount": -3, "action_type": "SELL"},
+    ]})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Line 2: Insufficient stock")
+    quantities = {m["id"]: m["quantity"] for m in client.get("/api/medicines").json()}
+    assert quantities == {ids[0]: 5, ids[1]: 1}
+    assert client.get("/api/history").json() == []
+
+    response = client.post("/api/transactions/batch", json={"note": "Invoice 2", "items": [
+        {"medicine_id": ids[0], "change_amount": -2, "action_type": "SELL"},
+        {"medicine_id": ids[0], "change_amount": -3, "action_type": "SELL"},
+        {"medicine_id": ids[1], "change_amount": -1, "action_type": "SELL"},
+    ]})
+    assert response.status_code == 200
+    assert [r["new_quantity"] for r in response.json()["results"]] == [3, 0, 0]
+    history = client.get("/api/history").json()
+    assert len(history) == 3
+    assert all(h["note"] == "Invoice 2" for h in history)
+
+def test_concurrent_sales_do_not_oversell(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from fastapi import HTTPException
+    from backend.inventory import apply_stock_change
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'race.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        medicine = HomeopathicMedicine(
+            medicine_name="Race", potency="30C", batch_number="R1",
+            expiry_date=date(2030, 1, 1), quantity=10,
+        )
+        session.add(medicine)
+        session.commit()
+        med_id = medicine.id
+
+    def sell(_):
+        with Session(engine) as session:
+            try:
+                apply_stock_change(session, Transaction(medicine_id=med_id, change_amount=-1, action_type="SELL"))
+                session.commit()
+                return True
+            except HTTPException:
+                return False
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outcomes = list(executor.map(sell, range(25)))
+
+    assert outcomes.count(True) == 10
+    with Session(engine) as session:
+        assert session.get(HomeopathicMedicine, med_id).quantity == 0
+
+def test_engine_profile_pragmas(tmp_path):
+    from sqlalchemy import event
+    from backend.models import apply_pragmas, SQLITE_PRAGMAS
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    event.listen(engine, "connect", apply_pragmas)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().upper() == SQLITE_PRAGMAS["journal_mode"].upper()
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == SQLITE_PRAGMAS["busy_timeout"]
+        assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == SQLITE_PRAGMAS["cache_size"]
+
+def test_startup_maintenance_tasks(tmp_path):
+    from backend.maintenance import backup_database, integrity_check, health_scan
+
+    db_path = tmp_path / "inventory.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(HomeopathicMedicine(medicine_name="Old", potency="30C", batch_number="O1",
+                                        expiry_date=date(2020, 1, 1), quantity=10))
+        session.add(HomeopathicMedicine(medicine_name="Low", potency="30C", batch_number="L1",
+                                        expiry_date=date(2030, 1, 1), quantity=1))
+        session.commit()
+
+    steps = []
+    backup_file = backup_database(str(db_path), str(tmp_path / "backups"), pages_per_step=1, progress=steps.append)
+    assert steps and steps[-1] == 1.0
+    backup_engine = create_engine(f"sqlite:///{backup_file}")
+    with Session(backup_engine) as session:
+        assert len(session.exec(select(HomeopathicMedicine)).all()) == 2
+
+    assert integrity_check(engine, mode="quick") == (True, ["ok"])
+    assert integrity_check(engine, mode="full") == (True, ["ok"])
+
+    scan = health_scan(engine)
+    assert scan["total_medicines"] == 2
+    assert scan["expired_batches"] == 1
+    assert scan["low_stock_items"] == 1
+    assert scan["expired_examples"][0]["medicine_name"] == "Old"
+
+def test_health_reports_maintenance(client):
+    data = client.get("/api/health").json()
+    assert data["status"] == "ok"
+    assert "tasks" in data["maintenance"]
+
+def test_summary_tracks_mutations(client, session):
+    from backend.models import InventorySummary
+    from backend.summary import rebuild_summary
+
+    expired_date = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+    soon_date = (date.today() + timedelta(days=10)).strftime("%Y-%m-%d")
+    ids = []
+    for i, (expiry, qty) in enumerate([("2030-01-01", 10), (expired_date, 3), (soon_date, 6)]):
+        res = client.post("/api/medicines", json={
+            "medicine_name": f"Sum{i}", "potency": "30C", "form": "D", "bottle_size": "30ml",
+            "manufacturer": "M", "batch_number": f"S{i}", "expiry_date": expiry,
+            "mrp": 10, "purchase_price": 4, "quantity": qty, "low_stock_threshold": 5
+        })
+        ids.append(res.json()["id"])
+    client.post("/api/transaction", json={"medicine_id": ids[2], "change_amount": -2, "action_type": "SELL"})
+    client.delete(f"/api/medicines/{ids[0]}")
+
+    data = client.get("/api/summary").json()
+    assert data["total_skus"] == 2
+    assert data["total_units"] == 7
+    assert float(data["stock_value_mrp"]) == 70
+    assert float(data["stock_value_purchase"]) == 28
+    assert data["expired_count"] == 1
+    assert data["expiring_count"] == 1
+    assert data["low_stock_count"] == 2
+    assert client.get("/api/summary", params={"expiring_within": 5}).json()["expiring_count"] == 0
+
+    # Incremental counters agree with a full rebuild
+    maintained = {k: v for k, v in data.items() if k not in ("updated_at", "expiring_within_days")}
+    rebuild_summary(session)
+    session.commit()
+    assert {k: v for k, v in client.get("/api/summary").json().items() if k in maintained} == maintained
+
+    # Daily rollover: pretend the counters were last computed 30 days ago
+    row = session.get(InventorySummary, 1)
+    row.as_of = date.today() - timedelta(days=30)
+    row.expired_count = 0
+    session.add(row)
+    session.commit()
+    assert client.get("/api/summary").json()["expired_count"] == 1
+
+def test_export_gzip_and_ledger(client):
+    import gzip as gzip_module
+    res = client.post("/api/medicines", json={
+        "medicine_name": "Exp", "potency": "30C", "form": "D", "bottle_size": "30ml",
+        "manufacturer": "M", "batch_number": "E1", "expiry_date": "2030-01-01",
+        "mrp": 10, "purchase_price": 5, "quantity": 10
+    })
+    med_id = res.json()["id"]
+    client.post("/api/transaction", json={"medicine_id": med_id, "change_amount": -1, "action_type": "SELL", "note": "n"})
+
+    response = client.get("/api/export", params={"gzip": "true"})
+    assert response.headers["content-type"] == "application/gzip"
+    text = gzip_module.decompress(response.content).decode()
+    assert text.startswith("ID,Name,Potency")
+    assert "Exp,30C" in text
+
+    response = client.get("/api/export/transactions")
+    lines = response.text.strip().splitlines()
+    assert lines[0] == "ID,Timestamp,Medicine ID,Name,Batch,Change,Action,Note"
+    assert lines[1].endswith(f"{med_id},Exp,E1,-1,SELL,n")
+
+def test_export_streams_in_batches(session):
+    from backend.csv_io import export_medicines
+    for i in range(5):
+        session.add(HomeopathicMedicine(medicine_name=f"S{i}", potency="30C", batch_number=f"SB{i}",
+                                        expiry_date=date(2030, 1, 1), mrp=10, quantity=i))
+    session.commit()
+    chunks = list(export_medicines(session.get_bind(), batch_size=2))
+    assert len(chunks) == 3
+    assert "".join(chunks).count("\n") == 6
+
+def test_import_csv_upserts_and_reports_errors(client):
+    csv_text = (
+        "ID,Name,Potency,Form,Size,Manufacturer,Batch,Expiry,MRP,Purchase Price,Quantity\n"
+        ",Arnica,30C,Dilution,30ml,SBL,I1,2030-01-01,100,50,10\n"
+        ",Bryonia,200C,Dilution,30ml,SBL,I2,2030-01-01,80,40,5\n"
+        ",Broken,30C,Dilution,30ml,SBL,I3,not-a-date,80,40,5\n"
+        ",NoPrice,30C,Dilution,30ml,SBL,I4,2030-01-01,0,40,5\n"
+    )
+    response = client.post("/api/import", files={"file": ("stock.csv", csv_text, "text/csv")})
+    assert response.status_code == 200
+    report = response.json()
+    assert report["processed"] == 2
+    assert report["inserted"] == 2
+    assert [e["line"] for e in report["errors"]] == [4, 5]
+
+    # Same SKU again: updates in place
+    update = (
+        "Name,Potency,Form,Size,Manufacturer,Batch,Expiry,MRP,Purchase Price,Quantity\n"
+        "Arnica,30C,Dilution,30ml,SBL,I1,2031-01-01,120,60,25\n"
+    )
+    report = client.post("/api/import", files={"file": ("stock.csv", update, "text/csv")}).json()
+    assert (report["inserted"], report["updated"]) == (0, 1)
+    arnica = client.get("/api/medicines", params={"name": "arnica"}).json()
+    assert len(arnica) == 1
+    assert arnica[0]["quantity"] == 25
+    assert arnica[0]["expiry_date"] == "2031-01-01"
+    assert client.get("/api/summary").json()["total_units"] == 30
+
+    # A lower count is an adjustment; every quantity still adds up from the ledger
+    recount = update.replace(",25\n", ",20\n")
+    client.post("/api/import", files={"file": ("stock.csv", recount, "text/csv")})
+    history = client.get("/api/history", params={"medicine_id": arnica[0]["id"]}).json()
+    assert [(t["action_type"], t["change"]) for t in history] == [("ADJUST", -5), ("ADD", 15), ("ADD", 10)]
+    for medicine in client.get("/api/medicines").json():
+        ledger = client.get("/api/history", params={"medicine_id": medicine["id"]}).json()
+        assert sum(t["change"] for t in ledger) == medicine["quantity"]
+
+    response = client.post("/api/import", files={"file": ("bad.csv", "foo,bar\n1,2\n", "text/csv")})
+    assert response.status_code == 400
+
+def test_history_pagination_and_filters(client):
+    ids = []
+    for i in range(2):
+        res = client.post("/api/medicines", json={
+            "medicine_name": f"Hist{i}", "potency": "30C", "form": "D", "bottle_size": "30ml",
+            "manufacturer": "M", "batch_number": f"HB{i}", "expiry_date": "2030-01-01",
+            "mrp": 10, "purchase_price": 5, "quantity": 100
+        })
+        ids.append(res.json()["id"])
+    for n in range(5):
+        client.post("/api/transaction", json={"medicine_id": ids[0], "change_amount": -1, "action_type": "SELL", "note": f"s{n}"})
+    client.post("/api/transaction", json={"medicine_id": ids[1], "change_amount": 3, "action_type": "ADD", "note": "a"})
+
+    notes = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/history", params=params)
+        notes += [h["note"] for h in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert notes == ["a", "s4", "s3", "s2", "s1", "s0"]
+
+    assert len(client.get("/api/history", params={"medicine_id": ids[0]}).json()) == 5
+    assert [h["note"] for h in client.get("/api/history", params={"action_type": "ADD"}).json()] == ["a"]
+    future = (date.today() + timedelta(days=1)).isoformat()
+    assert client.get("/api/history", params={"since": future}).json() == []
+    assert len(client.get("/api/history", params={"until": future}).json()) == 6
+
+def test_sales_analytics_rollups(client, session):
+    from backend.models import DailySales
+    ids = []
+    for i, qty in enumerate([100, 100, 100]):
+        res = client.post("/api/medicines", json={
+            "medicine_name": f"Ana{i}", "potency": "30C", "form": "D", "bottle_size": "30ml",
+            "manufacturer": "M", "batch_number": f"AB{i}", "expiry_date": "2030-01-01",
+            "mrp": 10, "purchase_price": 5, "quantity": qty
+        })
+        ids.append(res.json()["id"])
+    client.post("/api/transaction", json={"medicine_id": ids[0], "change_amount": -30, "action_type": "SELL"})
+    client.post("/api/transaction", json={"medicine_id": ids[0], "change_amount": -30, "action_type": "SELL"})
+    client.post("/api/transactions/batch", json={"items": [
+        {"medicine_id": ids[1], "change_amount": -3, "action_type": "SELL"},
+        {"medicine_id": ids[1], "change_amount": 10, "action_type": "ADD"},
+    ]})
+
+    sales = client.get("/api/analytics/sales").json()
+    assert {(s["medicine_id"], s["units"], s["transactions"]) for s in sales} == {(ids[0], 60, 2), (ids[1], 3, 1)}
+    assert len(client.get("/api/analytics/sales", params={"bucket": "month"}).json()) == 2
+
+    fast = client.get("/api/analytics/movers", params={"days": 30, "limit": 1}).json()
+    assert fast[0]["medicine_id"] == ids[0]
+    assert fast[0]["per_day"] == 2.0
+    slow = client.get("/api/analytics/movers", params={"direction": "slow", "limit": 1}).json()
+    assert slow[0]["medicine_id"] == ids[2]
+
+    cover = client.get("/api/analytics/stock-cover").json()
+    assert cover[0]["medicine_id"] == ids[0]
+    assert cover[0]["days_of_cover"] == 20.0
+
+    velocity = client.get("/api/analytics/velocity", params={"medicine_id": ids[1]}).json()
+    assert velocity[0]["units_sold"] == 3
+
+    # A rebuild from the ledger reproduces the incrementally maintained rollup
+    before = sorted((r.day, r.medicine_id, r.action_type, r.units, r.txn_count) for r in session.exec(select(DailySales)).all())
+    assert client.post("/api/analytics/rebuild").json()["buckets"] == 3
+    session.expire_all()
+    after = sorted((r.day, r.medicine_id, r.action_type, r.units, r.txn_count) for r in session.exec(select(DailySales)).all())
+    assert before == after
+
+def _add_batches(client, name, batches):
+    ids = []
+    for batch, expiry, qty in batches:
+        res = client.post("/api/medicines", json={
+            "medicine_name": name, "potency": "30C", "form": "Dilution", "bottle_size": "30ml",
+            "manufacturer": "SBL", "batch_number": batch, "expiry_date": expiry,
+            "mrp": 10, "purchase_price": 5, "quantity": qty
+        })
+        ids.append(res.json()["id"])
+    return ids
+
+def test_sell_by_sku_fefo(client):
+    expired_date = (date.today() - timedelta(days=1)).isoformat()
+    ids = _add_batches(client, "Fefo", [
+        ("LATE", "2031-01-01", 10), ("EARLY", "2029-01-01", 3), ("GONE", expired_date, 50), ("MID", "2030-01-01", 4),
+    ])
+    response = client.post("/api/sell", json={
+        "medicine_name": "Fefo", "potency": "30C", "quantity": 9, "note": "Counter"
+    })
+    assert response.status_code == 200
+    allocations = response.json()["allocations"]
+    assert [(a["batch_number"], a["quantity"], a["new_quantity"]) for a in allocations] == [
+        ("EARLY", 3, 0), ("MID", 4, 0), ("LATE", 2, 8)
+    ]
+    assert len(client.get("/api/history").json()) == 3
+
+    # More than the unexpired stock: nothing is sold
+    response = client.post("/api/sell", json={"medicine_name": "Fefo", "potency": "30C", "quantity": 9})
+    assert response.status_code == 400
+    assert "Only 8 unexpired units" in response.json()["detail"]
+    quantities = {m["id"]: m["quantity"] for m in client.get("/api/medicines", params={"name": "Fefo"}).json()}
+    assert quantities == {ids[0]: 8, ids[1]: 0, ids[2]: 50, ids[3]: 0}
+
+def test_concurrent_fefo_sales(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from fastapi import HTTPException
+    from backend.inventory import sell_fefo
+    from backend.models import SkuSale, use_immediate_transactions
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'fefo.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    use_immediate_transactions(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i, qty in enumerate([3, 5, 4]):
+            session.add(HomeopathicMedicine(medicine_name="Rush", potency="30C", batch_number=f"R{i}",
+                                            expiry_date=date(2030, 1, 1 + i), quantity=qty))
+        session.commit()
+
+    def sell(_):
+        with Session(engine) as session:
+            try:
+                sold = sum(a["quantity"] for a in sell_fefo(session, SkuSale(medicine_name="Rush", potency="30C", quantity=2)))
+                session.commit()
+                return sold
+            except HTTPException:
+                session.rollback()
+                return 0
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        sold = list(executor.map(sell, range(10)))
+
+    assert sum(sold) == 12
+    with Session(engine) as session:
+        assert sum(m.quantity for m in session.exec(select(HomeopathicMedicine)).all()) == 0
+        assert -sum(t.change_amount for t in session.exec(select(Transaction)).all()) == 12
+
+def test_search_typeahead_and_misspellings(client):
+    for name, manufacturer, batch in [
+        ("Arnica Montana", "SBL", "AR01"), ("Belladonna", "Schwabe", "BE01"),
+        ("Pulsatilla", "SBL", "PU01"), ("Nux Vomica", "Reckeweg", "NV01"),
+    ]:
+        client.post("/api/medicines", json={
+            "medicine_name": name, "potency": "30C", "form": "Dilution", "bottle_size": "30ml",
+            "manufacturer": manufacturer, "batch_number": batch, "expiry_date": "2030-01-01",
+            "mrp": 10, "purchase_price": 5, "quantity": 10
+        })
+
+    def names(q):
+        return [r["medicine_name"] for r in client.get("/api/search", params={"q": q}).json()]
+
+    assert names("ar") == ["Arnica Montana"]  # short prefix
+    assert names("mont")[0] == "Arnica Montana"  # substring
+    assert names("vomica") == ["Nux Vomica"]
+    assert names("schwabe") == ["Belladonna"]  # manufacturer
+    assert names("PU01") == ["Pulsatilla"]  # batch number
+    assert names("arnika")[0] == "Arnica Montana"  # misspellings
+    assert names("beladona")[0] == "Belladonna"
+    assert names("pulsatila")[0] == "Pulsatilla"
+    assert names("zzzz") == []
+
+    # Index follows deletes
+    arnica = client.get("/api/medicines", params={"name": "arnica"}).json()[0]
+    client.delete(f"/api/medicines/{arnica['id']}")
+    assert names("arnica") == []
+
+def test_metrics_and_profiling(client, session, monkeypatch):
+    from backend import metrics
+    metrics.instrument_engine(session.get_bind(), "test")
+    monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+
+    created = client.post("/api/medicines", json={
+        "medicine_name": "Sulphur", "potency": "30C", "batch_number": "S1",
+        "expiry_date": "2030-01-01", "mrp": 10, "quantity": 5
+    }).json()
+    client.delete(f"/api/medicines/{created['id']}")
+
+    # Opt-in per-request profile
+    response = client.get("/api/history", headers={"X-Profile": "1"})
+    assert "db;dur=" in response.headers["Server-Timing"]
+    profile = client.get(f"/api/metrics/profiles/{response.headers['X-Profile-Id']}").json()
+    assert profile["route"] == "/api/history"
+    assert profile["statements"] >= 1
+    assert all(q["plan"] for q in profile["queries"] if q["statement"].lstrip().startswith("SELECT"))
+    assert "Server-Timing" not in client.get("/api/history").headers  # not asked for
+    assert client.get("/api/metrics/profiles/nope").status_code == 404
+
+    text = client.get("/api/metrics").text
+    assert 'homeovault_http_requests_total{method="GET",route="/api/history",status="200"}' in text
+    # Route templates, not raw paths
+    assert 'route="/api/medicines/{medicine_id}"' in text
+    assert 'homeovault_sql_statement_duration_seconds_count{engine="test",operation="SELECT"}' in text
+    assert "# TYPE homeovault_db_pool_wait_seconds histogram" in text
+
+def test_conditional_gets_follow_inventory_version(client):
+    def create(batch, quantity=10):
+        return client.post("/api/medicines", json={
+            "medicine_name": "Bryonia", "potency": "30C", "batch_number": batch,
+            "expiry_date": "2030-01-01", "mrp": 10, "quantity": quantity
+        })
+
+    medicine = create("BR1").json()
+    first = client.get("/api/medicines")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert "Last-Modified" in first.headers
+
+    again = client.get("/api/medicines", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert client.get("/api/summary", headers={"If-None-Match": etag}).status_code == 304
+    last_modified = first.headers["Last-Modified"]
+    assert client.get("/api/medicines", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    # Every kind of write invalidates
+    seen = {etag}
+    for write in (
+        lambda: client.post("/api/transaction", json={"medicine_id": medicine["id"], "change_amount": -1, "action_type": "SELL"}),
+        lambda: create("BR2"),
+        lambda: client.delete(f"/api/medicines/{medicine['id']}"),
+    ):
+        assert write().status_code == 200
+        response = client.get("/api/medicines", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag not in seen
+        seen.add(etag)
+
+    # A rejected sale changes nothing
+    assert client.post("/api/transaction", json={"medicine_id": 999, "change_amount": -1, "action_type": "SELL"}).status_code == 404
+    assert client.get("/api/history", headers={"If-None-Match": etag}).status_code == 304
+
+    health = client.get("/api/health")
+    assert client.get("/api/health", headers={"If-None-Match": health.headers["ETag"]}).status_code == 304
+
+
+def test_responses_are_compressed(client):
+    for i in range(30):
+        client.post("/api/medicines", json={
+            "medicine_name": f"Calendula {i}", "potency": "Q", "batch_number": f"CA{i}",
+            "expiry_date": "2030-01-01", "mrp": 10, "quantity": 3
+        })
+    response = client.get("/api/medicines", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] in ("gzip", "br")
+    assert len(response.json()) == 30
+
+def test_delta_sync_changes(client, session):
+    from backend import changes
+
+    start = client.get("/api/changes").json()
+    assert start["reset"] and start["upserts"] == []
+
+    def create(batch, quantity=10):
+        return client.post("/api/medicines", json={
+            "medicine_name": "Rhus Tox", "potency": "200C", "batch_number": batch,
+            "expiry_date": "2030-01-01", "mrp": 10, "quantity": quantity
+        }).json()
+
+    first, second = create("RT1"), create("RT2")
+    client.post("/api/transaction", json={"medicine_id": first["id"], "change_amount": -3, "action_type": "SELL"})
+    client.delete(f"/api/medicines/{second['id']}")
+
+    delta = client.get("/api/changes", params={"since": start["cursor"]}).json()
+    assert not delta["reset"] and not delta["more"]
+    # Several changes to one medicine collapse into its current row
+    assert [(m["id"], m["quantity"]) for m in delta["upserts"]] == [(first["id"], 7)]
+    assert delta["deletes"] == [second["id"]]
+
+    # Caught up: nothing new, same cursor
+    idle = client.get("/api/changes", params={"since": delta["cursor"]}).json()
+    assert idle == {"cursor": delta["cursor"], "reset": False, "more": False, "upserts": [], "deletes": []}
+
+    # Paged with "more"
+    page = client.get("/api/changes", params={"since": start["cursor"], "limit": 1}).json()
+    assert page["more"] and page["cursor"] == start["cursor"] + 1
+
+    # Pruned or foreign cursors ask for a reload
+    assert client.get("/api/changes", params={"since": delta["cursor"] + 5}).json()["reset"]
+    assert changes.prune(session, days=-1) == 4
+    session.commit()
+    assert client.get("/api/changes", params={"since": start["cursor"]}).json()["reset"]
+    assert not client.get("/api/changes", params={"since": delta["cursor"]}).json()["reset"]
+
+def test_live_events_fan_out_and_resume(session):
+    import asyncio
+    from backend import events
+
+    bind = session.get_bind()
+    events.hub.watch(bind)
+
+    def add(batch, quantity):
+        with Session(bind) as s:
+            s.add(HomeopathicMedicine(medicine_name="Hepar Sulph", potency="6C", batch_number=batch,
+                                      expiry_date=date.today() + timedelta(days=400), quantity=quantity))
+            s.commit()
+
+    async def next_event(stream, name):
+        async for frame in stream:
+            if frame.startswith(f"event: {name}\n"):
+                return frame
+
+    async def scenario():
+        # Two subscribers share one pump
+        first, second = events.hub.stream(None, heartbeat=0.05), events.hub.stream(None, heartbeat=0.05)
+        reset = await next_event(first, "reset")
+        await next_event(second, "reset")
+        assert events.hub.subscriber_count == 2
+
+        await asyncio.to_thread(add, "HS1", 2)
+        frames = [await asyncio.wait_for(next_event(s, "changes"), 5) for s in (first, second)]
+        assert frames[0] == frames[1] and '"medicine_name":"Hepar Sulph"' in frames[0]
+        cursor = int(frames[0].split("\n")[1].removeprefix("id: "))
+        assert '"low_stock"' in await asyncio.wait_for(next_event(first, "alert"), 5)
+        assert await asyncio.wait_for(first.__anext__(), 5) == ": ping\n\n"  # heartbeat while idle
+
+        # Resume: a reconnecting client gets what it missed, nothing more
+        await asyncio.to_thread(add, "HS2", 20)
+        resumed = events.hub.stream(cursor, heartbeat=0.05)
+        missed = await asyncio.wait_for(next_event(resumed, "changes"), 5)
+        assert '"batch_number":"HS2"' in missed and '"HS1"' not in missed
+        for s in (first, second, resumed):
+            await s.aclose()
+        assert events.hub.subscriber_count == 0
+        return reset
+
+    try:
+        assert '"cursor":0' in asyncio.run(scenario())
+    finally:
+        events.hub.unwatch(bind)
+
+def test_async_routes(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from fastapi import FastAPI
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from backend import async_routes
+    from backend.async_db import get_async_session, get_async_write_session
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+    created = []
+
+    async def session_override():
+        if not created:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            created.append(True)
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    async_app = FastAPI()
+    async_app.include_router(async_routes.router)
+    async_app.dependency_overrides[get_async_session] = session_override
+    async_app.dependency_overrides[get_async_write_session] = session_override
+
+    with TestClient(async_app) as client:
+        for batch, expiry in (("AC2", "2031-01-01"), ("AC1", "2030-01-01")):
+            response = client.post("/api/medicines", json={
+                "medicine_name": "Aconite", "potency": "30C", "batch_number": batch,
+                "expiry_date": expiry, "mrp": 10, "quantity": 5
+            })
+            assert response.status_code == 200 and response.json()["id"]
+        assert client.post("/api/medicines", json={
+            "medicine_name": "Aconite", "potency": "30C", "batch_number": "AC1",
+            "expiry_date": "2030-01-01", "mrp": 10, "quantity": 5
+        }).status_code == 400
+
+        page = client.get("/api/medicines", params={"limit": 1, "sort": "expiry_date"})
+        assert [m["batch_number"] for m in page.json()] == ["AC1"]
+        page = client.get("/api/medicines", params={"limit": 1, "sort": "expiry_date", "cursor": page.headers["X-Next-Cursor"]})
+        assert [m["batch_number"] for m in page.json()] == ["AC2"]
+
+        first_id = client.get("/api/medicines", params={"sort": "expiry_date"}).json()[0]["id"]
+        assert client.post("/api/transaction", json={"medicine_id": first_id, "change_amount": -2, "action_type": "SELL"}).json()["new_quantity"] == 3
+        assert client.post("/api/transaction", json={"medicine_id": first_id, "change_amount": -9, "action_type": "SELL"}).status_code == 400
+        sold = client.post("/api/sell", json={"medicine_name": "Aconite", "potency": "30C", "quantity": 4}).json()
+        assert [a["batch_number"] for a in sold["allocations"]] == ["AC1", "AC2"]
+        bad = client.post("/api/transactions/batch", json={"items": [
+            {"medicine_id": first_id, "change_amount": 1, "action_type": "ADD"},
+            {"medicine_id": 999, "change_amount": -1, "action_type": "SELL"},
+        ]})
+        assert bad.status_code == 404 and bad.json()["detail"].startswith("Line 2")
+
+        history = client.get("/api/history").json()
+        assert [h["change"] for h in history] == [-1, -3, -2]
+        export = client.get("/api/export/transactions").text.splitlines()
+        assert len(export) == 4
+        assert "AC2" in client.get("/api/export").text
+
+        assert client.delete(f"/api/medicines/{first_id}").status_code == 200
+        assert client.delete(f"/api/medicines/{first_id}").status_code == 404
+
+def test_bulk_create_and_upsert(client, session):
+    from backend.models import DailySales
+
+    def item(i, **extra):
+        return {"medicine_name": f"Bulk {i % 50}", "potency": "30C", "batch_number": f"BK{i}",
+                "expiry_date": "2030-01-01", "mrp": 10, "purchase_price": 4, "quantity": 2, **extra}
+
+    # 10k batches in one call
+    response = client.post("/api/medicines/bulk", json={"items": [item(i) for i in range(10000)], "note": "delivery"})
+    body = response.json()
+    assert response.status_code == 200, body
+    assert (body["created"], body["updated"], body["duplicates"], body["errors"]) == (10000, 0, 0, 0)
+    assert client.get("/api/summary").json()["total_units"] == 20000
+    assert session.exec(select(func.count()).select_from(Transaction)).one() == 10000
+    assert sum(r.units for r in session.exec(select(DailySales)).all()) == 20000
+
+    # Mixed second delivery: duplicates, restocks, new and invalid items
+    items = [item(0), item(1, quantity=5, mrp=12), item(10000), item(10000),
+             item(10001, mrp=0), item(10002, expiry_date="soon"), {"potency": "30C"}]
+    body = client.post("/api/medicines/bulk", json={"items": items}).json()
+    assert [r["status"] for r in body["results"]] == ["duplicate", "duplicate", "created", "error", "error", "error", "error"]
+    assert body["results"][3]["detail"] == "Same Batch/SKU as item 2."
+    assert body["results"][4]["detail"] == "MRP must be greater than 0."
+
+    body = client.post("/api/medicines/bulk", json={"items": items[:2], "upsert": True}).json()
+    assert [r["status"] for r in body["results"]] == ["updated", "updated"]
+    restocked = client.get("/api/medicines", params={"name": "bulk 1"}).json()
+    bk1 = next(m for m in restocked if m["batch_number"] == "BK1")
+    assert bk1["quantity"] == 7 and float(bk1["mrp"]) == 12
+    assert client.get("/api/summary").json()["total_units"] == 20000 + 2 + 2 + 5
+    assert len(client.get("/api/history", params={"medicine_id": bk1["id"]}).json()) == 2
+
+def test_list_endpoints_columnar_format(client):
+    for batch, quantity in (("CF1", 4), ("CF2", 9)):
+        client.post("/api/medicines", json={
+            "medicine_name": "China", "potency": "6C", "batch_number": batch,
+            "expiry_date": "2030-01-01", "mrp": 7.5, "quantity": quantity
+        })
+    rows = client.get("/api/medicines").json()
+    assert rows[0]["mrp"] == "7.50" and rows[0]["expiry_date"] == "2030-01-01" and "T" in rows[0]["created_at"]
+
+    response = client.get("/api/medicines", params={"format": "columns", "limit": 1})
+    columns = response.json()
+    assert columns["batch_number"] == ["CF1"] and columns["quantity"] == [4]
+    assert set(columns) == set(rows[0])
+    assert response.headers["X-Next-Cursor"] and response.headers["ETag"]
+
+    client.post("/api/transaction", json={"medicine_id": rows[0]["id"], "change_amount": -1, "action_type": "SELL"})
+    history = client.get("/api/history", params={"format": "columns"}).json()
+    assert history["change"] == [-1] and history["medicine_name"] == ["China"]
+    assert client.get("/api/history", params={"format": "xml"}).status_code == 422
+
+def test_backup_snapshots_retention_and_restore(tmp_path, monkeypatch):
+    from datetime import datetime
+    from backend import backups, changes, main, summary
+    from backend.inventory import add_medicine
+    from backend.models import create_db_and_tables
+
+    db_path = tmp_path / "inventory.db"
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    create_db_and_tables(engine)
+    backup_dir = str(tmp_path / "backups")
+    scheduler = backups.BackupScheduler(str(db_path), backup_dir, engine, engine, interval_minutes=0)
+
+    def add(batch):
+        with Session(engine) as session:
+            add_medicine(session, HomeopathicMedicine(medicine_name="Nux", potency="30C", batch_number=batch,
+                                                      expiry_date=date(2030, 1, 1), mrp=10, quantity=5))
+            session.commit()
+
+    add("N1")
+    first = scheduler.run_once()
+    assert first["sha256"] and first["version"] >= 1
+    # Nothing changed: no second copy
+    assert scheduler.run_once() is None
+    add("N2")
+    scheduler.compress = True
+    second = scheduler.run_once()
+    assert second["name"].endswith(".db.gz")
+    listed = scheduler.list(verify=True)
+    assert [e["name"] for e in listed] == [second["name"], first["name"]]
+    assert all(e["verified"] for e in listed)
+
+    with Session(engine) as session:
+        version_before, _ = summary.current_version(session)
+        cursor_before = changes.latest_cursor(session)
+    result = scheduler.restore(first["name"])
+    assert result["restored"] == first["name"]
+    with Session(engine) as session:
+        assert [m.batch_number for m in session.exec(select(HomeopathicMedicine))] == ["N1"]
+        assert summary.current_version(session)[0] > version_before
+        # Clients reload instead of applying deltas from another history
+        assert changes.changes_since(session, cursor_before)["reset"]
+    # The state before the restore was saved, and a compressed backup restores too
+    assert len(scheduler.list()) == 3
+    scheduler.restore(result["safety_backup"])
+    scheduler.restore(second["name"])
+    with Session(engine) as session:
+        assert session.exec(select(func.count()).select_from(HomeopathicMedicine)).one() == 2
+
+    with open(os.path.join(backup_dir, first["name"]), "r+b") as f:
+        f.write(b"damaged")
+    assert backups.verify_backup(backup_dir, first) is False
+    with pytest.raises(Exception) as error:
+        scheduler.restore(first["name"])
+    assert error.value.status_code == 409
+
+    # Hourly/daily/weekly thinning keeps the newest snapshot of each bucket
+    stamps = [datetime(2026, 3, 10, 12, 30), datetime(2026, 3, 10, 12, 5), datetime(2026, 3, 10, 11, 0),
+              datetime(2026, 3, 9, 9, 0), datetime(2026, 3, 2, 9, 0), datetime(2026, 2, 1, 9, 0)]
+    entries = [{"name": str(i), "created_at": t.isoformat()} for i, t in enumerate(stamps)]
+    assert backups.retained(entries, keep=(2, 2, 2), now=datetime(2026, 3, 10, 13, 0)) == {"0", "1", "2", "3", "4"}
+    assert backups.retained(entries, keep=(2, 2, 2), now=datetime(2026, 3, 11)) == {"0", "2", "3", "4"}
+
+    monkeypatch.setattr(main, "backup_scheduler", scheduler)
+    client = TestClient(app)
+    data = client.get("/api/backups").json()
+    assert data["scheduler"]["interval_minutes"] == 0 and len(data["backups"]) == 5
+    assert client.post("/api/backups/missing.db/restore").status_code == 404
+
+def test_backups_include_the_ledger_archives(tmp_path):
+    from datetime import datetime
+    from backend import archive, backups
+    from backend.inventory import add_medicine, apply_stock_change
+    from backend.models import create_db_and_tables
+
+    db_path = tmp_path / "inventory.db"
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    create_db_and_tables(engine)
+    backup_dir, archive_dir = str(tmp_path / "backups"), str(tmp_path / "archive")
+    scheduler = backups.BackupScheduler(str(db_path), backup_dir, engine, engine, interval_minutes=0,
+                                        archive_dir=archive_dir)
+    with Session(engine) as session:
+        medicine = add_medicine(session, HomeopathicMedicine(medicine_name="Nux", potency="30C", batch_number="N1",
+                                                             expiry_date=date(2030, 1, 1), mrp=10, quantity=50))
+        for year in (2023, 2024):
+            apply_stock_change(session, Transaction(medicine_id=medicine.id, change_amount=-2, action_type="SELL",
+                                                    timestamp=datetime(year, 6, 1)))
+        session.commit()
+
+    def ledger():
+        with Session(engine) as session:
+            return sorted(t.action_type for t in session.exec(select(Transaction)))
+
+    before = scheduler.run_once()
+    assert before["archives"] == []
+    archive.archive_ledger(engine, datetime(2025, 1, 1), archive_dir)
+    archived = scheduler.run_once()
+    assert sorted(copy["name"] for copy in archived["archives"]) == ["ledger_2023.db", "ledger_2024.db"]
+    assert all(len(copy["sha256"]) == 64 for copy in archived["archives"])
+    # Unchanged archive files are not copied again
+    with Session(engine) as session:
+        add_medicine(session, HomeopathicMedicine(medicine_name="Nux", potency="30C", batch_number="N2",
+                                                  expiry_date=date(2030, 1, 1), mrp=10, quantity=1))
+        session.commit()
+    later = scheduler.run_once()
+    assert [c["file"] for c in later["archives"]] == [c["file"] for c in archived["archives"]]
+    assert len(os.listdir(os.path.join(backup_dir, backups.ARCHIVE_BACKUP_DIR))) == 2
+
+    # The database and its archives come back together
+    assert ledger() == ["OPENING"]
+    scheduler.restore(before["name"])
+    assert archive.archive_files(archive_dir) == [] and ledger() == ["SELL", "SELL"]
+    scheduler.restore(archived["name"])
+    assert ledger() == ["OPENING"]
+    assert sorted(a["transactions"] for a in archive.describe(archive_dir)) == [1, 1]
+    assert all(scheduler.list(verify=True)[i]["verified"] for i in range(4))
+
+    copy = os.path.join(backup_dir, backups.ARCHIVE_BACKUP_DIR, archived["archives"][0]["file"])
+    with open(copy, "r+b") as f:
+        f.write(b"damaged")
+    assert backups.verify_backup(backup_dir, archived) is False
+    with pytest.raises(Exception) as error:
+        scheduler.restore(archived["name"])
+    assert error.value.status_code == 409
+
+def test_ledger_archive_keeps_balances_history_and_rollups(client, session, tmp_path, monkeypatch):
+    from datetime import datetime
+    from backend import archive
+    from backend.analytics import rebuild_rollups, sales_series
+    from backend.inventory import apply_stock_change
+    from backend.models import OPENING_BALANCE
+
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    ids = []
+    for batch in ("A1", "A2"):
+        ids.append(client.post("/api/medicines", json={
+            "medicine_name": "Sulphur", "potency": "30C", "batch_number": batch,
+            "expiry_date": "2030-01-01", "mrp": 10, "quantity": 0
+        }).json()["id"])
+    # Two years of old sales, then recent ones
+    stamps = [datetime(2024, 6, 1), datetime(2024, 12, 31, 23), datetime(2025, 3, 1), datetime(2025, 3, 2)]
+    for medicine_id in ids:
+        apply_stock_change(session, Transaction(medicine_id=medicine_id, change_amount=50, action_type="ADD",
+                                                timestamp=datetime(2024, 1, 1, 9)))
+        for stamp in stamps:
+            apply_stock_change(session, Transaction(medicine_id=medicine_id, change_amount=-2, action_type="SELL",
+                                                    timestamp=stamp))
+    session.commit()
+    client.post("/api/transaction", json={"medicine_id": ids[0], "change_amount": -1, "action_type": "SELL"})
+    full = client.get("/api/history", params={"limit": 500}).json()
+    sales_before = sales_series(session, "month")
+
+    def balances():
+        return {m.id: (m.quantity, session.exec(select(func.sum(Transaction.change_amount))
+                                                .where(Transaction.medicine_id == m.id)).one())
+                for m in session.exec(select(HomeopathicMedicine))}
+
+    ledger_before = [t.model_dump() for t in session.exec(select(Transaction))]
+    result = archive.archive_ledger(session.get_bind(), datetime(2025, 3, 2))
+    assert result["archived"] == 8
+    assert [a["year"] for a in archive.describe()] == [2025, 2024]
+    # Quantities still equal the sum of the hot ledger, thanks to the OPENING rows
+    assert all(quantity == total for quantity, total in balances().values())
+    openings = session.exec(select(Transaction).where(Transaction.action_type == OPENING_BALANCE)).all()
+    assert sorted(o.change_amount for o in openings) == [44, 44]
+    # Archiving again moves only what is newly old, into the same OPENING rows
+    assert archive.archive_ledger(session.get_bind(), datetime(2025, 3, 3))["archived"] == 2
+    assert all(quantity == total for quantity, total in balances().values())
+    assert session.exec(select(func.count()).select_from(Transaction)).one() == 3
+
+    # History pages through the hot ledger and the archives as before
+    paged, cursor = [], None
+    while True:
+        response = client.get("/api/history", params={"limit": 4, **({"cursor": cursor} if cursor else {})})
+        paged += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert paged == full
+    only = client.get("/api/history", params={"medicine_id": ids[1], "since": "2024-12-01", "until": "2025-03-02"}).json()
+    assert [row["timestamp"][:10] for row in only] == ["2025-03-01", "2024-12-31"]
+
+    # Rollups rebuilt after archiving still cover the archived periods
+    rebuild_rollups(session)
+    session.commit()
+    assert sales_series(session, "month") == sales_before
+
+    # Restoring a backup from before the archive runs brings the archived rows
+    # back into the hot ledger while the archive files still hold them
+    session.exec(Transaction.__table__.delete())
+    session.execute(Transaction.__table__.insert(), ledger_before)
+    session.commit()
+    responses.clear()
+    assert client.get("/api/history", params={"limit": 500}).json() == full
+    rebuild_rollups(session)
+    session.commit()
+    assert sales_series(session, "month") == sales_before
+    # The next run folds them into the archive again
+    assert archive.archive_ledger(session.get_bind(), datetime(2025, 3, 3))["archived"] == 10
+    assert client.get("/api/history", params={"limit": 500}).json() == full
+
+def test_response_cache_hits_and_invalidation(client, session):
+    from sqlalchemy import event
+    from backend.cache import LRUCache
+
+    ids = [client.post("/api/medicines", json={
+        "medicine_name": "Bryonia", "potency": "200C", "batch_number": batch,
+        "expiry_date": "2030-01-01", "mrp": 20, "quantity": 10
+    }).json()["id"] for batch in ("BR1", "BR2")]
+
+    hits_before = client.get("/api/metrics/cache").json()["hits"]
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        first = client.get("/api/medicines", params={"limit": 1})
+        read_queries = len(statements)
+        statements.clear()
+        second = client.get("/api/medicines", params={"limit": 1})
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", listener)
+    # Only the version check reaches SQLite on a repeat read
+    assert len(statements) == 1 < read_queries
+    assert second.content == first.content
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert second.headers["ETag"] == first.headers["ETag"]
+    stats = client.get("/api/metrics/cache").json()
+    assert stats["hits"] == hits_before + 1 and stats["entries"] == 1
+
+    # A sale committed here drops the cached responses
+    client.post("/api/transaction", json={"medicine_id": ids[0], "change_amount": -3, "action_type": "SELL"})
+    assert client.get("/api/metrics/cache").json()["entries"] == 0
+    assert client.get("/api/medicines", params={"limit": 1}).json()[0]["quantity"] == 7
+
+    # A write from another worker is caught by the version check
+    raw = session.connection().connection.driver_connection
+    raw.execute("UPDATE homeopathicmedicine SET quantity = 99 WHERE id = ?", (ids[0],))
+    raw.execute("UPDATE inventoryversion SET version = version + 1")
+    assert client.get("/api/medicines", params={"limit": 1}).json()[0]["quantity"] == 99
+
+    now = [0.0]
+    lru = LRUCache("test", max_entries=2, max_bytes=10, ttl=5, clock=lambda: now[0])
+    lru.put("a", b"1", 1)
+    lru.put("b", b"2", 1)
+    assert lru.get("a") == b"1"
+    lru.put("c", b"3", 1) # evicts "b", the least recently used
+    assert lru.get("b") is None and lru.get("c") == b"3"
+    lru.put("d", b"0123456789", 10) # over the byte budget with the others
+    assert lru.stats()["entries"] == 1
+    now[0] = 6
+    assert lru.get("d") is None
+    assert {k: lru.stats()[k] for k in ("hits", "evictions", "expirations")} == {"hits": 2, "evictions": 3, "expirations": 1}
+
+def test_branch_stores_are_isolated_and_federated(tmp_path, monkeypatch):
+    import time
+    from backend import stores
+    from backend.events import EventHub
+    from backend.models import create_db_and_tables, make_engines
+
+    main_path = str(tmp_path / "main.db")
+    reader, writer = make_engines(main_path, "test-main", read_pool_size=2)
+    create_db_and_tables(writer)
+    registry = stores.StoreRegistry(
+        str(tmp_path / "stores"), stores.Store("main", main_path, reader, writer, str(tmp_path / "archive"), EventHub())
+    )
+    monkeypatch.setattr(stores, "registry", registry)
+    responses.clear()
+    client = TestClient(app)
+    try:
+        assert client.post("/api/stores", json={"id": "north"}).status_code == 200
+        assert client.post("/api/stores", json={"id": "north"}).status_code == 409
+        assert client.post("/api/stores", json={"id": "../north"}).status_code == 422
+        assert client.post("/api/stores", json={"id": "shop\n"}).status_code == 422
+        assert client.get("/api/medicines", params={"store": "shop\n"}).status_code == 400
+        assert not os.path.exists(tmp_path / "stores" / "shop\n")
+        assert client.get("/api/medicines", params={"store": "south"}).status_code == 404
+        assert [s["id"] for s in client.get("/api/stores").json()["stores"]] == ["main", "north"]
+
+        arnica = {"medicine_name": "Arnica Montana", "potency": "30C", "expiry_date": "2030-01-01", "mrp": 10}
+        client.post("/api/medicines", json={**arnica, "batch_number": "M1", "quantity": 5})
+        north_id = client.post("/api/medicines", json={**arnica, "batch_number": "N1", "quantity": 12},
+                               headers={"X-Store": "north"}).json()["id"]
+        client.post("/api/medicines", json={**arnica, "potency": "200C", "batch_number": "N2", "quantity": 4},
+                    params={"store": "north"})
+
+        main_list = client.get("/api/medicines")
+        north_list = client.get("/api/medicines", params={"store": "north"})
+        assert [m["batch_number"] for m in main_list.json()] == ["M1"]
+        assert sorted(m["batch_number"] for m in north_list.json()) == ["N1", "N2"]
+        assert main_list.headers["ETag"] != north_list.headers["ETag"]
+
+        # A sale in one branch leaves the other (and its cached pages) alone
+        client.post("/api/transaction", json={"medicine_id": north_id, "change_amount": -2, "action_type": "SELL"},
+                    headers={"X-Store": "north"})
+        assert client.get("/api/medicines").json()[0]["quantity"] == 5
+        assert client.get("/api/summary", params={"store": "north"}).json()["total_units"] == 14
+
+        stock = client.get("/api/chain/stock", params={"name": "arnica"}).json()
+        assert stock["errors"] == {}
+        by_potency = {p["potency"]: p for p in stock["products"]}
+        assert by_potency["30C"]["total"] == 15
+        assert {s: v["quantity"] for s, v in by_potency["30C"]["stores"].items()} == {"main": 5, "north": 10}
+        assert by_potency["200C"]["stores"].keys() == {"north"}
+        assert len(client.get("/api/chain/stock", params={"name": " "}).json()["products"]) == 2
+        chain_summary = client.get("/api/chain/summary").json()
+        assert chain_summary["totals"]["total_units"] == 19
+        assert chain_summary["stores"]["north"]["total_skus"] == 2
+
+        # Idle branches are closed and reopen on the next request
+        assert registry.close_idle(now=time.monotonic() + registry.idle_seconds + 1) == ["north"]
+        assert [s["open"] for s in client.get("/api/stores").json()["stores"]] == [True, False]
+        assert len(client.get("/api/medicines", params={"store": "north"}).json()) == 2
+    finally:
+        for store in registry._open.values():
+            store.close()
+
+def test_branch_stores_are_backed_up_and_maintained(tmp_path, monkeypatch):
+    from backend import backups, main, maintenance, stores
+    from backend.events import EventHub
+    from backend.models import create_db_and_tables, make_engines
+
+    main_path = str(tmp_path / "main.db")
+    reader, writer = make_engines(main_path, "test-main", read_pool_size=2)
+    create_db_and_tables(writer)
+    registry = stores.StoreRegistry(
+        str(tmp_path / "stores"), stores.Store("main", main_path, reader, writer, str(tmp_path / "archive"), EventHub())
+    )
+    backup_dir = str(tmp_path / "backups")
+    scheduler = backups.BackupScheduler(main_path, backup_dir, reader, writer, interval_minutes=0, registry=registry)
+    monkeypatch.setattr(stores, "registry", registry)
+    monkeypatch.setattr(main, "backup_scheduler", scheduler)
+    responses.clear()
+    client = TestClient(app)
+    try:
+        client.post("/api/stores", json={"id": "north"})
+        arnica = {"medicine_name": "Arnica Montana", "potency": "30C", "expiry_date": "2030-01-01", "mrp": 10}
+        client.post("/api/medicines", json={**arnica, "batch_number": "M1", "quantity": 5})
+        client.post("/api/medicines", json={**arnica, "batch_number": "N1", "quantity": 12}, params={"store": "north"})
+
+        # The scheduled run covers every store, each into its own folder
+        entries = scheduler.run_all()
+        assert entries.keys() == {"main", "north"} and all(entries.values())
+        assert os.path.isfile(os.path.join(backup_dir, entries["main"]["name"]))
+        assert os.path.isfile(os.path.join(backup_dir, "stores", "north", entries["north"]["name"]))
+        status = client.get("/api/backups").json()["scheduler"]
+        assert status["last_result"] == entries["main"]["name"]
+        assert status["stores"]["north"]["last_result"] == entries["north"]["name"]
+        assert [e["name"] for e in client.get("/api/backups", params={"store": "north"}).json()["backups"]] \
+            == [entries["north"]["name"]]
+
+        client.post("/api/medicines", json={**arnica, "batch_number": "N2", "quantity": 4}, params={"store": "north"})
+        restored = client.post(f"/api/backups/{entries['north']['name']}/restore", params={"store": "north"})
+        assert restored.status_code == 200
+        assert [m["batch_number"] for m in client.get("/api/medicines", params={"store": "north"}).json()] == ["N1"]
+        assert [m["batch_number"] for m in client.get("/api/medicines").json()] == ["M1"]
+
+        # Startup maintenance runs every step for the branch too
+        maintenance.run_startup_maintenance(reader, main_path, backup_dir, writer, registry)
+        task = maintenance.get_status()["tasks"]["branch_stores"]
+        assert task["state"] == "done" and task["progress"] == 1.0
+        assert task["detail"]["north"]["integrity_check"] == "ok"
+        assert task["detail"]["north"]["health_scan"]["total_medicines"] == 1
+    finally:
+        for store in registry._open.values():
+            store.close()
+
+def test_startup_defers_work_until_the_server_is_ready(client, tmp_path):
+    import socket
+    import subprocess
+    from backend import startup
+
+    # Export and browser modules stay out of the import path
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, backend.main; "
+         "print(','.join(m for m in ('backend.csv_io', 'webbrowser') if m in sys.modules))"],
+        cwd=root, env={**os.environ, "HOMEOVAULT_DB_PATH": str(tmp_path / "inventory.db")},
+        stdout=subprocess.PIPE, text=True, check=True,
+    )
+    assert loaded.stdout.strip() == ""
+
+    order = []
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        startup.on_ready(order.append, "browser")
+        startup.defer(order.append, "maintenance")
+        startup.start(server.getsockname()[1], delay=0.05).join(5)
+    assert order == ["browser", "maintenance"]
+
+    stages = [s["stage"] for s in client.get("/api/metrics/startup").json()["stages"]]
+    assert stages[0] == "imports" and "ready" in stages
+
+def test_reorder_suggestions_from_demand_rates(client, session):
+    from datetime import datetime, time as clock
+    from backend import reorder
+    from backend.inventory import apply_stock_change
+    from backend.models import DemandRate
+
+    today = datetime.utcnow().date()
+
+    def medicine(name, batch, manufacturer, quantity=0):
+        return client.post("/api/medicines", json={
+            "medicine_name": name, "potency": "30C", "form": "Dilution", "bottle_size": "30ml",
+            "manufacturer": manufacturer, "batch_number": batch, "expiry_date": "2030-01-01",
+            "mrp": 10, "purchase_price": 5, "quantity": quantity
+        }).json()["id"]
+
+    def sell(medicine_id, days_ago, units, added=0):
+        stamp = datetime.combine(today - timedelta(days=days_ago), clock(12))
+        if added:
+            apply_stock_change(session, Transaction(medicine_id=medicine_id, change_amount=added,
+                                                    action_type="ADD", timestamp=stamp))
+        apply_stock_change(session, Transaction(medicine_id=medicine_id, change_amount=-units,
+                                                action_type="SELL", timestamp=stamp))
+
+    # Arnica: 4 a day for 60 days, alternating between two batches, 10 left
+    arnica = [medicine("Arnica", "A1", "SBL"), medicine("Arnica", "A2", "SBL")]
+    for days_ago in range(60, 0, -1):
+        sell(arnica[days_ago % 2], days_ago, 4, added=125 if days_ago > 58 else 0)
+    # Belladonna sells 1 a day and has plenty; Dormant sold once long ago
+    belladonna = medicine("Belladonna", "B1", "SBL")
+    for days_ago in range(60, 0, -1):
+        sell(belladonna, days_ago, 1, added=300 if days_ago == 60 else 0)
+    sell(medicine("Dormant", "D1", "SBL"), 400, 1, added=1)
+    # Ferrum sells as much, but unevenly (8 every other day)
+    ferrum = medicine("Ferrum", "F1", "Boiron")
+    for days_ago in range(60, 0, -1):
+        sell(ferrum, days_ago, 8 * (days_ago % 2), added=270 if days_ago == 60 else 0)
+    # Echinacea only started selling 5 days ago
+    echinacea = medicine("Echinacea", "E1", "Schwabe")
+    for days_ago in range(5, 0, -1):
+        sell(echinacea, days_ago, 3, added=20 if days_ago == 5 else 0)
+    session.commit()
+    # Calendula never sold: the low-stock threshold (5) decides
+    medicine("Calendula", "C1", "SBL", quantity=2)
+
+    def rates():
+        session.expire_all()
+        return {r.medicine_name: (round(r.mean, 9), round(r.square, 9), round(r.weight, 9), r.through)
+                for r in session.exec(select(DemandRate)).all()}
+
+    # Ten days behind, then caught up incrementally: the same as a full recompute
+    reorder.refresh_demand(session, today=today - timedelta(days=10))
+    session.commit()
+    assert "Echinacea" not in rates()
+    stats = reorder.refresh_demand(session)
+    session.commit()
+    assert (stats["advanced"], stats["added"]) == (4, 1)
+    incremental = rates()
+    assert client.post("/api/reorder/recompute", params={"full": True}).json()["added"] == 5
+    assert rates() == incremental
+    assert not reorder.needs_refresh(session)
+
+    plan = client.get("/api/reorder").json()
+    assert [g["manufacturer"] for g in plan["manufacturers"]] == ["Schwabe", "SBL", "Boiron"]
+    schwabe, sbl, boiron = plan["manufacturers"]
+    assert [i["medicine_name"] for i in sbl["items"]] == ["Arnica", "Calendula"]
+    arnica_item, calendula = sbl["items"]
+    # Steady demand: no safety stock; cover lead time (7) plus 30 days
+    assert (arnica_item["on_hand"], arnica_item["daily_rate"], arnica_item["days_of_cover"]) == (10, 4.0, 2.5)
+    assert arnica_item["order_quantity"] == 4 * 37 - 10
+    assert arnica_item["estimated_cost"] == arnica_item["order_quantity"] * 5
+    assert (calendula["basis"], calendula["order_quantity"]) == ("threshold", 8)
+    assert schwabe["items"][0]["daily_rate"] == 3.0
+    assert sbl["units"] == 138 + 8
+    assert plan["total_units"] == sbl["units"] + schwabe["units"] + boiron["units"]
+
+    # Uneven demand needs safety stock, more of it for a higher service level
+    ferrum_item = boiron["items"][0]
+    assert ferrum_item["on_hand"] == 30 and ferrum_item["daily_spread"] > 3
+    assert ferrum_item["reorder_point"] > 7 * ferrum_item["daily_rate"] + 15
+    strict = client.get("/api/reorder", params={"manufacturer": "Boiron", "service_level": 0.99}).json()
+    assert strict["manufacturers"][0]["items"][0]["safety_stock"] > ferrum_item["safety_stock"]
+    assert client.get("/api/reorder", params={"manufacturer": "Nobody"}).json()["manufacturers"] == []
+
+def test_group_commit_sales_queue(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from backend import metrics, sale_queue, stores
+    from backend.events import EventHub
+    from backend.models import create_db_and_tables, make_engines
+
+    db_path = str(tmp_path / "main.db")
+    reader, writer = make_engines(db_path, "test-group", read_pool_size=2)
+    create_db_and_tables(writer)
+    main = stores.Store("main", db_path, reader, writer, str(tmp_path / "archive"), EventHub())
+    monkeypatch.setattr(stores, "registry", stores.StoreRegistry(str(tmp_path / "stores"), main))
+    monkeypatch.setattr(sale_queue, "GROUP_COMMIT", True)
+    main.sales().window = 0.05 # wide enough that concurrent sales share a batch
+    responses.clear()
+    client = TestClient(app)
+    try:
+        medicine_id = client.post("/api/medicines", json={
+            "medicine_name": "Rush", "potency": "30C", "batch_number": "R1",
+            "expiry_date": "2030-01-01", "mrp": 10, "quantity": 10,
+        }).json()["id"]
+
+        def sell(_):
+            return client.post("/api/transaction", json={
+                "medicine_id": medicine_id, "change_amount": -1, "action_type": "SELL",
+            }).status_code
+
+        # Rejected sales roll back alone; the rest of their batch commits
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(sell, range(25)))
+        assert (statuses.count(200), statuses.count(400)) == (10, 15)
+        history = client.get("/api/history", params={"medicine_id": medicine_id, "limit": 100}).json()
+        assert sum(1 for row in history if row["action_type"] == "SELL") == 10
+        assert client.get("/api/summary").json()["total_units"] == 0
+        *_, units, commits = metrics.GROUP_COMMIT_BATCH._series[("main",)]
+        assert units == 25 and commits < 25
+
+        # FEFO sales go through the queue too, with the same answers
+        client.post("/api/medicines", json={
+            "medicine_name": "Rush", "potency": "30C", "batch_number": "R2",
+            "expiry_date": "2031-01-01", "mrp": 10, "quantity": 3,
+        })
+        sale = {"medicine_name": "Rush", "potency": "30C", "quantity": 2}
+        assert client.post("/api/sell", json=sale).json()["allocations"][0]["batch_number"] == "R2"
+        assert client.post("/api/sell", json=sale).status_code == 400
+        assert client.post("/api/transaction", json={"medicine_id": 999, "change_amount": -1}).status_code == 404
+    finally:
+        main.close()
+        responses.clear()
+
+def test_reorder_ignores_sales_of_deleted_medicines(client, session):
+    from datetime import datetime
+    from backend import reorder
+    from backend.inventory import apply_stock_change
+
+    medicine_id = client.post("/api/medicines", json={
+        "medicine_name": "Gone", "potency": "30C", "batch_number": "G1",
+        "expiry_date": "2030-01-01", "mrp": 10, "quantity": 0,
+    }).json()["id"]
+    stamp = datetime.utcnow() - timedelta(days=3)
+    apply_stock_change(session, Transaction(medicine_id=medicine_id, change_amount=5, action_type="ADD", timestamp=stamp))
+    apply_stock_change(session, Transaction(medicine_id=medicine_id, change_amount=-5, action_type="SELL", timestamp=stamp))
+    session.commit()
+    # The rollup keeps the deleted batch's sales, but they belong to no product
+    assert client.delete(f"/api/medicines/{medicine_id}").status_code == 200
+    assert not reorder.needs_refresh(session)
+    assert client.get("/api/reorder").json()["manufacturers"] == []
+    assert not reorder.needs_refresh(session)